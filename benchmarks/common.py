@@ -0,0 +1,75 @@
+"""Общие помощники бенчмарков: конфиг во временном каталоге, сохранение результатов"""
+import importlib.util
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench_results"
+
+
+def load_config(workdir: Path, **overrides):
+    """
+    Загружает config.example.py как модуль config с путями во workdir
+    Должно вызываться до импорта модулей бота
+    """
+    workdir.mkdir(parents=True, exist_ok=True)
+    spec = importlib.util.spec_from_file_location("config", ROOT / "config.example.py")
+    config = importlib.util.module_from_spec(spec)
+    sys.modules["config"] = config
+    spec.loader.exec_module(config)
+
+    config.BASE_DIR = workdir
+    config.TEMP_DIR = workdir / "temp_files"
+    config.LOG_DIR = workdir / "logs"
+    config.LOG_FILE = config.LOG_DIR / "bot.log"
+    config.DATABASE_PATH = workdir / "archive.db"
+    config.LOG_LEVEL = "WARNING"
+    config.TEMP_DIR.mkdir(exist_ok=True)
+    config.LOG_DIR.mkdir(exist_ok=True)
+
+    for key, value in overrides.items():
+        setattr(config, key, value)
+
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return config
+
+
+def git_revision() -> str:
+    """Короткий хэш текущего коммита (или 'unknown')"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def peak_rss_bytes() -> int:
+    """Пиковый RSS текущего процесса"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def save_results(name: str, results: dict, output: str = None) -> Path:
+    """Сохраняет результаты в JSON: bench_results/<name>-<commit>-<time>.json"""
+    results = {
+        "benchmark": name,
+        "commit": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **results,
+    }
+    if output:
+        path = Path(output)
+    else:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"{name}-{results['commit']}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    return path
@@ -0,0 +1,43 @@
+"""
+Сравнение двух результатов бенчмарка
+
+Пример: python -m benchmarks.compare bench_results/throughput-abc.json bench_results/throughput-def.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    """Разворачивает вложенные числовые поля в плоский словарь a.b.c -> value"""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+
+    old, new = flatten(baseline), flatten(candidate)
+    for key in sorted(old.keys() & new.keys()):
+        if key.startswith("params."):
+            continue
+        before, after = old[key], new[key]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{key:<50} {before:>16.4f} {after:>16.4f} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
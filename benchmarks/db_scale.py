@@ -0,0 +1,290 @@
+"""
+Бенчмарк БД на синтетическом архиве (по умолчанию 1M постов / ~5M вложений)
+
+Пример:
+    python -m benchmarks.db_scale --posts 1000000 --db /tmp/archive_1m.db
+    python -m benchmarks.db_scale --posts 100000 --iterations 200 --concurrency 16
+
+Сгенерированная база переиспользуется, если файл уже существует (--regenerate чтобы пересоздать)
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.common import load_config, peak_rss_bytes, save_results
+
+POST_STATUSES = [
+    ("uploaded", 0.85), ("skipped_deleted", 0.05), ("skipped_size_exceeded", 0.02),
+    ("download_failed", 0.04), ("telegram_failed", 0.03), ("fetched", 0.01),
+]
+ATTACHMENT_STATUSES = [("deleted", 0.9), ("failed", 0.07), ("pending", 0.02), ("downloaded", 0.01)]
+FILE_TYPES = [("image", 0.7), ("video", 0.2), ("gif", 0.1)]
+TEXT_SHARE = 0.4  # Доля текстовых постов без вложений
+
+
+def _pick(rnd: random.Random, choices: list) -> str:
+    values, weights = zip(*choices)
+    return rnd.choices(values, weights)[0]
+
+
+def post_id(index: int) -> str:
+    return f"s{index:07x}"
+
+
+def generate_archive(path: Path, posts: int, attachments_per_post: float,
+                     seed: int = 1, chunk: int = 20_000):
+    """
+    Заполняет базу (схема уже создана Database.init) синтетическими данными:
+    посты со случайным текстом, вложения, сообщения ТГ и по строке stats на событие
+    """
+    rnd = random.Random(seed)
+    now = datetime.now()
+    span = timedelta(days=730)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+
+    attachment_id = 0
+    message_id = 0
+    started = time.perf_counter()
+
+    for offset in range(0, posts, chunk):
+        post_rows, attachment_rows, message_rows, stats_rows = [], [], [], []
+
+        for index in range(offset, min(offset + chunk, posts)):
+            pid = post_id(index)
+            status = _pick(rnd, POST_STATUSES)
+            fetched_at = now - span * (1 - index / posts)
+            content = "lorem ipsum " * rnd.randint(1, 150) if rnd.random() < TEXT_SHARE else ""
+            post_rows.append((
+                pid, f"user_{rnd.randint(0, 50_000)}", f"Synthetic post {index}", content,
+                f"https://reddit.com/r/sub/comments/{pid}/", status, fetched_at, fetched_at, fetched_at,
+            ))
+
+            # Среднее по всем постам ≈ attachments_per_post
+            media_mean = attachments_per_post / (1 - TEXT_SHARE)
+            count = 0 if content else max(1, round(rnd.expovariate(1 / media_mean)))
+            for _ in range(count):
+                attachment_id += 1
+                file_type = _pick(rnd, FILE_TYPES)
+                attachment_rows.append((
+                    attachment_id, pid, f"https://i.redd.it/{pid}_{attachment_id}.jpg", file_type,
+                    rnd.randint(50_000, 50_000_000 if file_type == "video" else 2_000_000),
+                    None, _pick(rnd, ATTACHMENT_STATUSES), fetched_at, fetched_at,
+                ))
+
+            if status == "uploaded":
+                for _ in range(max(1, count)):
+                    message_id += 1
+                    message_rows.append((message_id, pid, -100123456789,
+                                         "media" if count else "text", "sent", fetched_at))
+                stats_rows.append((1, count, rnd.randint(0, 10_000_000), 0, 0, fetched_at))
+            elif status.startswith("skipped"):
+                stats_rows.append((0, 0, 0, 0, 1, fetched_at))
+            elif status != "fetched":
+                stats_rows.append((0, 0, 0, 1, 0, fetched_at))
+
+        conn.executemany(
+            """INSERT INTO posts (reddit_post_id, reddit_user, title, content, source_url, status,
+                                  created_at, updated_at, fetched_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", post_rows)
+        conn.executemany(
+            """INSERT INTO attachments (attachment_id, reddit_post_id, file_url, file_type,
+                                        file_size_bytes, caption, status, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", attachment_rows)
+        conn.executemany(
+            """INSERT INTO telegram_messages (message_id, reddit_post_id, telegram_chat_id,
+                                              message_type, status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""", message_rows)
+        conn.executemany(
+            """INSERT INTO stats (posts_uploaded, files_uploaded, bytes_uploaded,
+                                  posts_failed, posts_skipped, recorded_at)
+               VALUES (?, ?, ?, ?, ?, ?)""", stats_rows)
+        conn.commit()
+        print(f"  generated {min(offset + chunk, posts)}/{posts} posts "
+              f"({time.perf_counter() - started:.0f}s)", flush=True)
+
+    conn.close()
+    return {"posts": posts, "attachments": attachment_id, "telegram_messages": message_id}
+
+
+def table_counts(path: Path) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("posts", "attachments", "telegram_messages", "stats")}
+    finally:
+        conn.close()
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    }
+
+
+class Workload:
+    """Набор вызовов каждого метода Database с реалистичными аргументами"""
+
+    def __init__(self, db, posts: int, attachments: int, seed: int = 2):
+        self.db = db
+        self.posts = posts
+        self.attachments = attachments
+        self.rnd = random.Random(seed)
+        self.new_posts = 0
+        self.new_messages = 0
+
+    def existing_post(self) -> str:
+        return post_id(self.rnd.randrange(self.posts))
+
+    def existing_attachment(self) -> int:
+        return self.rnd.randint(1, max(1, self.attachments))
+
+    def fresh_post(self) -> str:
+        self.new_posts += 1
+        return f"n{self.new_posts:07x}"
+
+    def fresh_message(self) -> int:
+        self.new_messages += 1
+        return 10 ** 12 + self.new_messages
+
+    def calls(self) -> dict:
+        """Имя операции -> фабрика корутины одного вызова"""
+        db = self.db
+        return {
+            "get_post(hit)": lambda: db.get_post(self.existing_post()),
+            "get_post(miss/dedup)": lambda: db.get_post(f"x{self.rnd.getrandbits(40):x}"),
+            "add_post": lambda: db.add_post(self.fresh_post(), "bench", "title", "text", "url"),
+            "update_post_status": lambda: db.update_post_status(self.existing_post(), "uploaded"),
+            "add_attachment": lambda: db.add_attachment(self.existing_post(), "url", "image", 1000),
+            "get_attachment": lambda: db.get_attachment(self.existing_attachment()),
+            "get_attachments_by_post": lambda: db.get_attachments_by_post(self.existing_post()),
+            "get_attachments_by_post(status)": lambda: db.get_attachments_by_post(
+                self.existing_post(), status="uploaded"),
+            "update_attachment_status": lambda: db.update_attachment_status(
+                self.existing_attachment(), "deleted"),
+            "update_attachment_retry": lambda: db.update_attachment_retry(self.existing_attachment(), 1),
+            "get_disk_usage": lambda: db.get_disk_usage(),
+            "update_disk_usage": lambda: db.update_disk_usage(0),
+            "add_telegram_message": lambda: db.add_telegram_message(
+                self.fresh_message(), self.existing_post(), -100123456789, "media"),
+            "record_stats": lambda: db.record_stats(posts_uploaded=1),
+            "get_stats(today)": lambda: db.get_stats("today"),
+            "get_stats(week)": lambda: db.get_stats("week"),
+            "get_stats(month)": lambda: db.get_stats("month"),
+            "get_stats(all)": lambda: db.get_stats(None),
+        }
+
+
+async def run_single(factory, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await factory()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def run_concurrent(factory, iterations: int, concurrency: int) -> dict:
+    """iterations вызовов, не более concurrency одновременно; латентность и ops/s"""
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await factory()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    elapsed = time.perf_counter() - started
+    return {**summarize(samples), "ops_per_s": iterations / elapsed}
+
+
+async def run_suite(db, counts: dict, iterations: int, concurrency: int, only: list = None) -> dict:
+    workload = Workload(db, counts["posts"], counts["attachments"])
+    results = {}
+
+    started = time.perf_counter()
+    await db.init()
+    results["init"] = {"single": {"count": 1, "mean_ms": (time.perf_counter() - started) * 1000}}
+
+    for name, factory in workload.calls().items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        # get_stats(all) на большом архиве медленный — меньше итераций
+        count = max(3, iterations // 20) if name.startswith("get_stats") else iterations
+        results[name] = {
+            "single": await run_single(factory, count),
+            "concurrent": await run_concurrent(factory, count, concurrency),
+        }
+        print(f"  {name:<34} p50 {results[name]['single']['p50_ms']:8.2f} ms   "
+              f"{results[name]['concurrent']['ops_per_s']:8.0f} ops/s @{concurrency}", flush=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк Database на синтетическом архиве")
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--attachments-per-post", type=float, default=5.0)
+    parser.add_argument("--db", help="Путь к базе (по умолчанию во временном каталоге)")
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="*", help="Подстроки имён операций")
+    parser.add_argument("--output", help="Путь к JSON с результатом")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_db_"))
+    db_path = Path(args.db) if args.db else workdir / "archive.db"
+    load_config(workdir, DATABASE_PATH=db_path)
+
+    from modules.database import db
+
+    # Бенчмарк меняет базу — работаем на копии, исходник переиспользуется между запусками
+    generated = db_path.exists() and not args.regenerate
+    if not generated:
+        db_path.unlink(missing_ok=True)
+        asyncio.run(db.init())
+        print(f"Generating synthetic archive in {db_path}...")
+        generate_archive(db_path, args.posts, args.attachments_per_post)
+
+    work_path = workdir / "work.db"
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(work_path)
+    source.backup(target)
+    source.close()
+    target.close()
+    db.db_path = work_path
+
+    counts = table_counts(work_path)
+    print(f"Archive: {json.dumps(counts)}, {db_path.stat().st_size / 1024 ** 2:.0f} MB")
+
+    results = asyncio.run(run_suite(db, counts, args.iterations, args.concurrency, args.only))
+    work_path.unlink(missing_ok=True)
+
+    path = save_results("db_scale", {
+        "params": vars(args),
+        "archive": {**counts, "size_bytes": db_path.stat().st_size},
+        "operations": results,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }, args.output)
+    print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""
+Локальные заглушки Reddit API, CDN с медиа и Telegram Bot API для бенчмарков
+
+Запуск отдельно: python -m benchmarks.fake_services --posts 200
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import time
+from aiohttp import web
+
+# Профиль по умолчанию; любое поле можно переопределить
+DEFAULT_PROFILE = {
+    "seed": 1,
+    "posts": 100,
+    "username": "bench_user",
+    # Доли типов постов
+    "mix": {"text": 0.3, "image": 0.4, "gallery": 0.15, "video": 0.15},
+    "gallery_size": [2, 6],
+    # Диапазоны размеров медиа в байтах
+    "sizes": {"image": [50_000, 500_000], "video": [1_000_000, 8_000_000]},
+    "text_length": [200, 3000],
+    "reddit_latency": 0.05,
+    "cdn_latency": 0.02,
+    "cdn_failure_rate": 0.0,
+    "cdn_bandwidth": None,        # байт/с на одно соединение, None — без ограничения
+    "cdn_range": True,            # поддержка заголовка Range
+    "cdn_capacity": None,         # параллельных запросов, сверх — 429; None — без ограничения
+    "telegram_latency": 0.05,
+    "telegram_429_rate": 0.0,
+    "telegram_retry_after": 1,
+    "telegram_upload_limit": 50 * 1024 * 1024,  # облачный Bot API: файлы больше — 413
+    # Отказы (benchmarks.faults)
+    "cdn_hang_rate": 0.0,         # доля запросов, на которые CDN молчит cdn_hang_seconds
+    "cdn_hang_seconds": 5,
+    "cdn_truncate_rate": 0.0,     # доля ответов, оборванных на середине тела
+    "cdn_outage": None,           # [период, длительность] сек: окна, когда CDN отвечает 503
+    "telegram_outage": None,      # то же для Bot API (502)
+}
+
+# Каждый файл CDN начинается с маркера и своего имени — заглушка ТГ узнаёт, какой файл ей прислали
+MEDIA_MARKER = b"FAKEMEDIA:"
+
+_BLOCK = random.Random(0).randbytes(1024 * 1024)
+
+
+def media_bytes(name: str, offset: int, length: int) -> bytes:
+    """Кусок содержимого файла CDN: маркер с именем, дальше — псевдослучайные байты"""
+    header = MEDIA_MARKER + name.encode() + b"\n"
+    chunk = header[offset:offset + length]
+    offset += len(chunk)
+    if len(chunk) < length:
+        block_start = (offset - len(header)) % len(_BLOCK)
+        chunk += _BLOCK[block_start:block_start + length - len(chunk)]
+    return chunk
+
+
+def media_name(head: bytes):
+    """Имя файла CDN по его первым байтам (None — не файл заглушки)"""
+    if not head.startswith(MEDIA_MARKER):
+        return None
+    return head[len(MEDIA_MARKER):].split(b"\n", 1)[0].decode(errors="replace")
+
+
+def _base36(number: int) -> str:
+    alphabet = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        number, rem = divmod(number, 36)
+        result = alphabet[rem] + result
+        if not number:
+            return result
+
+
+class FakeState:
+    """Общее состояние заглушек: профиль, сгенерированные посты и счётчики"""
+
+    def __init__(self, profile: dict):
+        self.profile = {**DEFAULT_PROFILE, **profile}
+        self.cdn_url = None
+        self.posts = []
+        self.media_sizes = {}
+        self.stats = {
+            "reddit_requests": 0,
+            "cdn_requests": 0,
+            "cdn_failures": 0,
+            "cdn_429": 0,
+            "cdn_active": 0,
+            "cdn_peak_active": 0,
+            "cdn_bytes": 0,
+            "cdn_hangs": 0,
+            "cdn_truncated": 0,
+            "telegram_5xx": 0,
+            "telegram_requests": 0,
+            "telegram_429": 0,
+            "telegram_bytes": 0,
+            # Свой сервер Bot API (--local): запросы и файлы, переданные путём file://
+            "telegram_local_requests": 0,
+            "telegram_local_file_uris": 0,
+            "telegram_local_bytes": 0,
+            # Первый запрос ленты, сек от запуска заглушек (None — ленту ещё не читали)
+            "first_listing_at": None,
+        }
+        # Что «увидел» канал: список доставок (метод, chat_id, message_ids, текст, имена файлов,
+        # at — сек от запуска заглушек)
+        self.deliveries = []
+        self.message_id = 0
+        self.started = time.monotonic()
+
+    def in_outage(self, window) -> bool:
+        """Сейчас окно отказа [период, длительность]: отсчёт от первого запроса ленты,
+        окно — в конце каждого периода, чтобы отказы приходились на работу пайплайна, а не на запуск бота"""
+        first = self.stats["first_listing_at"]
+        if not window or first is None:
+            return False
+        every, length = window
+        return (time.monotonic() - self.started - first) % every >= every - length
+
+    def generate_posts(self):
+        """Детерминированно генерирует ленту лайков по профилю"""
+        rnd = random.Random(self.profile["seed"])
+        mix = self.profile["mix"]
+        kinds, weights = list(mix), list(mix.values())
+        now = int(time.time())
+        self.posts = []
+
+        for index in range(self.profile["posts"]):
+            post_id = "b" + _base36(index)
+            kind = rnd.choices(kinds, weights)[0]
+            data = {
+                "id": post_id,
+                "name": f"t3_{post_id}",
+                "title": f"Benchmark post {index}",
+                "author": f"author_{index % 50}",
+                "subreddit": "bench",
+                "selftext": "",
+                "url": f"https://reddit.com/r/bench/comments/{post_id}/",
+                "permalink": f"/r/bench/comments/{post_id}/benchmark_post_{index}/",
+                "created_utc": now - index * 60,
+                "removed_by_category": None,
+                "media": None,
+                "is_video": False,
+                "is_gallery": False,
+                "gallery_data": None,
+                "media_metadata": None,
+            }
+
+            if kind == "text":
+                length = rnd.randint(*self.profile["text_length"])
+                data["selftext"] = ("lorem ipsum dolor sit amet " * (length // 27 + 1))[:length]
+            elif kind == "image":
+                data["url"] = self._media_url(f"{post_id}_0.jpg", "image", rnd)
+                width, height = self._dimensions(post_id)
+                previews = self._previews(f"{post_id}_0", ".jpg", width, height)
+                data["preview"] = {"images": [{
+                    "source": {"url": data["url"], "width": width, "height": height},
+                    "resolutions": [{"url": url, "width": x, "height": y} for x, y, url in previews],
+                }]}
+            elif kind == "video":
+                # Как v.redd.it: fallback — DASH_<высота>.mp4, ниже — варианты меньших высот
+                height = 1080 if self._dimensions(post_id)[0] > 1500 else 720
+                fallback_url = self._media_url(f"{post_id}_DASH_{height}.mp4", "video", rnd)
+                size = self.media_sizes[f"{post_id}_DASH_{height}.mp4"]
+                for variant in (720, 480, 360, 240):
+                    if variant < height:
+                        self.media_sizes[f"{post_id}_DASH_{variant}.mp4"] = int(size * (variant / height) ** 2)
+                data["is_video"] = True
+                data["media"] = {"reddit_video": {
+                    "fallback_url": fallback_url,
+                    "height": height,
+                    "width": height * 16 // 9,
+                    "duration": 30,
+                    "bitrate_kbps": size * 8 // 1000 // 30,
+                }}
+            else:
+                count = rnd.randint(*self.profile["gallery_size"])
+                items, metadata = [], {}
+                for item in range(count):
+                    media_id = f"{post_id}m{item}"
+                    items.append({"media_id": media_id, "id": item})
+                    url = self._media_url(f"{media_id}.jpg", "image", rnd)
+                    width, height = self._dimensions(media_id)
+                    metadata[media_id] = {
+                        "status": "valid",
+                        "e": "Image",
+                        "m": "image/jpg",
+                        "s": {"x": width, "y": height, "u": url},
+                        "p": [{"x": x, "y": y, "u": preview_url}
+                              for x, y, preview_url in self._previews(media_id, ".jpg", width, height)],
+                    }
+                data["is_gallery"] = True
+                data["gallery_data"] = {"items": items}
+                data["media_metadata"] = metadata
+
+            self.posts.append(data)
+
+    def _dimensions(self, key: str) -> tuple[int, int]:
+        """Размер исходника (отдельный генератор, чтобы не сдвигать последовательность постов)"""
+        rnd = random.Random(f"{self.profile['seed']}-{key}")
+        width = rnd.choice([1080, 1920, 3024, 4032])
+        return width, width * 3 // 4
+
+    def _previews(self, stem: str, extension: str, width: int, height: int) -> list:
+        """Превью как у preview.redd.it: (ширина, высота, url), размер файла — по площади"""
+        size = self.media_sizes[f"{stem}{extension}"]
+        previews = []
+        for preview_width in (108, 216, 320, 640, 960, 1080):
+            if preview_width >= width:
+                break
+            name = f"{stem}_{preview_width}{extension}"
+            self.media_sizes[name] = max(1000, int(size * (preview_width / width) ** 2))
+            previews.append((preview_width, height * preview_width // width, f"{self.cdn_url}/media/{name}"))
+        return previews
+
+    def _media_url(self, name: str, kind: str, rnd: random.Random) -> str:
+        self.media_sizes[name] = rnd.randint(*self.profile["sizes"][kind])
+        return f"{self.cdn_url}/media/{name}"
+
+    def next_message_id(self) -> int:
+        self.message_id += 1
+        return self.message_id
+
+
+# ===== REDDIT =====
+def reddit_app(state: FakeState) -> web.Application:
+    async def access_token(request):
+        return web.json_response({
+            "access_token": "bench-token", "token_type": "bearer",
+            "expires_in": 86400, "scope": "*",
+        })
+
+    def ratelimit_headers() -> dict:
+        # Как у Реддита: 1000 запросов на окно в 600 секунд
+        window = 600
+        used = state.stats["reddit_requests"] % 1000
+        return {
+            "x-ratelimit-used": str(used),
+            "x-ratelimit-remaining": str(1000 - used),
+            "x-ratelimit-reset": str(int(window - time.time() % window)),
+        }
+
+    async def me(request):
+        state.stats["reddit_requests"] += 1
+        return web.json_response({"name": state.profile["username"], "id": "bench"},
+                                 headers=ratelimit_headers())
+
+    async def listing(request):
+        state.stats["reddit_requests"] += 1
+        if state.stats["first_listing_at"] is None:
+            state.stats["first_listing_at"] = time.monotonic() - state.started
+        await asyncio.sleep(state.profile["reddit_latency"])
+
+        limit = min(int(request.query.get("limit", 25)), 100)
+        after = request.query.get("after")
+        start = 0
+        if after:
+            names = [post["name"] for post in state.posts]
+            start = names.index(after) + 1 if after in names else len(names)
+
+        page = state.posts[start:start + limit]
+        next_after = page[-1]["name"] if page and start + limit < len(state.posts) else None
+        return web.json_response({"kind": "Listing", "data": {
+            "after": next_after, "before": None, "dist": len(page),
+            "children": [{"kind": "t3", "data": post} for post in page],
+        }}, headers=ratelimit_headers())
+
+    app = web.Application()
+    app.router.add_post("/api/v1/access_token", access_token)
+    app.router.add_get("/api/v1/me", me)
+    app.router.add_get("/user/{name}/{kind:(upvoted|saved)}/", listing)
+    app.router.add_get("/user/{name}/{kind:(upvoted|saved)}", listing)
+    return app
+
+
+# ===== CDN =====
+def cdn_app(state: FakeState) -> web.Application:
+    async def media(request):
+        state.stats["cdn_requests"] += 1
+        profile = state.profile
+
+        capacity = profile["cdn_capacity"]
+        if capacity and state.stats["cdn_active"] >= capacity:
+            state.stats["cdn_429"] += 1
+            return web.Response(status=429)
+
+        state.stats["cdn_active"] += 1
+        state.stats["cdn_peak_active"] = max(state.stats["cdn_peak_active"], state.stats["cdn_active"])
+        try:
+            return await serve_media(request, profile)
+        finally:
+            state.stats["cdn_active"] -= 1
+
+    async def serve_media(request, profile):
+        await asyncio.sleep(profile["cdn_latency"])
+
+        name = request.match_info["name"]
+        size = state.media_sizes.get(name)
+        if size is None:
+            return web.Response(status=404)
+
+        if random.random() < profile["cdn_failure_rate"] or state.in_outage(profile["cdn_outage"]):
+            state.stats["cdn_failures"] += 1
+            return web.Response(status=503)
+
+        if random.random() < profile["cdn_hang_rate"]:
+            state.stats["cdn_hangs"] += 1
+            await asyncio.sleep(profile["cdn_hang_seconds"])
+            if request.transport is None or request.transport.is_closing():
+                # Клиент не дождался (таймаут чтения) — отвечать некому
+                return web.Response(status=408)
+
+        start, end, status = 0, size - 1, 200
+        range_header = request.headers.get("Range")
+        if range_header and profile["cdn_range"]:
+            match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else size - 1
+                if start >= size:
+                    return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+                end = min(end, size - 1)
+                status = 206
+
+        headers = {"Content-Length": str(end - start + 1), "Accept-Ranges": "bytes"}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+
+        bandwidth = profile["cdn_bandwidth"]
+        # Обрыв: отдаём половину заявленного Content-Length и закрываем соединение
+        cut_at = start + (end - start + 1) // 2 if random.random() < profile["cdn_truncate_rate"] else None
+        offset = start
+        while offset <= end:
+            if cut_at is not None and offset >= cut_at:
+                state.stats["cdn_truncated"] += 1
+                request.transport.close()
+                return response
+            chunk = media_bytes(name, offset, min(65536, end - offset + 1))
+            try:
+                await response.write(chunk)
+            except ConnectionError:
+                # Клиент ушёл посреди тела (таймаут, остановка бота)
+                return response
+            state.stats["cdn_bytes"] += len(chunk)
+            offset += len(chunk)
+            if bandwidth:
+                await asyncio.sleep(len(chunk) / bandwidth)
+
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/media/{name}", media)
+    return app
+
+
+# ===== TELEGRAM =====
+def telegram_app(state: FakeState, local: bool = False) -> web.Application:
+    """Bot API; local — свой сервер в режиме --local: без лимита 50 MB, принимает пути file://"""
+    prefix = "telegram_local" if local else "telegram"
+
+    async def read_fields(request) -> dict:
+        fields = {}
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    size = 0
+                    while chunk := await part.read_chunk():
+                        if not size:
+                            fields.setdefault("_files", []).append(media_name(chunk))
+                        size += len(chunk)
+                    state.stats[f"{prefix}_bytes"] += size
+                    fields.setdefault("_largest_file", 0)
+                    fields["_largest_file"] = max(fields["_largest_file"], size)
+                else:
+                    fields[part.name] = await part.text()
+        elif request.content_type == "application/json":
+            fields = await request.json()
+        else:
+            fields = dict(await request.post())
+        return fields
+
+    def message(chat_id) -> dict:
+        return {
+            "message_id": state.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "channel"},
+        }
+
+    def read_local_files(media: list, files: list):
+        # Сервер --local читает файлы с диска сам; чужие схемы (attach://, file_id) пропускаем
+        for item in media:
+            uri = item.get("media", "")
+            if uri.startswith("file://"):
+                path = uri.removeprefix("file://")
+                state.stats["telegram_local_file_uris"] += 1
+                state.stats["telegram_local_bytes"] += os.path.getsize(path)
+                with open(path, "rb") as f:
+                    files.append(media_name(f.read(256)))
+
+    async def method(request):
+        state.stats[f"{prefix}_requests"] += 1
+        profile = state.profile
+        api_method = request.match_info["method"]
+        try:
+            fields = await read_fields(request)
+        except ConnectionError:
+            # Бота убили посреди загрузки (профиль kill) — отвечать уже некому
+            return web.Response(status=400)
+        await asyncio.sleep(profile["telegram_latency"])
+
+        if not local and fields.get("_largest_file", 0) > profile["telegram_upload_limit"]:
+            return web.json_response({
+                "ok": False, "error_code": 413, "description": "Request Entity Too Large",
+            }, status=413)
+
+        if api_method in ("getMe", "deleteWebhook", "getUpdates", "close"):
+            result = {"getMe": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"},
+                      "getUpdates": []}.get(api_method, True)
+            return web.json_response({"ok": True, "result": result})
+
+        if state.in_outage(profile["telegram_outage"]):
+            state.stats["telegram_5xx"] += 1
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"},
+                                     status=502)
+
+        if random.random() < profile["telegram_429_rate"]:
+            state.stats["telegram_429"] += 1
+            retry_after = profile["telegram_retry_after"]
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status=429)
+
+        chat_id = fields.get("chat_id", 0)
+        files = fields.get("_files", [])
+        if api_method == "sendMediaGroup":
+            media = json.loads(fields.get("media", "[]"))
+            if local:
+                read_local_files(media, files)
+            result = [message(chat_id) for _ in media]
+            text = " ".join(item.get("caption") or "" for item in media)
+        elif api_method == "copyMessages":
+            source_ids = fields.get("message_ids", "[]")
+            source_ids = json.loads(source_ids) if isinstance(source_ids, str) else source_ids
+            result = [{"message_id": message(chat_id)["message_id"]} for _ in source_ids]
+            text = ""
+        else:
+            result = message(chat_id)
+            text = fields.get("text") or fields.get("caption") or ""
+
+        message_ids = [msg["message_id"] for msg in (result if isinstance(result, list) else [result])]
+        state.deliveries.append({
+            "method": api_method, "chat_id": chat_id, "message_ids": message_ids, "text": text,
+            "server": prefix, "files": [name for name in files if name],
+            "at": time.monotonic() - state.started,
+        })
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application(client_max_size=4 * 1024 ** 3)
+    app.router.add_post("/bot{token}/{method}", method)
+    return app
+
+
+# ===== УПРАВЛЕНИЕ =====
+def control_app(state: FakeState) -> web.Application:
+    async def get_stats(request):
+        return web.json_response({**state.stats, "deliveries": state.deliveries})
+
+    async def set_profile(request):
+        state.profile.update(await request.json())
+        return web.json_response(state.profile)
+
+    app = web.Application()
+    app.router.add_get("/stats", get_stats)
+    app.router.add_post("/profile", set_profile)
+    return app
+
+
+async def start_services(profile: dict, host: str = "127.0.0.1") -> tuple[FakeState, dict, list]:
+    """Поднимает все заглушки на свободных портах, возвращает (state, urls, runners)"""
+    state = FakeState(profile)
+    urls, runners = {}, []
+
+    services = (
+        ("reddit", reddit_app), ("cdn", cdn_app), ("telegram", telegram_app),
+        ("telegram_local", lambda state: telegram_app(state, local=True)), ("control", control_app),
+    )
+    for name, factory in services:
+        runner = web.AppRunner(factory(state), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        urls[name] = f"http://{host}:{port}"
+        runners.append(runner)
+
+    state.cdn_url = urls["cdn"]
+    state.generate_posts()
+    return state, urls, runners
+
+
+def _serve(profile: dict, conn):
+    async def run():
+        _, urls, runners = await start_services(profile)
+        conn.send(urls)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def run_in_process(profile: dict) -> tuple[multiprocessing.Process, dict]:
+    """Запускает заглушки в отдельном процессе, чтобы они не делили event loop с ботом"""
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(profile, child_conn), daemon=True)
+    process.start()
+    urls = parent_conn.recv()
+    return process, urls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушки Reddit/CDN/Telegram для бенчмарков")
+    parser.add_argument("--posts", type=int, default=DEFAULT_PROFILE["posts"])
+    parser.add_argument("--profile", help="JSON-файл с переопределениями профиля")
+    args = parser.parse_args()
+
+    overrides = {"posts": args.posts}
+    if args.profile:
+        with open(args.profile) as f:
+            overrides.update(json.load(f))
+
+    process, service_urls = run_in_process(overrides)
+    print(json.dumps(service_urls, indent=2))
+    process.join()
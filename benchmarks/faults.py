@@ -0,0 +1,347 @@
+"""
+Нагрузочный прогон с отказами: пайплайн против заглушек, которые молчат (таймауты),
+обрывают ответы, отвечают 429 с Retry-After и 5xx пачками, при нехватке диска и при убийстве процесса
+
+Каждый профиль — --repeat прогонов бота (python main.py в дочернем процессе) на свежей базе
+до обработки всей ленты. Проверяется, что ни один пост не потерян (всё доставлено или
+помечено ошибкой) и ничего не доставлено в канал дважды; пропускная способность (медиана
+прогонов и разброс) сравнивается с прогоном без отказов. Время прогона считают заглушки:
+от первого запроса ленты до последней доставки в канал — запуск и остановка процесса не входят
+
+Пример: python -m benchmarks.faults --posts 60 --repeat 5 --profiles baseline truncated kill
+Код выхода 1 — есть потерянные или задвоенные посты
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.common import ROOT, load_config, save_results
+from benchmarks.fake_services import DEFAULT_PROFILE, run_in_process
+
+# Профиль: переопределения заглушек (services), конфига бота (config)
+# и убийство процесса бота SIGKILL через kill_every ± 50% секунд (не больше max_kills раз)
+PROFILES = {
+    "baseline": {},
+    "timeouts": {
+        "services": {"cdn_hang_rate": 0.1, "cdn_hang_seconds": 5},
+        "config": {"DOWNLOAD_READ_TIMEOUT": 1.5},
+    },
+    "truncated": {"services": {"cdn_truncate_rate": 0.15}},
+    "telegram_429": {"services": {"telegram_429_rate": 0.2, "telegram_retry_after": 1}},
+    "5xx_bursts": {"services": {"cdn_outage": [2, 0.5], "telegram_outage": [3, 1]}},
+    "disk_full": {"config": {"MAX_DISK_USAGE_BYTES": 12 * 1024 * 1024}},
+    "kill": {"kill_every": 6, "max_kills": 4},
+}
+
+# Конфиг бота для всех профилей: быстрые повторы и проба хоста, чтобы прогон шёл секунды
+BASE_CONFIG = {
+    "TELEGRAM_CHANNEL_ID": -100123456789,
+    "TELEGRAM_CHAT_INTERVAL": 0,
+    "THREAD_COUNT": 4,
+    "RETRY_CONFIG": {"max_retries": 8, "alert_after_retry": 5, "initial_delay": 0.2, "backoff_multiplier": 1.5},
+    "BREAKER_RESET_TIMEOUT": 2,
+    "SHUTDOWN_GRACE_SECONDS": 5,
+}
+
+# Статусы поста, после которых бот к нему не возвращается
+FAILED_STATUSES = {"skipped_deleted", "skipped_size_exceeded", "download_failed", "telegram_failed", "failed"}
+UNFINISHED_STATUSES = {"fetched", "downloaded"}
+
+PERMALINK = re.compile(r"/comments/(\w+)/")
+
+
+def fetch_json(url: str) -> dict:
+    with urllib.request.urlopen(url) as resp:
+        return json.loads(resp.read())
+
+
+# ===== ДОЧЕРНИЙ ПРОЦЕСС: бот =====
+async def _watch_done(expected: int):
+    """Останавливает бота, когда все посты ленты дошли до конечного статуса и очередь пуста"""
+    import main
+    from modules.database import db
+    from modules.shutdown import shutdown
+    from modules.status import pipeline
+
+    while True:
+        await asyncio.sleep(0.5)
+        if (pipeline.queue is None or pipeline.queue.qsize() or pipeline.in_flight()
+                or main.app_state.parked_tasks or main.app_state.parked):
+            continue
+        statuses = await post_statuses(db.db_path)
+        if sum(statuses.values()) >= expected and not UNFINISHED_STATUSES & set(statuses):
+            shutdown.request("Fault run finished")
+            return
+
+
+async def _run_child(expected: int):
+    import main
+
+    watcher = asyncio.create_task(_watch_done(expected))
+    await main.main()
+    watcher.cancel()
+
+
+def child(workdir: str, overrides: str, expected: int):
+    load_config(Path(workdir), **json.loads(overrides))
+    asyncio.run(_run_child(expected))
+
+
+# ===== РОДИТЕЛЬ: прогоны и проверки =====
+async def post_statuses(db_path: Path) -> dict:
+    import aiosqlite
+
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute("SELECT status, COUNT(*) FROM posts GROUP BY status")
+        return dict(await cursor.fetchall())
+
+
+async def read_archive(db_path: Path) -> tuple[dict, dict]:
+    """({пост: статус}, {имя файла CDN: пост}) из базы прогона"""
+    import aiosqlite
+
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute("SELECT reddit_post_id, status FROM posts")
+        posts = dict(await cursor.fetchall())
+        cursor = await conn.execute("SELECT file_url, reddit_post_id FROM attachments")
+        files = {url.rsplit("/", 1)[-1]: post_id for url, post_id in await cursor.fetchall()}
+    return posts, files
+
+
+def count_deliveries(deliveries: list, channel_id: int) -> Counter:
+    """Сколько раз канал получил каждый файл (по имени) и каждый текст (по посту)"""
+    counts = Counter()
+    for delivery in deliveries:
+        if str(delivery["chat_id"]) != str(channel_id):
+            continue  # Алерты админу
+        if delivery["files"]:
+            counts.update(("file", name) for name in delivery["files"])
+        else:
+            counts.update(("text", post_id) for post_id in set(PERMALINK.findall(delivery["text"])))
+    return counts
+
+
+def pipeline_seconds(stats: dict, channel_id: int):
+    """От первого запроса ленты до последней доставки в канал по часам заглушек (None — не было)"""
+    delivered = [delivery["at"] for delivery in stats["deliveries"] if str(delivery["chat_id"]) == str(channel_id)]
+    if not delivered or stats["first_listing_at"] is None:
+        return None
+    return max(delivered) - stats["first_listing_at"]
+
+
+def run_profile(name: str, profile: dict, posts: int, timeout: float, seed: int, attempt: int = 0) -> dict:
+    """
+    Один прогон: свои заглушки и база, бот в дочернем процессе (с перезапусками после SIGKILL)
+    attempt — номер повтора: лента та же (seed), моменты убийства процесса — свои
+    """
+    services = {"posts": posts, "seed": seed, **profile.get("services", {})}
+    process, urls = run_in_process(services)
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_faults_{name}_"))
+    overrides = {
+        **BASE_CONFIG,
+        "REDDIT_API_URL": urls["reddit"],
+        "REDDIT_USERNAME": DEFAULT_PROFILE["username"],
+        "REDDIT_PASSWORD": "bench",
+        "TELEGRAM_API_URL": urls["telegram"],
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        **profile.get("config", {}),
+    }
+    command = [sys.executable, "-m", "benchmarks.faults", "--child", str(workdir),
+               json.dumps(overrides), str(posts)]
+    rnd = random.Random(seed + attempt)
+    kills, crashes = 0, 0
+
+    started = time.monotonic()
+    try:
+        while True:
+            bot = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            wait = None
+            if profile.get("kill_every") and kills < profile.get("max_kills", 3):
+                wait = profile["kill_every"] * rnd.uniform(0.5, 1.5)
+            try:
+                _, stderr = bot.communicate(timeout=wait or max(1.0, timeout - (time.monotonic() - started)))
+            except subprocess.TimeoutExpired:
+                if wait is None:
+                    bot.kill()
+                    bot.communicate()
+                    raise TimeoutError(f"{name}: pipeline did not finish in {timeout:.0f}s")
+                bot.send_signal(signal.SIGKILL)
+                bot.communicate()
+                kills += 1
+                continue
+            crashes += stderr.count(b"Traceback")
+            if bot.returncode != 0:
+                raise RuntimeError(f"{name}: bot exited with {bot.returncode}:\n{stderr.decode()[-2000:]}")
+            break
+        wall = time.monotonic() - started
+        stats = fetch_json(f"{urls['control']}/stats")
+    finally:
+        process.terminate()
+
+    statuses = asyncio.run(post_statuses(workdir / "archive.db"))
+    archive, files = asyncio.run(read_archive(workdir / "archive.db"))
+
+    elapsed = pipeline_seconds(stats, overrides["TELEGRAM_CHANNEL_ID"])
+    return {
+        "elapsed_s": elapsed if elapsed is not None else wall,
+        "wall_s": wall,
+        "kills": kills,
+        "tracebacks": crashes,
+        "post_statuses": statuses,
+        "archive": archive,
+        "files": files,
+        "deliveries": count_deliveries(stats.pop("deliveries"), overrides["TELEGRAM_CHANNEL_ID"]),
+        "services": stats,
+        "feed": posts,
+    }
+
+
+def check(run: dict, baseline: dict) -> dict:
+    """Потери и дубли относительно прогона без отказов"""
+    archive = run["archive"]
+    unfinished = [post_id for post_id, status in archive.items() if status in UNFINISHED_STATUSES]
+    missing_posts = run["feed"] - len(archive)
+    failed = {post_id for post_id, status in archive.items() if status in FAILED_STATUSES}
+
+    def owner(key) -> str:
+        kind, value = key
+        return run["files"].get(value) or baseline["files"].get(value) if kind == "file" else value
+
+    duplicated, lost = [], []
+    for key in set(run["deliveries"]) | set(baseline["deliveries"]):
+        extra = run["deliveries"][key] - baseline["deliveries"][key]
+        if extra > 0:
+            duplicated.append(key)
+        elif extra < 0 and owner(key) not in failed:
+            # Недоставленное у поста, который бот считает доставленным
+            lost.append(key)
+
+    uploaded = run["post_statuses"].get("uploaded", 0)
+    return {
+        "uploaded": uploaded,
+        "failed_posts": len(failed),
+        "lost_posts": missing_posts + len(unfinished),
+        "lost_deliveries": len(lost),
+        "lost_delivery_posts": sorted({owner(key) or str(key) for key in lost}),
+        "duplicated_deliveries": len(duplicated),
+        "duplicated_posts": sorted({owner(key) or str(key) for key in duplicated}),
+        "posts_per_min": uploaded / run["elapsed_s"] * 60 if run["elapsed_s"] else 0,
+    }
+
+
+def spread(values: list) -> dict:
+    """Медиана и разброс повторов"""
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def merge_services(stats: list) -> dict:
+    """Счётчики заглушек по повторам: запросы и отказы — сумма, пики — максимум"""
+    merged = {}
+    for key in stats[0]:
+        if key == "first_listing_at":
+            continue  # Уже учтено в elapsed_s
+        values = [item[key] for item in stats]
+        merged[key] = max(values) if key in ("cdn_active", "cdn_peak_active") else sum(values)
+    return merged
+
+
+def summarize(runs: list, baseline: dict, baseline_rate: dict) -> dict:
+    """Итог профиля по повторам: проверки каждого прогона, медиана и разброс скорости"""
+    checks = []
+    for run in runs:
+        result = check(run, baseline)
+        result.update({key: run[key] for key in ("elapsed_s", "wall_s", "kills", "tracebacks", "post_statuses")})
+        checks.append(result)
+
+    rate = spread([result["posts_per_min"] for result in checks])
+    summary = {
+        "posts_per_min": rate,
+        "elapsed_s": spread([result["elapsed_s"] for result in checks]),
+        "degradation": 1 - rate["median"] / baseline_rate["median"] if baseline_rate else 0,
+        # Отличие от эталона в пределах разброса эталона — шум, а не эффект отказов
+        "within_noise": bool(baseline_rate) and baseline_rate["min"] <= rate["median"] <= baseline_rate["max"],
+        "runs": checks,
+        "services": merge_services([run["services"] for run in runs]),
+    }
+    for key in ("lost_posts", "lost_deliveries", "duplicated_deliveries", "kills", "tracebacks"):
+        summary[key] = sum(result[key] for result in checks)
+    for key in ("lost_delivery_posts", "duplicated_posts"):
+        summary[key] = sorted({post for result in checks for post in result[key]})
+    summary["uploaded"] = [result["uploaded"] for result in checks]
+    summary["failed_posts"] = [result["failed_posts"] for result in checks]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон пайплайна с отказами заглушек и процесса")
+    parser.add_argument("--posts", type=int, default=60, help="постов в ленте (не больше 100 — одна страница)")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов каждого профиля (медиана и разброс)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_PROFILE["seed"])
+    parser.add_argument("--timeout", type=float, default=600, help="сек на один прогон")
+    parser.add_argument("--output", help="Путь к JSON с результатом")
+    parser.add_argument("--child", nargs=3, metavar=("WORKDIR", "CONFIG", "EXPECTED"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        workdir, overrides, expected = args.child
+        child(workdir, overrides, int(expected))
+        return
+
+    names = ["baseline"] + [name for name in args.profiles if name != "baseline"]
+    runs, results = {}, {}
+    failed = False
+    for name in names:
+        runs[name] = []
+        for attempt in range(args.repeat):
+            print(f"[{name}] run {attempt + 1}/{args.repeat}...", flush=True)
+            try:
+                runs[name].append(run_profile(name, PROFILES[name], args.posts, args.timeout, args.seed, attempt))
+            except (TimeoutError, RuntimeError) as e:
+                if name == "baseline":
+                    raise  # Без эталона сравнивать не с чем
+                # Зависший или упавший прогон — тоже результат: остальные всё равно гоняем
+                print(f"{name:>13}: FAILED: {e}", flush=True)
+                results.setdefault(name, {}).setdefault("errors", []).append(str(e))
+                failed = True
+
+    baseline_rate = None
+    for name in names:
+        if not runs[name]:
+            continue
+        # Лента детерминирована (seed) — доставки сравниваются с первым прогоном эталона
+        result = summarize(runs[name], runs["baseline"][0], baseline_rate)
+        baseline_rate = baseline_rate or result["posts_per_min"]
+        results[name] = {**results.get(name, {}), **result}
+        failed |= bool(result["lost_posts"] or result["lost_deliveries"] or result["duplicated_deliveries"])
+
+        rate = result["posts_per_min"]
+        change = f"{-result['degradation'] or 0:+.0%}" + (" ~noise" if result["within_noise"] and name != "baseline" else "")
+        print(f"{name:>13}: {rate['median']:6.1f} posts/min [{rate['min']:.0f}-{rate['max']:.0f}] ({change}), "
+              f"{result['elapsed_s']['median']:5.1f}s  uploaded {'/'.join(map(str, result['uploaded']))}, "
+              f"lost {result['lost_posts']}+{result['lost_deliveries']} deliveries, "
+              f"duplicated {result['duplicated_deliveries']}"
+              + (f", killed {result['kills']}x" if result["kills"] else ""))
+
+    path = save_results("faults", {
+        "params": {"posts": args.posts, "seed": args.seed, "repeat": args.repeat,
+                   "profiles": {name: PROFILES[name] for name in names}, "bot_config": BASE_CONFIG},
+        "profiles": results,
+    }, args.output)
+    print(f"Saved to {path}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Сквозной бенчмарк пропускной способности: Reddit -> CDN -> Telegram на локальных заглушках
+
+Пример: python -m benchmarks.throughput --posts 100 --workers 4 --cdn-latency 0.05
+Результат сохраняется в bench_results/ (см. benchmarks.compare)
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+from benchmarks.common import load_config, peak_rss_bytes, save_results
+from benchmarks.fake_services import DEFAULT_PROFILE, run_in_process
+
+
+def fetch_json(url: str) -> dict:
+    with urllib.request.urlopen(url) as resp:
+        return json.loads(resp.read())
+
+
+async def run_pipeline(workers: int, timeout: float) -> float:
+    """Один проход фетчера и обработка очереди до опустошения, возвращает длительность"""
+    import main
+    from modules.database import db
+    from modules.telegram_client import telegram_client
+    from modules.file_manager import file_manager
+
+    await db.init()
+    telegram_client.bot  # Создание бота (импорт aiogram) не входит в замер
+    started = time.perf_counter()
+
+    await main.fetch_reddit_likes()
+    tasks = [asyncio.create_task(main.worker(), name=f"worker_{i}") for i in range(workers)]
+
+    try:
+        await asyncio.wait_for(main.app_state.queue.join(), timeout=timeout)
+    finally:
+        elapsed = time.perf_counter() - started
+        main.app_state.running = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await file_manager.close()
+        await telegram_client.close()
+
+    return elapsed
+
+
+async def post_statuses() -> dict:
+    import aiosqlite
+    from modules.database import db
+
+    async with aiosqlite.connect(db.db_path) as conn:
+        cursor = await conn.execute("SELECT status, COUNT(*) FROM posts GROUP BY status")
+        return dict(await cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк пайплайна")
+    parser.add_argument("--posts", type=int, default=DEFAULT_PROFILE["posts"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cdn-latency", type=float, default=DEFAULT_PROFILE["cdn_latency"])
+    parser.add_argument("--cdn-failure-rate", type=float, default=DEFAULT_PROFILE["cdn_failure_rate"])
+    parser.add_argument("--cdn-bandwidth", type=int, default=None, help="байт/с на соединение")
+    parser.add_argument("--cdn-capacity", type=int, default=None, help="параллельных запросов к CDN, сверх — 429")
+    parser.add_argument("--telegram-latency", type=float, default=DEFAULT_PROFILE["telegram_latency"])
+    parser.add_argument("--telegram-chat-interval", type=float, default=0.5,
+                        help="TELEGRAM_CHAT_INTERVAL бота (0 — отправки не ограничивают пайплайн)")
+    parser.add_argument("--telegram-429-rate", type=float, default=DEFAULT_PROFILE["telegram_429_rate"])
+    parser.add_argument("--local-bot-api", action="store_true",
+                        help="большие файлы — через заглушку своего сервера Bot API (TELEGRAM_LOCAL_API_URL)")
+    parser.add_argument("--profile", help="JSON-файл с переопределениями профиля заглушек")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Путь к JSON с результатом")
+    args = parser.parse_args()
+
+    profile = {
+        "posts": args.posts,
+        "cdn_latency": args.cdn_latency,
+        "cdn_failure_rate": args.cdn_failure_rate,
+        "cdn_bandwidth": args.cdn_bandwidth,
+        "cdn_capacity": args.cdn_capacity,
+        "telegram_latency": args.telegram_latency,
+        "telegram_429_rate": args.telegram_429_rate,
+    }
+    if args.profile:
+        profile.update(json.loads(Path(args.profile).read_text()))
+
+    process, urls = run_in_process(profile)
+    try:
+        workdir = Path(tempfile.mkdtemp(prefix="bench_throughput_"))
+        load_config(
+            workdir,
+            REDDIT_API_URL=urls["reddit"],
+            REDDIT_USERNAME=DEFAULT_PROFILE["username"],
+            REDDIT_PASSWORD="bench",
+            TELEGRAM_API_URL=urls["telegram"],
+            TELEGRAM_BOT_TOKEN="123456:bench",
+            THREAD_COUNT=args.workers,
+            TELEGRAM_CHAT_INTERVAL=args.telegram_chat_interval,
+            TELEGRAM_LOCAL_API_URL=urls["telegram_local"] if args.local_bot_api else None,
+            RETRY_CONFIG={"max_retries": 5, "alert_after_retry": 3,
+                          "initial_delay": 0.2, "backoff_multiplier": 1.5},
+        )
+
+        elapsed = asyncio.run(run_pipeline(args.workers, args.timeout))
+        statuses = asyncio.run(post_statuses())
+
+        from modules.metrics import metrics
+        from modules.file_manager import file_manager
+        services = fetch_json(f"{urls['control']}/stats")
+    finally:
+        process.terminate()
+
+    uploaded = statuses.get("uploaded", 0)
+    snapshot = metrics.snapshot()
+    results = {
+        "params": {**profile, "workers": args.workers, "telegram_chat_interval": args.telegram_chat_interval,
+                   "local_bot_api": args.local_bot_api},
+        "elapsed_s": elapsed,
+        "posts_per_min": uploaded / elapsed * 60 if elapsed else 0,
+        "download_bytes_per_s": snapshot["counters"].get("bytes_downloaded", 0) / elapsed if elapsed else 0,
+        "upload_bytes_per_s": (services["telegram_bytes"] + services["telegram_local_bytes"]) / elapsed
+        if elapsed else 0,
+        "stages": snapshot["stages"],
+        "counters": snapshot["counters"],
+        "host_windows": file_manager.host_windows(),
+        "post_statuses": statuses,
+        "services": {k: v for k, v in services.items() if k != "deliveries"},
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+    path = save_results("throughput", results, args.output)
+    print(json.dumps({k: v for k, v in results.items() if k != "params"}, indent=2))
+    print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
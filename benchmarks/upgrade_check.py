@@ -0,0 +1,189 @@
+"""
+Проверка обновления: db.init() на базе со схемой первой версии бота
+
+Создаёт базу по исходной схеме (posts без id/account, attachments без updated_at, telegram_messages
+с message_id в первичном ключе), наполняет её и дважды запускает init() текущей версии.
+Проверяется, что миграции прошли, данные на месте, поиск и связи вложений работают
+
+Пример: python -m benchmarks.upgrade_check
+Код выхода 1 — обновление не прошло
+"""
+import argparse
+import asyncio
+import sqlite3
+import sys
+import tempfile
+from contextlib import closing
+from pathlib import Path
+
+from benchmarks.common import load_config
+
+# Схема из первой версии modules/database.py — базы реальных пользователей созданы ею
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts
+(
+    reddit_post_id TEXT PRIMARY KEY,
+    reddit_user    TEXT,
+    title          TEXT,
+    content        TEXT,
+    source_url     TEXT,
+    status         TEXT CHECK (status IN ('fetched', 'downloaded', 'uploaded', 'deleted',
+                                          'skipped_deleted', 'skipped_size_exceeded',
+                                          'download_failed', 'telegram_failed', 'failed')),
+    retry_count    INTEGER DEFAULT 0,
+    created_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    error_message  TEXT,
+    fetched_at     TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS attachments
+(
+    attachment_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    reddit_post_id     TEXT NOT NULL,
+    file_url           TEXT NOT NULL,
+    file_type          TEXT,
+    file_size_bytes    INTEGER,
+    local_path         TEXT,
+    telegram_file_id   TEXT,
+    caption            TEXT,
+    status             TEXT CHECK (status IN ('pending', 'downloaded', 'uploaded', 'deleted',
+                                              'failed', 'deferred_disk_full')),
+    retry_count        INTEGER DEFAULT 0,
+    last_retry_attempt TIMESTAMP,
+    first_retry_at     TIMESTAMP,
+    created_at         TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (reddit_post_id) REFERENCES posts (reddit_post_id)
+);
+
+CREATE TABLE IF NOT EXISTS telegram_messages
+(
+    message_id       INTEGER PRIMARY KEY,
+    reddit_post_id   TEXT    NOT NULL,
+    telegram_chat_id INTEGER NOT NULL,
+    message_type     TEXT,
+    status           TEXT CHECK (status IN ('sent', 'failed')),
+    created_at       TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (reddit_post_id) REFERENCES posts (reddit_post_id)
+);
+
+CREATE TABLE IF NOT EXISTS disk_usage
+(
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    total_bytes INTEGER DEFAULT 0,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS stats
+(
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    posts_uploaded INTEGER DEFAULT 0,
+    files_uploaded INTEGER DEFAULT 0,
+    bytes_uploaded INTEGER DEFAULT 0,
+    posts_failed   INTEGER DEFAULT 0,
+    posts_skipped  INTEGER DEFAULT 0,
+    recorded_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO disk_usage (total_bytes) VALUES (0);
+"""
+
+
+def create_baseline(path: Path, posts: int):
+    """База первой версии с постами, вложениями, сообщениями и статистикой"""
+    with closing(sqlite3.connect(path)) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        for index in range(posts):
+            post_id = f"old{index}"
+            status = "uploaded" if index % 3 else "fetched"
+            conn.execute(
+                "INSERT INTO posts (reddit_post_id, reddit_user, title, content, source_url, status) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (post_id, f"author_{index}", f"Upgrade post {index}", f"old body {index}",
+                 f"https://reddit.com/{post_id}", status))
+            conn.execute(
+                "INSERT INTO attachments (reddit_post_id, file_url, file_type, caption, status) "
+                "VALUES (?, ?, 'image', ?, ?)",
+                (post_id, f"https://i.redd.it/{post_id}.jpg", f"caption {index}",
+                 "deleted" if status == "uploaded" else "pending"))
+            if status == "uploaded":
+                conn.execute(
+                    "INSERT INTO telegram_messages (message_id, reddit_post_id, telegram_chat_id, "
+                    "message_type, status) VALUES (?, ?, -100, 'photo', 'sent')",
+                    (index + 1, post_id))
+        conn.execute("INSERT INTO stats (posts_uploaded, files_uploaded) VALUES (?, ?)", (posts, posts))
+        conn.commit()
+
+
+def table_columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def verify(path: Path, posts: int) -> list:
+    """Что не так с базой после init() (пустой список — всё в порядке)"""
+    problems = []
+    with closing(sqlite3.connect(path)) as conn:
+        expected = {
+            "posts": {"id", "account"},
+            "attachments": {"updated_at", "fallback_url"},
+        }
+        for table, columns in expected.items():
+            missing = columns - table_columns(conn, table)
+            if missing:
+                problems.append(f"{table}: no columns {sorted(missing)}")
+
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for index in ("idx_attachments_updated", "idx_posts_updated", "idx_posts_status",
+                      "idx_telegram_messages_post"):
+            if index not in indexes:
+                problems.append(f"index {index} is missing")
+
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("posts", "attachments", "telegram_messages", "posts_fts")}
+        uploaded = sum(1 for index in range(posts) if index % 3)
+        for table, count in (("posts", posts), ("attachments", posts),
+                             ("telegram_messages", uploaded), ("posts_fts", posts)):
+            if counts[table] != count:
+                problems.append(f"{table}: {counts[table]} rows, expected {count}")
+
+        orphans = conn.execute(
+            "SELECT COUNT(*) FROM attachments a LEFT JOIN posts p ON p.reddit_post_id = a.reddit_post_id "
+            "WHERE p.reddit_post_id IS NULL").fetchone()[0]
+        if orphans:
+            problems.append(f"{orphans} attachments lost their post")
+        if conn.execute("PRAGMA foreign_key_check").fetchall():
+            problems.append("foreign key check failed")
+    return problems
+
+
+async def upgrade(posts: int) -> list:
+    from modules.database import db
+
+    await db.init()
+    await db.init()  # Повторный запуск после миграции не должен ничего ломать
+    problems = verify(db.db_path, posts)
+
+    found = await db.search_posts(f"Upgrade post {posts - 1}")
+    if not found or found[0]["reddit_post_id"] != f"old{posts - 1}":
+        problems.append(f"search returned {[row['reddit_post_id'] for row in found]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="db.init() на базе первой версии")
+    parser.add_argument("--posts", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="upgrade_check_"))
+    config = load_config(workdir)
+    create_baseline(config.DATABASE_PATH, args.posts)
+
+    problems = asyncio.run(upgrade(args.posts))
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    print("Upgrade OK" if not problems else f"Upgrade failed ({len(problems)} problems), database: {workdir}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,45 @@ from pathlib import Path
 REDDIT_CLIENT_ID = "your_reddit_client_id"
 REDDIT_CLIENT_SECRET = "your_reddit_client_secret"
 REDDIT_USER_AGENT = "RedditArchiver/1.0 (by user-is-absinthe)"
+REDDIT_USERNAME = None  # Логин/пароль для script-приложения; None — берутся из praw.ini
+REDDIT_PASSWORD = None
+REDDIT_API_URL = None  # Свой адрес API вместо reddit.com (для локальных заглушек)
 
 # ===== TELEGRAM =====
 TELEGRAM_BOT_TOKEN = "your_telegram_bot_token"
 TELEGRAM_CHANNEL_ID = -100123456789  # Отрицательный ID канала
 TELEGRAM_ADMIN_ID = 987654321  # Твой ID в ТГ
+TELEGRAM_API_URL = None  # Свой сервер Bot API, например "http://localhost:8081"; None — облачный
+TELEGRAM_CHAT_INTERVAL = 0.5  # Мин. интервал между сообщениями в один чат, сек
+TELEGRAM_GLOBAL_RATE = 25     # Не больше стольких запросов отправки в секунду на бота
+
+# Свой сервер telegram-bot-api (запущенный с --local) для больших файлов: облако принимает
+# от бота файлы до 50 MB, локальный сервер — до 2000 MB. Файлы от TELEGRAM_LOCAL_ROUTE_SIZE
+# уходят через него, остальные — через облако (TELEGRAM_API_URL)
+TELEGRAM_LOCAL_API_URL = None                       # Например "http://localhost:8081"
+TELEGRAM_LOCAL_ROUTE_SIZE = 20 * 1024 * 1024        # Не больше TELEGRAM_CLOUD_UPLOAD_LIMIT
+TELEGRAM_LOCAL_FILE_URIS = True                     # Сервер видит TEMP_DIR — файлы передаются путём file://
+TELEGRAM_LOCAL_TEMP_DIR = None                      # TEMP_DIR, как его видит сервер (Docker); None — тот же путь
+TELEGRAM_LOCAL_API_TIMEOUT = 600                    # Сек на запрос: сервер отвечает после загрузки файла в ТГ
+TELEGRAM_CLOUD_UPLOAD_LIMIT = 50 * 1024 * 1024
+TELEGRAM_LOCAL_UPLOAD_LIMIT = 2000 * 1024 * 1024
+
+# ===== ACCOUNTS =====
+# Несколько аккаунтов в одном процессе: аккаунт Реддита -> свой канал
+# Пусто — один аккаунт из REDDIT_USERNAME/REDDIT_PASSWORD и TELEGRAM_CHANNEL_ID
+# name и channel_id обязательны; задачи аккаунта, которого здесь нет, не отправляются
+ACCOUNTS = [
+    # {"name": "alice", "reddit_username": "alice", "reddit_password": "...", "channel_id": -100111},
+    # {"name": "bob", "reddit_username": "bob", "reddit_password": "...", "channel_id": -100222,
+    #  "max_quality": True},
+]
 
 # ===== PATHS =====
 BASE_DIR = Path(__file__).parent
 TEMP_DIR = BASE_DIR / "temp_files"
 LOG_DIR = BASE_DIR / "logs"
 DATABASE_PATH = BASE_DIR / "archive.db"
-
-TEMP_DIR.mkdir(exist_ok=True)
-LOG_DIR.mkdir(exist_ok=True)
+# Каталоги создаются при запуске бота (main.py), а не при импорте конфига
 
 # ===== LIMITS =====
 MAX_DISK_USAGE_BYTES = 3 * 1024 * 1024 * 1024  # 3 GB
@@ -33,10 +58,114 @@ RETRY_CONFIG = {
     "backoff_multiplier": 1.5,
 }
 
+# ===== DOWNLOADS =====
+# Параллельность скачиваний подбирается по каждому хосту сама (AIMD);
+# общий потолок — число воркеров (THREAD_COUNT)
+HOST_WINDOW_INITIAL = 2     # Параллельных скачиваний с нового хоста
+HOST_WINDOW_MIN = 1
+HOST_WINDOW_MAX = 16
+HOST_LATENCY_FACTOR = 3     # Ответ медленнее минимального во столько раз — окно не растёт
+DOWNLOAD_TIMEOUT = 300      # Сек на всё скачивание файла
+DOWNLOAD_READ_TIMEOUT = 60  # Хост молчит дольше (нет ни ответа, ни новых байт) — скачивание прерывается
+
+# ===== RENDITIONS =====
+# Какой вариант медиа качать: ТГ пережимает фото до ~1280 px, большие исходники — лишние байты
+IMAGE_TARGET_SIDE = 1080              # Большая сторона фото (крупнейшее превью Реддита — 1080)
+VIDEO_TARGET_HEIGHT = 720             # Высота видео (вариант DASH)
+VIDEO_BYTE_BUDGET = 50 * 1024 * 1024  # Оценка размера видео; по умолчанию — лимит загрузки Bot API
+MAX_QUALITY = False                   # Всегда исходники; для отдельного канала — "max_quality" в ACCOUNTS
+
+# ===== RESOLVERS =====
+# Ссылки на страницы (альбомы imgur, redgifs) превращаются в прямые ссылки на файлы до очереди скачивания
+RESOLVER_CONCURRENCY = 8           # Параллельных запросов к API хостингов
+RESOLVER_CACHE_SIZE = 10000        # Записей в памяти (LRU); все записи — ещё и в БД
+RESOLVER_CACHE_TTL = 7 * 24 * 3600
+RESOLVER_NEGATIVE_TTL = 24 * 3600  # Для ссылок без медиа (удалённый альбом, мёртвый gfycat)
+IMGUR_CLIENT_ID = ""               # Client-ID api.imgur.com для альбомов; без него — превью Реддита
+
+# ===== CIRCUIT BREAKERS =====
+BREAKER_FAILURE_THRESHOLD = 5   # Неудач подряд, после которых хост (или API ТГ) считается лежащим
+BREAKER_RESET_TIMEOUT = 300     # Сек до пробного запроса; задачи хоста до тех пор откладываются
+# Задача, отложенная дольше стольких секунд с первого откладывания (хост так и не поднялся),
+# помечается ошибкой с алертом админу
+PARK_MAX_SECONDS = 24 * 3600
+
 # ===== PROCESSING =====
-CHECK_INTERVAL = 3600  # 1 час между проходами Реддита
+CHECK_INTERVAL = 3600  # Начальный интервал между проходами Реддита (дальше подстраивается)
+# Проходы с новыми лайками учащаются до POLL_MIN_INTERVAL, пустые — реже, до POLL_MAX_INTERVAL
+POLL_MIN_INTERVAL = 300
+POLL_MAX_INTERVAL = 7200
+POLL_RATELIMIT_RESERVE = 10  # Меньше стольких запросов в окне лимита Реддита — ждём сброса окна
+SYNC_CHECK_INTERVAL = 5      # Многопроцессный режим: как часто фетчер проверяет запросы /sync
 THREAD_COUNT = 4       # Количество параллельных воркеров
 QUEUE_DEFER_POSITION = 10  # На сколько позиций отодвигаем при переполнении диска
+# Остановка: начатые загрузки доделываются столько секунд, остальное сохраняется до перезапуска
+# (в многопроцессном режиме супервизор ждёт процессы стадий на 10 секунд дольше)
+SHUTDOWN_GRACE_SECONDS = 20
+POST_CACHE_SIZE = 256      # Постов в памяти воркеров (текст для подписи читается из БД)
+# Полосы очереди по стоимости задачи: text — текстовые посты, small — картинки и небольшие файлы,
+# large — видео и файлы больше LANE_LARGE_BYTES. Полосы выдаются воркерам по кругу с весами
+# LANE_WEIGHTS; пока есть задачи других полос, задач полосы одновременно не больше LANE_LIMITS
+# (остальные воркеры — мелким задачам), иначе полоса занимает всех свободных воркеров
+LANE_LARGE_BYTES = 8 * 1024 * 1024
+LANE_WEIGHTS = {"text": 3, "small": 2, "large": 1}
+LANE_LIMITS = {"large": 2}
+POST_MAX_ACTIVE = 2        # Вложений одного поста одновременно в работе (галерея не занимает все воркеры)
+
+# ===== MULTIPROCESS =====
+PIPELINE_MODE = "single"   # "single" — всё в одном процессе, "multiprocess" — процессы стадий
+DOWNLOAD_PROCESSES = 2     # Процессов скачивания (в каждом THREAD_COUNT воркеров)
+UPLOAD_PROCESSES = 1       # Процессов отправки в ТГ
+JOB_LEASE_SECONDS = 120    # Аренда задачи; продлевается, пока процесс жив
+JOB_DEFER_DELAY = 60       # Через сколько секунд повторить задачу при переполнении диска
+
+# ===== MAINTENANCE =====
+# Обслуживание archive.db в простое пайплайна: сворачивание stats, очистка старого текста,
+# возврат свободных страниц (incremental_vacuum) и PRAGMA optimize
+MAINTENANCE_INTERVAL = 6 * 3600   # Сек между проходами
+MAINTENANCE_IDLE_WAIT = 1800      # Сколько ждать простоя, потом проход идёт и под нагрузкой
+MAINTENANCE_BATCH = 200           # Строк stats за одну транзакцию
+MAINTENANCE_BATCH_CHARS = 256 * 1024  # Символов текста постов за одну транзакцию
+MAINTENANCE_VACUUM_PAGES = 64     # Страниц за один шаг incremental_vacuum
+# База, созданная до включения auto_vacuum, не возвращает страницы, пока её не перепишет VACUUM
+# True — обслуживание сделает его само один раз в простое (вся база заблокирована на время VACUUM
+# и нужно свободное место размером с базу), False — только предупреждение в логе
+MAINTENANCE_VACUUM_CONVERT = False
+STATS_ROLLUP_DAYS = 7             # События stats старше — одной строкой за день
+POST_TEXT_RETENTION_DAYS = None   # Текст доставленных постов старше стольких дней убирается из posts
+                                  # (остаётся в поисковом индексе); None — хранить всегда
+POST_TEXT_PRUNE_CHARS = 2000      # Убирается только текст длиннее
+
+# ===== BACKUP =====
+# Онлайн-копии archive.db (backup API SQLite, бот не останавливается); /backup — копия сейчас
+BACKUP_DIR = BASE_DIR / "backups"
+BACKUP_INTERVAL = 24 * 3600     # Сек между копиями; None — только по /backup
+BACKUP_KEEP = 7                 # Сколько последних копий хранить
+BACKUP_COMPRESS = True          # Сжимать gzip
+BACKUP_PAGES_PER_STEP = 1024    # Страниц за шаг копирования
+BACKUP_STEP_PAUSE = 0.05        # Пауза между шагами, сек (в паузах пишут воркеры)
+BACKUP_MAX_RESTARTS = 3         # Запись в базу начинает копирование заново; после стольких
+                                # перезапусков копия снимается одним чтением
+
+# ===== DIGEST =====
+DIGEST_ENABLED = False       # Короткие текстовые посты — пачкой в одном сообщении
+DIGEST_MAX_POST_LENGTH = 1000  # Посты длиннее уходят отдельными сообщениями
+DIGEST_MAX_DELAY = 300       # Сек: пачка уходит не позже, чем через столько после первого поста
+
+# ===== BACKFILL (python main.py --backfill [аккаунт ...]) =====
+BACKFILL_LISTINGS = ["upvoted", "saved"]  # Листинги, история которых догружается
+BACKFILL_QUEUE_LIMIT = 50   # Следующая страница — только когда в очереди меньше задач
+BACKFILL_PAGE_DELAY = 2     # Пауза между страницами, сек (лимиты API выдерживает praw)
+
+# ===== EXPORT (python main.py --export [каталог] [--format parquet] [--full]) =====
+EXPORT_DIR = BASE_DIR / "exports"
+EXPORT_CHUNK_ROWS = 5000    # Строк за одно чтение из базы
+
+# ===== EVENT LOOP WATCHDOG =====
+LOOP_LAG_INTERVAL = 0.5     # Сек между замерами задержки event loop
+LOOP_LAG_THRESHOLD = 0.5    # Loop не отвечает дольше — в лог пишется стек блокирующего вызова
+LOOP_DEBUG = False          # Отладочный режим asyncio: в лог — каждый колбэк дольше LOOP_SLOW_CALLBACK
+LOOP_SLOW_CALLBACK = 0.1
 
 # ===== LOGGING =====
 LOG_FILE = LOG_DIR / "bot.log"
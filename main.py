@@ -1,153 +1,380 @@
 import asyncio
+import html
+import itertools
+import json
+import multiprocessing
+import os
 import signal
-from aiogram import Dispatcher, Bot, F
-from aiogram.types import Update
+import sys
+import time
 from config import (
-    TELEGRAM_BOT_TOKEN, CHECK_INTERVAL, THREAD_COUNT,
-    MAX_DISK_USAGE_BYTES, QUEUE_DEFER_POSITION, RETRY_CONFIG
+    CHECK_INTERVAL, THREAD_COUNT, TEMP_DIR,
+    MAX_DISK_USAGE_BYTES, QUEUE_DEFER_POSITION, RETRY_CONFIG,
+    PIPELINE_MODE, DOWNLOAD_PROCESSES, UPLOAD_PROCESSES, JOB_LEASE_SECONDS, JOB_DEFER_DELAY,
+    BACKFILL_LISTINGS, BACKFILL_QUEUE_LIMIT, BACKFILL_PAGE_DELAY,
+    DIGEST_ENABLED, DIGEST_MAX_POST_LENGTH, SHUTDOWN_GRACE_SECONDS,
+    LANE_WEIGHTS, LANE_LIMITS, POST_MAX_ACTIVE, BACKUP_INTERVAL, PARK_MAX_SECONDS
 )
-from modules.logger import logger
+from modules.logger import logger, setup_logger
 from modules.database import db
 from modules.telegram_client import telegram_client
-from modules.reddit_client import reddit_client
-from modules.file_manager import file_manager
-from modules.handlers import admin_router
+from modules.reddit_client import get_reddit_client
+from modules.accounts import Account, UnknownAccountError, accounts, get_account
+from modules.file_manager import file_manager, MediaNotFoundError
+from modules.resolvers import media_resolver
 from modules.retry_logic import retry_with_backoff
-from modules.utils import format_file_size, defer_attachment_in_queue
+from modules.circuit_breaker import CircuitOpenError
+from modules.shutdown import shutdown
+from modules.status import pipeline
+from modules.maintenance import maintenance
+from modules.backup import backup
+from modules.watchdog import loop_monitor
+from modules.tasks import Task, post_cache, media_lane
+from modules.poller import poller
+from modules.metrics import metrics
+from modules.digest import DigestBuffer, join_digest
+from modules.utils import format_file_size, defer_attachment_in_queue, format_text_post, message_link, FairQueue
 
 
 # Глобальное состояние
 class AppState:
     running = True
-    queue = asyncio.Queue()
+    # Общая очередь всех аккаунтов: полосы по стоимости задачи, внутри — аккаунты по кругу
+    queue = FairQueue(lane=lambda task: task.lane, weights=LANE_WEIGHTS, limits=LANE_LIMITS,
+                      group=lambda task: task.post_id, group_limit=POST_MAX_ACTIVE)
+    # Многопроцессный режим: задачи передаются между процессами через таблицу jobs
+    use_jobs = False
+    # Отложенные до пробы хоста отправки (ссылки, чтобы задачи не собрал GC)
+    parked = set()
+    # Отложенные задачи пайплайна: id(task) -> (таймер, task); при остановке сохраняются в jobs
+    parked_tasks = {}
 
 
 app_state = AppState()
 
 
+async def enqueue_task(task: Task, delay: float = 0):
+    """Ставит задачу в очередь процесса или, в многопроцессном режиме, в таблицу jobs"""
+    if app_state.use_jobs:
+        await db.enqueue_job(task.type, task.post_id, task.to_dict(), delay)
+    else:
+        await app_state.queue.put(task)
+
+
+async def enqueue_tasks(tasks: list):
+    """Ставит пачку задач: в многопроцессном режиме — в jobs одной транзакцией"""
+    if app_state.use_jobs:
+        if tasks:
+            await db.enqueue_jobs([task.to_dict() for task in tasks])
+    else:
+        for task in tasks:
+            app_state.queue.put_nowait(task)
+
+
+def park(delay: float, coro_factory):
+    """Запускает coro_factory() через delay секунд — пока цепь хоста разомкнута, воркеры свободны"""
+    async def run():
+        # Начатую отправку при остановке дожидаемся, как и задачи воркеров
+        with shutdown.busy():
+            await coro_factory()
+
+    def start():
+        parked_task = asyncio.ensure_future(run())
+        app_state.parked.add(parked_task)
+        parked_task.add_done_callback(app_state.parked.discard)
+
+    metrics.inc('tasks_parked')
+    asyncio.get_running_loop().call_later(delay, start)
+
+
+async def park_task(task: Task, error: CircuitOpenError):
+    """
+    Откладывает задачу до пробы её хоста; отложенную дольше PARK_MAX_SECONDS — помечает ошибкой
+    В одном процессе отложенные задачи живут в памяти; при остановке их сохранит checkpoint_tasks
+    """
+    if not task.parked_at:
+        task.parked_at = time.time()
+    elif time.time() - task.parked_at > PARK_MAX_SECONDS:
+        await fail_parked_task(task, error)
+        return
+
+    logger.warning(f"Parking {task.type} task for post {task.post_id}: {error}")
+    if app_state.use_jobs:
+        await enqueue_task(task, delay=error.retry_in)
+        return
+
+    def unpark():
+        app_state.parked_tasks.pop(id(task), None)
+        app_state.queue.put_nowait(task)
+
+    metrics.inc('tasks_parked')
+    handle = asyncio.get_running_loop().call_later(error.retry_in, unpark)
+    app_state.parked_tasks[id(task)] = (handle, task)
+
+
+async def fail_parked_task(task: Task, error: CircuitOpenError):
+    """Хост так и не поднялся за PARK_MAX_SECONDS — задача больше не откладывается"""
+    hours = (time.time() - task.parked_at) / 3600
+    logger.error(f"Giving up on {task.type} task for post {task.post_id}: parked for {hours:.1f}h, {error}")
+    if task.attachment_id:
+        await db.update_attachment_status(task.attachment_id, 'failed')
+    status = 'download_failed' if task.type == 'download' else 'telegram_failed'
+    await db.update_post_status(task.post_id, status, f"{error.name} unavailable for {hours:.1f}h")
+    await db.record_stats(posts_failed=1)
+    await send_admin_alert(f"{error.name} недоступен {hours:.1f} ч — "
+                           f"задача {task.type} поста {task.post_id} помечена ошибкой")
+
+
 async def send_admin_alert(text: str):
     """Отправляет алерт администратору"""
     await telegram_client.send_admin_message(f"🚨 {text}")
 
 
-async def fetch_reddit_likes():
-    """Получает лайки с Реддита и добавляет в очередь"""
-    logger.info("Fetching liked posts from Reddit...")
-
-    try:
-        posts = await asyncio.to_thread(reddit_client.get_liked_posts)
+async def share_archived_post(post_id: str, account: Account) -> bool:
+    """
+    Пост уже заархивирован другим аккаунтом — копирует его сообщения в канал этого аккаунта
+    Возвращает True, если пост в канале уже есть или скопирован
+    """
+    if await db.get_telegram_messages(post_id, account.channel_id):
+        return True
+
+    owner = await db.get_post_owner(post_id)
+    if not owner or owner[1] != 'uploaded':
+        # Пост ещё в работе у другого аккаунта — попробуем в следующий проход
+        return False
+
+    copied = await copy_archived_messages(post_id, post_id, account.channel_id)
+    logger.info(f"Copied post {post_id} to {account.name} channel ({copied} messages)")
+    return True
+
+
+async def copy_archived_messages(source_post_id: str, post_id: str, channel_id: int) -> int:
+    """Копирует сообщения заархивированного поста source_post_id в канал и записывает их за post_id"""
+    messages = await db.get_telegram_messages(source_post_id)
+    source_chat = messages[0][0]
+    message_ids = [message_id for chat_id, message_id in messages if chat_id == source_chat]
+
+    new_ids = await telegram_client.copy_messages(source_chat, message_ids, channel_id)
+    for msg_id in new_ids:
+        await db.add_telegram_message(msg_id, post_id, channel_id, 'copy')
+    return len(new_ids)
+
+
+async def forward_crosspost(post: dict, account: Account) -> bool:
+    """
+    Кросспост уже заархивированного поста: вместо скачивания копирует сообщения родителя в канал,
+    а если родитель уже в этом канале — отправляет ссылку на него
+    Возвращает True, если пост обработан без скачивания
+    """
+    parent_id = post.get('crosspost_parent')
+    if not parent_id:
+        return False
+
+    owner = await db.get_post_owner(parent_id)
+    if not owner or owner[1] != 'uploaded' or not await db.get_telegram_messages(parent_id):
+        # Родителя нет в архиве или он ещё в работе — архивируем кросспост как обычно
+        return False
+
+    in_channel = await db.get_telegram_messages(parent_id, account.channel_id)
+    if in_channel:
+        text = (f"🔁 <a href=\"{message_link(account.channel_id, in_channel[0][1])}\">Кросспост</a>: "
+                f"{html.escape(post['title'])}\n\n🔗 <a href=\"{post['full_url']}\">Исходный пост</a>")
+        msg_id = await telegram_client.send_text_message(text, channel_id=account.channel_id)
+        await db.add_telegram_message(msg_id, post['id'], account.channel_id, 'link')
+    else:
+        await copy_archived_messages(parent_id, post['id'], account.channel_id)
+
+    await db.update_post_status(post['id'], 'uploaded')
+    await db.record_stats(posts_uploaded=1)
+    logger.info(f"Crosspost {post['id']} of {parent_id} archived without download")
+    return True
+
+
+async def ingest_posts(posts: list, account: Account) -> tuple[int, int]:
+    """
+    Записывает новые посты аккаунта в БД и ставит их вложения в очередь
+    Возвращает (добавлено задач, пропущено постов)
+    """
+    added = 0
+    skipped = 0
+
+    # Ссылки на альбомы и страницы хостингов — в прямые ссылки на файлы, параллельно и через кэш
+    await media_resolver.resolve_posts(posts)
+
+    for post in posts:
+        # Проверяем, уже ли этот пост загружали
+        existing = await db.get_post_owner(post['id'])
+
+        if existing:
+            if existing[0] != account.name:
+                # Тот же пост лайкнут другим аккаунтом — копируем, а не качаем заново
+                try:
+                    await share_archived_post(post['id'], account)
+                except Exception as e:
+                    logger.error(f"Error copying post {post['id']} to {account.name}: {e}")
+            logger.debug(f"Post {post['id']} already processed")
+            skipped += 1
+            continue
 
-        added = 0
-        skipped = 0
+        # Добавляем пост в БД
+        await db.add_post(
+            post['id'],
+            post['author'],
+            post['title'],
+            post['selftext'],
+            post['full_url'],
+            account.name
+        )
 
-        for post in posts:
-            # Проверяем, уже ли этот пост загружали
-            existing = await db.get_post(post['id'])
+        # Если пост удалён — пропускаем
+        if post['is_deleted']:
+            await db.update_post_status(post['id'], 'skipped_deleted')
+            skipped += 1
+            continue
 
-            if existing:
-                logger.debug(f"Post {post['id']} already processed")
-                skipped += 1
+        # Кросспост заархивированного поста — одним запросом к ТГ, без скачивания
+        try:
+            if await forward_crosspost(post, account):
                 continue
+        except Exception as e:
+            logger.error(f"Error forwarding crosspost {post['id']}: {e}")
 
-            # Добавляем пост в БД
-            await db.add_post(
-                post['id'],
-                post['author'],
-                post['title'],
-                post['selftext'],
-                post['full_url']
-            )
+        # Вложения записываем сразу: в очереди задача держит только их id
+        media_list = post.get('media', [])
+        attachment_ids = await db.add_attachments(post['id'], media_list)
+        for attachment_id, media in zip(attachment_ids, media_list):
+            lane = media_lane(media['type'], media.get('file_size', 0) or 0)
+            await enqueue_task(Task("download", post['id'], account.name, attachment_id, lane))
+            added += 1
 
-            # Если пост удалён — пропускаем
-            if post['is_deleted']:
-                await db.update_post_status(post['id'], 'skipped_deleted')
-                skipped += 1
-                continue
+        # Если нет медиа — отправляем просто текст
+        if not attachment_ids:
+            await enqueue_task(Task("text", post['id'], account.name))
+            added += 1
+
+    return added, skipped
 
-            # Добавляем вложения в очередь
-            for media in post.get('media', []):
-                await app_state.queue.put({
-                    "type": "download",
-                    "post_id": post['id'],
-                    "post_data": post,
-                    "media": media,
-                })
-                added += 1
-
-            # Если нет медиа — отправляем просто текст
-            if not post.get('media'):
-                await app_state.queue.put({
-                    "type": "text",
-                    "post_id": post['id'],
-                    "post_data": post,
-                })
-                added += 1
+
+async def fetch_reddit_likes(account: Account = None) -> float:
+    """
+    Получает новые лайки аккаунта с Реддита (до уже разобранных прошлым проходом) и добавляет в очередь
+    Возвращает паузу до следующего прохода (см. AdaptivePoller)
+    """
+    account = account or get_account()
+    client = get_reddit_client(account)
+    logger.info(f"Fetching liked posts from Reddit for {account.name}...")
+
+    try:
+        async with metrics.timer('fetch'):
+            posts = await asyncio.to_thread(client.get_liked_posts, stop_at=poller.stop_at(account.name))
+
+        added, skipped = await ingest_posts(posts, account)
 
         logger.info(f"Fetched {added} new tasks, {skipped} already processed")
         await db.record_stats(posts_skipped=skipped)
+        return poller.record(account.name, posts, len(posts) - skipped, client.rate_limits())
 
     except Exception as e:
-        logger.error(f"Error fetching Reddit likes: {e}")
-        await send_admin_alert(f"Ошибка при получении лайков с Реддита: {str(e)[:100]}")
+        logger.error(f"Error fetching Reddit likes for {account.name}: {e}")
+        await send_admin_alert(f"Ошибка при получении лайков с Реддита ({account.name}): {str(e)[:100]}")
+        return poller.record(account.name, [], None, client.rate_limits())
 
 
-async def process_download_task(task: dict):
+async def process_download_task(task: Task):
     """Обрабатывает задачу скачивания файла"""
-    post_id = task['post_id']
-    post_data = task['post_data']
-    media = task['media']
+    post_id = task.post_id
+    attachment_id = task.attachment_id
 
     logger.info(f"Processing download task for post {post_id}")
 
     try:
+        attachment = await db.get_attachment(attachment_id) if attachment_id else None
+        if attachment is None:
+            # Задача из jobs старой версии (без записи вложения) — её вложения вернёт reconcile_state
+            logger.warning(f"Download task for post {post_id} has no attachment record, skipping")
+            return
+        if attachment['file_type'] == 'link':
+            # Хостинг не ответил при получении поста — разбираем ссылку снова
+            attachment = await resolve_link_attachment(task, attachment)
+            if attachment is None:
+                return
+        url = attachment['file_url']
+
+        breaker = file_manager.host_breaker(url)
+        if not breaker.available():
+            # Хост лежит — откладываем, не занимая место на диске и воркер
+            await park_task(task, CircuitOpenError(breaker))
+            return
+
         # Проверяем размер диска
         current_disk_usage = await db.get_disk_usage()
-        file_size_bytes = media.get('file_size', 0) or 0
+        file_size_bytes = attachment['file_size_bytes'] or 0
+        # Больше этого бот не загрузит (облачный Bot API — 50 MB, свой сервер — 2000 MB)
+        upload_limit = min(file_manager.max_file_size, telegram_client.max_upload_size)
+
+        if file_size_bytes > upload_limit:
+            await skip_too_large(post_id, attachment_id, file_size_bytes)
+            return
 
         if not file_size_bytes:
             # Если размер не известен, пытаемся скачать и проверить
-            logger.debug(f"File size unknown, attempting download: {media['url']}")
+            logger.debug(f"File size unknown, attempting download: {url}")
 
         if current_disk_usage + file_size_bytes > MAX_DISK_USAGE_BYTES:
             # Диск переполнен — отодвигаем в конец очереди
             logger.warning(f"Disk full ({format_file_size(current_disk_usage)} used). Deferring task.")
 
-            task['retry_count'] = task.get('retry_count', 0) + 1
+            task.retry_count += 1
 
-            if task['retry_count'] < 5:  # Не отодвигаем бесконечно
-                await defer_attachment_in_queue(app_state.queue, task, QUEUE_DEFER_POSITION)
+            if task.retry_count < 5:  # Не отодвигаем бесконечно
+                if app_state.use_jobs:
+                    await enqueue_task(task, delay=JOB_DEFER_DELAY)
+                else:
+                    await defer_attachment_in_queue(app_state.queue, task, QUEUE_DEFER_POSITION)
             else:
                 logger.error(f"Post {post_id} deferred too many times. Skipping.")
+                await db.update_attachment_status(attachment_id, 'failed')
                 await db.update_post_status(post_id, 'skipped_size_exceeded')
                 await db.record_stats(posts_skipped=1)
 
             return
 
-        # Создаём задачу скачивания в БД
-        attachment_id = await db.add_attachment(
-            post_id,
-            media['url'],
-            media['type'],
-            file_size_bytes,
-            media.get('caption')
-        )
-
         # Скачиваем файл с повторами
         async def download_coro():
-            local_path, actual_size = await file_manager.download_file(
-                media['url'],
-                media['type']
-            )
+            nonlocal url
+            while True:
+                try:
+                    local_path, actual_size = await file_manager.download_file(
+                        url,
+                        attachment['file_type'],
+                        max_size=upload_limit,
+                        progress=pipeline.progress(),
+                        attachment_id=attachment_id
+                    )
+                    break
+                except MediaNotFoundError:
+                    fallback_url = attachment['fallback_url']
+                    if not fallback_url or url == fallback_url:
+                        raise
+                    # Выбранного варианта у хостинга нет (DASH_<высота> есть не у всех видео) — берём исходный
+                    logger.warning(f"{url} not found, falling back to {fallback_url}")
+                    url = fallback_url
+                    await db.use_fallback_url(attachment_id)
+
+            if not local_path and actual_size > upload_limit:
+                # Слишком большой — повторы не помогут
+                return None, actual_size
 
             if not local_path:
-                raise Exception(f"Failed to download {media['url']}")
-
-            if actual_size > file_manager.max_file_size:
-                raise Exception(f"File too large: {format_file_size(actual_size)}")
+                raise Exception(f"Failed to download {url}")
 
             return local_path, actual_size
 
-        result = await retry_with_backoff(download_coro(), attachment_id, send_admin_alert)
+        try:
+            result = await retry_with_backoff(download_coro, attachment_id, send_admin_alert)
+        except CircuitOpenError as e:
+            await park_task(task, e)
+            return
 
         if not result:
             # Ошибка после всех попыток
@@ -157,37 +384,76 @@ async def process_download_task(task: dict):
             return
 
         local_path, actual_size = result
+        if not local_path:
+            await skip_too_large(post_id, attachment_id, actual_size)
+            return
 
         # Обновляем БД и использование диска
         await db.update_attachment_status(attachment_id, 'downloaded', local_path=local_path)
         await db.update_disk_usage(actual_size)
 
         # Добавляем в очередь загрузки в ТГ
-        await app_state.queue.put({
-            "type": "upload",
-            "post_id": post_id,
-            "post_data": post_data,
-            "attachment_id": attachment_id,
-            "local_path": local_path,
-        })
+        await enqueue_task(Task("upload", post_id, task.account, attachment_id,
+                                media_lane(attachment['file_type'], actual_size)))
 
     except Exception as e:
         logger.error(f"Error in download task: {e}")
         await send_admin_alert(f"Ошибка скачивания для поста {post_id}: {str(e)[:100]}")
 
 
-async def process_upload_task(task: dict):
+async def resolve_link_attachment(task: Task, attachment):
+    """
+    Разбирает с повторами вложение-ссылку: первый файл — в это вложение, остальные файлы
+    альбома — новыми вложениями в очередь
+    Возвращает обновлённое вложение; None — файлов нет или хостинг так и не ответил (пост помечен)
+    """
+    url = attachment['file_url']
+
+    async def resolve_coro():
+        media = await media_resolver.resolve(url)
+        if media is None:
+            raise Exception(f"Failed to resolve {url}")
+        return media
+
+    media_list = await retry_with_backoff(resolve_coro, task.attachment_id, send_admin_alert)
+    if not media_list:
+        reason = "No media behind link" if media_list == [] else "Could not resolve link"
+        logger.error(f"{reason} {url} of post {task.post_id}")
+        await db.update_attachment_status(task.attachment_id, 'failed')
+        await db.update_post_status(task.post_id, 'download_failed', f"{reason}: {url}")
+        await db.record_stats(posts_failed=1)
+        return None
+
+    added = await db.expand_attachment(task.attachment_id, media_list)
+    for attachment_id, media in zip(added, media_list[1:]):
+        await enqueue_task(Task("download", task.post_id, task.account, attachment_id,
+                                media_lane(media['type'], media.get('file_size', 0) or 0)))
+    logger.info(f"Resolved {url} of post {task.post_id} into {len(media_list)} files")
+    return await db.get_attachment(task.attachment_id)
+
+
+async def skip_too_large(post_id: str, attachment_id: int, size: int):
+    """Вложение больше, чем бот может загрузить в ТГ — пост пропускается без повторов"""
+    logger.warning(f"Attachment of post {post_id} is too large to upload ({format_file_size(size)}). Skipping.")
+    if attachment_id:
+        await db.update_attachment_status(attachment_id, 'failed')
+    await db.update_post_status(post_id, 'skipped_size_exceeded')
+    await db.record_stats(posts_skipped=1)
+
+
+async def process_upload_task(task: Task):
     """Обрабатывает задачу загрузки в ТГ"""
-    post_id = task['post_id']
-    attachment_id = task['attachment_id']
-    local_path = task['local_path']
-    post_data = task['post_data']
+    post_id = task.post_id
+    attachment_id = task.attachment_id
+    channel_id = get_account(task.account).channel_id
 
     logger.info(f"Processing upload task for attachment {attachment_id}")
 
     try:
-        # Подготавливаем данные для отправки
+        # Подготавливаем данные для отправки: путь и подпись — из вложения, текст — из поста
         attachment_data = await db.get_attachment(attachment_id)
+        local_path = attachment_data['local_path']
+        post_data = await post_cache.get(post_id)
 
         att_info = {
             'file_type': attachment_data['file_type'],
@@ -199,11 +465,16 @@ async def process_upload_task(task: dict):
         async def upload_coro():
             message_id = await telegram_client.send_media_groups(
                 [att_info],
-                post_data
+                post_data,
+                channel_id
             )
             return message_id
 
-        result = await retry_with_backoff(upload_coro(), attachment_id, send_admin_alert)
+        try:
+            result = await retry_with_backoff(upload_coro, attachment_id, send_admin_alert)
+        except CircuitOpenError as e:
+            await park_task(task, e)
+            return
 
         if not result:
             # Ошибка после всех попыток
@@ -219,17 +490,16 @@ async def process_upload_task(task: dict):
 
         # Записываем message_ids
         for msg_id in message_ids:
-            await db.add_telegram_message(msg_id, post_id, telegram_client.channel_id, 'media')
+            await db.add_telegram_message(msg_id, post_id, channel_id, 'media')
 
         # Удаляем файл с диска
         await file_manager.delete_file(local_path)
 
         await db.update_attachment_status(attachment_id, 'deleted')
 
-        # Проверяем, все ли вложения для этого поста загружены
-        pending = await db.get_attachments_by_post(post_id, status='uploaded')
-        if not pending:
-            await db.update_post_status(post_id, 'uploaded')
+        # Пост готов, когда не осталось неотправленных вложений и задач по нему
+        # (ошибку, записанную другим вложением, не затираем — пост уже не в 'fetched')
+        if await db.finish_uploaded_posts(post_id, attachment_id):
             await db.record_stats(posts_uploaded=1, files_uploaded=1,
                                   bytes_uploaded=0)  # TODO: отслеживать размер
 
@@ -238,33 +508,51 @@ async def process_upload_task(task: dict):
         await send_admin_alert(f"Ошибка загрузки вложения {attachment_id}: {str(e)[:100]}")
 
 
-async def process_text_task(task: dict):
+async def process_text_task(task: Task):
     """Обрабатывает задачу отправки текстового поста"""
-    post_id = task['post_id']
-    post_data = task['post_data']
+    post_id = task.post_id
+    channel_id = get_account(task.account).channel_id
 
     logger.info(f"Processing text task for post {post_id}")
 
     try:
-        text = post_data.get('selftext', '').strip()
+        post_data = await post_cache.get(post_id)
+        text = post_data['selftext'].strip()
 
         if not text:
             await db.update_post_status(post_id, 'skipped_size_exceeded')
             await db.record_stats(posts_skipped=1)
             return
 
-        # Добавляем ссылку на пост
-        text += f"\n\n🔗 [Исходный пост](https://reddit.com{post_data['permalink']})"
-
-        # Отправляем с повторами
-        async def send_coro():
-            msg_id = await telegram_client.send_text_message(text)
-            return msg_id
-
-        result = await retry_with_backoff(send_coro(), post_id, send_admin_alert)
-
-        if result:
-            await db.add_telegram_message(result, post_id, telegram_client.channel_id, 'text')
+        if DIGEST_ENABLED:
+            # Короткие посты копятся и уходят одним сообщением (см. send_digest)
+            entry = format_text_post(post_data, with_title=True)
+            if len(entry) == 1 and len(entry[0]) <= DIGEST_MAX_POST_LENGTH:
+                await text_digest.add(channel_id, post_id, entry[0])
+                return
+
+        # Текст и ссылка на пост, разбитые на сообщения по границам абзацев
+        # (отложенная задача продолжает с первой неотправленной части)
+        parts = format_text_post(post_data)
+        sent = task.parts_sent
+        for part in parts[sent:]:
+            # Отправляем с повторами
+            async def send_coro():
+                msg_id = await telegram_client.send_text_message(part, channel_id=channel_id)
+                return msg_id
+
+            try:
+                result = await retry_with_backoff(send_coro, post_id, send_admin_alert)
+            except CircuitOpenError as e:
+                task.parts_sent = sent
+                await park_task(task, e)
+                return
+            if not result:
+                break
+            sent += 1
+            await db.add_telegram_message(result, post_id, channel_id, 'text')
+
+        if sent == len(parts):
             await db.update_post_status(post_id, 'uploaded')
             await db.record_stats(posts_uploaded=1)
         else:
@@ -276,92 +564,590 @@ async def process_text_task(task: dict):
         await send_admin_alert(f"Ошибка отправки текста поста {post_id}: {str(e)[:100]}")
 
 
+async def send_digest(channel_id: int, entries: list, parked_at: float = 0):
+    """
+    Отправляет пачку коротких текстовых постов одним сообщением и записывает его за каждым постом
+    parked_at — когда пачку впервые отложили до пробы API (как Task.parked_at)
+    """
+    post_ids = [post_id for post_id, _ in entries]
+    logger.info(f"Sending digest of {len(entries)} posts to {channel_id}")
+
+    async def send_coro():
+        msg_id = await telegram_client.send_text_message(join_digest(entries), channel_id=channel_id)
+        return msg_id
+
+    try:
+        result = await retry_with_backoff(send_coro, f"digest:{post_ids[0]}", send_admin_alert)
+    except CircuitOpenError as e:
+        parked_at = parked_at or time.time()
+        if time.time() - parked_at <= PARK_MAX_SECONDS:
+            logger.warning(f"Parking digest of {len(entries)} posts: {e}")
+            park(e.retry_in, lambda: send_digest(channel_id, entries, parked_at))
+            return
+        # Как и отложенные задачи (fail_parked_task): API так и не поднялся — посты с ошибкой
+        logger.error(f"Giving up on digest of {len(entries)} posts: {e}")
+        await send_admin_alert(f"{e.name} недоступен {(time.time() - parked_at) / 3600:.1f} ч — "
+                               f"дайджест из {len(entries)} постов помечен ошибкой")
+        result = None
+
+    for post_id in post_ids:
+        if result:
+            await db.add_telegram_message(result, post_id, channel_id, 'digest')
+            await db.update_post_status(post_id, 'uploaded')
+        else:
+            await db.update_post_status(post_id, 'telegram_failed')
+
+    if result:
+        await db.record_stats(posts_uploaded=len(post_ids))
+    else:
+        await db.record_stats(posts_failed=len(post_ids))
+
+
+# Пачки коротких текстовых постов (DIGEST_ENABLED); посты в пачке остаются в статусе fetched,
+# поэтому при падении до отправки их вернёт в очередь reconcile_state
+text_digest = DigestBuffer(send_digest)
+
+
+async def reconcile_state():
+    """
+    Сверка состояния при старте (после падения):
+    удаляет неучтённые файлы из TEMP_DIR, пересчитывает использование диска,
+    возвращает в очередь застрявшие вложения и посты
+    """
+    files = {os.path.normpath(path): size for path, size in (await file_manager.scan_temp_dir()).items()}
+    attachments = await db.get_unfinished_attachments()
+
+    uploads, downloads, kept = [], [], []
+    kept_bytes = 0
+
+    for att in attachments:
+        local_path = os.path.normpath(att['local_path']) if att['local_path'] else None
+        task = Task("download", att['reddit_post_id'], att['account'], att['attachment_id'],
+                    media_lane(att['file_type'], att['file_size_bytes'] or 0))
+
+        if att['status'] == 'downloaded' and local_path in files:
+            # Файл скачан целиком — осталось только загрузить в ТГ
+            kept_bytes += files.pop(local_path)
+            kept.append(att['attachment_id'])
+            task.type = "upload"
+            queue = uploads
+        else:
+            # Вложение ждало в очереди, скачивание не завершилось или файл пропал — качаем заново
+            queue = downloads
+        # Задача уже лежит в jobs (многопроцессный режим или сохранена при остановке)
+        if not att['has_job']:
+            queue.append(task)
+
+    # Скачанные без файла на диске — одним UPDATE обратно в 'pending'
+    reset = await db.reset_downloaded_attachments(kept)
+    await enqueue_tasks(uploads + downloads)
+
+    # Всё, что осталось в TEMP_DIR, — недокачанные или забытые файлы
+    orphans_deleted = await file_manager.delete_orphans(list(files))
+    await db.set_disk_usage(kept_bytes)
+
+    texts = []
+    forgotten_posts = []
+    for post in await db.get_unfinished_posts():
+        if post['parts_sent'] or (post['content'] or '').strip():
+            # Частично отправленный текст продолжается с первой неотправленной части
+            texts.append(Task("text", post['reddit_post_id'], post['account'], parts_sent=post['parts_sent']))
+        else:
+            # Список медиа не сохранился — пусть фетчер увидит пост как новый
+            forgotten_posts.append(post['reddit_post_id'])
+
+    await enqueue_tasks(texts)
+    await db.delete_posts(forgotten_posts)
+    # Все вложения отправлены, но статус поста не сменился до падения
+    finished_posts = await db.finish_uploaded_posts()
+
+    logger.info(
+        f"Reconciled: {orphans_deleted} orphan files deleted ({format_file_size(sum(files.values()))}), "
+        f"disk usage {format_file_size(kept_bytes)}, {len(uploads)} uploads and "
+        f"{len(downloads)} downloads re-queued ({reset} reset to pending), {len(texts)} text posts re-queued, "
+        f"{len(forgotten_posts)} posts reset for refetch, {finished_posts} posts marked uploaded"
+    )
+
+
+async def run_task(task: Task):
+    """Выполняет одну задачу пайплайна по её типу"""
+    task_type = task.type
+
+    try:
+        get_account(task.account)
+    except UnknownAccountError as e:
+        # Канал не известен — не отправляем никуда; записи в БД остаются, и после правки
+        # конфига reconcile_state при запуске вернёт задачу в очередь
+        logger.warning(f"{e}: {task_type} task for post {task.post_id} skipped")
+        await send_admin_alert(f"⚠️ Аккаунта {task.account!r} нет в ACCOUNTS — пост {task.post_id} не отправлен")
+        return
+
+    if task_type == 'download':
+        async with metrics.timer('download'):
+            await process_download_task(task)
+    elif task_type == 'upload':
+        async with metrics.timer('upload'):
+            await process_upload_task(task)
+    elif task_type == 'text':
+        async with metrics.timer('text'):
+            await process_text_task(task)
+    else:
+        logger.warning(f"Unknown task type: {task_type}")
+
+
 async def worker():
-    """Воркер — обрабатывает задачи из очереди"""
+    """Воркер — обрабатывает задачи из очереди (при остановке ожидание очереди отменяет shutdown.drain)"""
     while app_state.running:
-        try:
-            # Получаем задачу с таймаутом
-            task = await asyncio.wait_for(app_state.queue.get(), timeout=10)
-        except asyncio.TimeoutError:
-            continue
+        task = await app_state.queue.get()
 
         try:
-            task_type = task.get('type')
-
-            if task_type == 'download':
-                await process_download_task(task)
-            elif task_type == 'upload':
-                await process_upload_task(task)
-            elif task_type == 'text':
-                await process_text_task(task)
-            else:
-                logger.warning(f"Unknown task type: {task_type}")
-
+            with shutdown.busy(), pipeline.track(task):
+                await run_task(task)
         except Exception as e:
             logger.error(f"Error processing task: {e}")
 
         finally:
-            app_state.queue.task_done()
+            app_state.queue.task_done(task)
+
+
+async def job_worker(kinds: list, owner: str):
+    """Воркер многопроцессного режима — берёт задачи в аренду из таблицы jobs"""
+    while app_state.running:
+        job = await db.claim_job(kinds, owner, JOB_LEASE_SECONDS)
+        if not job:
+            await asyncio.sleep(1)
+            continue
+
+        async def heartbeat():
+            # Продлеваем аренду, пока задача выполняется (загрузки бывают долгими)
+            while True:
+                await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+                if not await db.heartbeat_job(job['job_id'], job['lease_token'], JOB_LEASE_SECONDS):
+                    logger.warning(f"Lost lease on job {job['job_id']}")
+                    return
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            task = Task.from_dict(json.loads(job['payload']))
+            with shutdown.busy(), pipeline.track(task):
+                await run_task(task)
+        except asyncio.CancelledError:
+            # Прервана при остановке — сразу отдаём другим процессам, не дожидаясь конца аренды
+            await db.release_job(job['job_id'], job['lease_token'])
+            raise
+        except Exception as e:
+            logger.error(f"Error processing job {job['job_id']}: {e}")
+        finally:
+            heartbeat_task.cancel()
+
+        await db.finish_job(job['job_id'], job['lease_token'])
+
 
+def start_fetchers() -> list:
+    """По фетчеру на каждый аккаунт"""
+    return [asyncio.create_task(reddit_fetcher(account), name=f"reddit_fetcher_{account.name}")
+            for account in accounts.values()]
 
-async def reddit_fetcher():
-    """Фоновая задача — периодически получает лайки с Реддита"""
+
+async def reddit_fetcher(account: Account = None):
+    """Фоновая задача — получает лайки аккаунта с Реддита с адаптивным интервалом или по /sync"""
+    account = account or get_account()
     while app_state.running:
+        delay = CHECK_INTERVAL
         try:
-            await fetch_reddit_likes()
+            delay = await fetch_reddit_likes(account)
         except Exception as e:
             logger.error(f"Error in reddit fetcher: {e}")
             await send_admin_alert(f"Ошибка в фоновом процессе Реддита: {str(e)[:100]}")
 
-        # Ждём перед следующей попыткой
-        await asyncio.sleep(CHECK_INTERVAL)
+        # Ждём следующего прохода (или команды /sync)
+        if await poller.wait(account.name, delay):
+            logger.info(f"Sync requested for {account.name}")
+
+
+async def pending_tasks() -> int:
+    """Сколько задач ждёт в пайплайне (очередь процесса или таблица jobs)"""
+    if app_state.use_jobs:
+        counts = await db.get_job_counts()
+        return sum(count["queued"] + count["leased"] for count in counts.values())
+    return app_state.queue.qsize()
+
+
+async def backfill_listing(account: Account, listing: str):
+    """Догружает весь листинг аккаунта постранично, сохраняя курсор после каждой страницы"""
+    state = await db.get_backfill_state(account.name, listing)
+    if state and state['done']:
+        logger.info(f"Backfill {account.name}/{listing} already finished")
+        return
+
+    cursor = state['cursor'] if state else None
+    fetched = state['fetched'] if state else 0
+    client = get_reddit_client(account)
+    logger.info(f"Backfill {account.name}/{listing} starting from {cursor or 'the beginning'}")
+
+    while app_state.running:
+        # Подаём историю дозированно, чтобы свежие лайки не ждали за ней в очереди
+        if await pending_tasks() >= BACKFILL_QUEUE_LIMIT:
+            await asyncio.sleep(BACKFILL_PAGE_DELAY)
+            continue
+
+        try:
+            async with metrics.timer('backfill'):
+                posts, next_cursor = await asyncio.to_thread(client.get_listing_page, listing, cursor)
+        except Exception as e:
+            logger.error(f"Error fetching backfill page for {account.name}/{listing}: {e}")
+            await send_admin_alert(f"Ошибка догрузки истории ({account.name}/{listing}): {str(e)[:100]}")
+            await asyncio.sleep(RETRY_CONFIG['initial_delay'])
+            continue
+
+        added, skipped = await ingest_posts(posts, account)
+        await db.record_stats(posts_skipped=skipped)
+
+        # Курсор сдвигаем после записи постов: при обрыве страница повторится, дубли отсеются
+        fetched += len(posts)
+        done = next_cursor is None
+        await db.save_backfill_state(account.name, listing, next_cursor or cursor, fetched, done)
+        logger.info(f"Backfill {account.name}/{listing}: {len(posts)} posts, {added} new tasks, {fetched} total")
+
+        if done:
+            logger.info(f"Backfill {account.name}/{listing} finished, {fetched} posts")
+            await telegram_client.send_admin_message(
+                f"✅ История {account.name}/{listing} догружена: {fetched} постов"
+            )
+            return
+
+        cursor = next_cursor
+        await asyncio.sleep(BACKFILL_PAGE_DELAY)
+
+
+async def backfill_account(account: Account):
+    """Догрузка истории аккаунта по всем листингам из BACKFILL_LISTINGS"""
+    for listing in BACKFILL_LISTINGS:
+        if not app_state.running:
+            return
+        await backfill_listing(account, listing)
+
+
+def start_backfill(names: list) -> list:
+    """Задачи догрузки истории для перечисленных аккаунтов (пустой список — для всех)"""
+    unknown = set(names) - set(accounts)
+    if unknown:
+        logger.warning(f"Unknown accounts for backfill: {', '.join(sorted(unknown))}")
+
+    return [asyncio.create_task(backfill_account(account), name=f"backfill_{account.name}")
+            for account in accounts.values() if not names or account.name in names]
 
 
 async def telegram_polling():
     """Запускает polling для ТГ бота"""
+    from aiogram import Dispatcher
+    from modules.handlers import admin_router
+
     dp = Dispatcher()
     dp.include_router(admin_router)
 
-    bot = Bot(token=TELEGRAM_BOT_TOKEN)
-
+    # Тот же Bot (и HTTP-сессия), через который идут отправки в канал
+    # Сигналы обрабатываем сами (install_signal_handlers), polling останавливается отменой задачи
     logger.info("Starting Telegram bot polling...")
-    await dp.start_polling(bot)
+    await dp.start_polling(telegram_client.bot, handle_signals=False, close_bot_session=False)
+
+
+def install_signal_handlers(stopping=None):
+    """
+    Обработчик сигналов для graceful shutdown (второй сигнал — остановка без ожидания загрузок)
+    stopping — multiprocessing.Event процесса стадии: по нему супервизор видит, что стадия
+    уже получила сигнал (Ctrl+C группе процессов, SIGTERM всей группе от systemd), и не шлёт свой
+    """
+    def handle_signal(sig):
+        app_state.running = False
+        if stopping is not None:
+            stopping.set()
+        shutdown.request(f"Received signal {sig.name}")
+
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGTERM, handle_signal, signal.SIGTERM)
+    loop.add_signal_handler(signal.SIGINT, handle_signal, signal.SIGINT)
 
 
-async def main():
-    """Главная функция"""
+async def startup():
+    """Общая подготовка: логгер, каталоги, клиенты, БД и сверка состояния"""
+    setup_logger()
     logger.info("Reddit Archiver Bot starting...")
 
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Клиенты создаются здесь, а не при импорте модулей (импорт aiogram блокирует loop)
+    telegram_client.bot
+
     # Инициализируем БД
     await db.init()
+    await reconcile_state()
+    if not app_state.use_jobs:
+        await restore_tasks()
+
+
+async def checkpoint_tasks():
+    """
+    Однопроцессный режим, остановка: задачи, до которых не дошли воркеры (очередь и отложенные),
+    сохраняются в jobs; при старте их вернёт restore_tasks. Прерванные посреди работы задачи
+    там не нужны — их по вложениям и постам восстановит reconcile_state
+    """
+    tasks = app_state.queue.take_all()
+    for handle, task in app_state.parked_tasks.values():
+        handle.cancel()
+        tasks.append(task)
+    app_state.parked_tasks.clear()
+
+    if tasks:
+        await db.enqueue_jobs([task.to_dict() for task in tasks])
+    logger.info(f"Checkpointed {len(tasks)} queued tasks")
+
+
+async def restore_tasks():
+    """Возвращает в очередь задачи, сохранённые checkpoint_tasks при прошлой остановке"""
+    # Только задачи пайплайна: запросы /sync ("sync") у них без post_id и разбираются фетчером
+    tasks = await db.take_jobs(["download", "upload", "text"])
+    for task in tasks:
+        await app_state.queue.put(Task.from_dict(task))
+    if tasks:
+        logger.info(f"Restored {len(tasks)} tasks from the last shutdown")
+
+
+async def close_resources():
+    """Закрывает HTTP-сессии, ботов и журнал БД"""
+    await file_manager.close()
+    await media_resolver.close()
+    await telegram_client.close()
+    await db.close()
+
+
+async def main(backfill: list = None):
+    """Главная функция; backfill — аккаунты, историю которых догрузить параллельно с обычной работой"""
+    await startup()
+    pipeline.attach(app_state.queue, app_state.parked_tasks)
+
+    # Создаём задачи: polling и фетчеры аккаунтов останавливаются отменой
+    background = [asyncio.create_task(telegram_polling(), name="telegram_polling"),
+                  asyncio.create_task(loop_monitor.run(), name="loop_monitor")]
+    background += start_fetchers()
+    if backfill is not None:
+        # Курсор сохранён после каждой страницы — отмена при остановке безопасна
+        background += start_backfill(backfill)
+    if DIGEST_ENABLED:
+        background.append(asyncio.create_task(text_digest.run(), name="text_digest"))
+    background.append(asyncio.create_task(maintenance.run(), name="maintenance"))
+    if BACKUP_INTERVAL:
+        background.append(asyncio.create_task(backup.run(), name="backup"))
+
+    # Добавляем воркеры (общие для всех аккаунтов)
+    workers = [asyncio.create_task(worker(), name=f"worker_{i}") for i in range(THREAD_COUNT)]
+
+    install_signal_handlers()
 
-    # Создаём задачи
-    tasks = [
-        asyncio.create_task(telegram_polling(), name="telegram_polling"),
-        asyncio.create_task(reddit_fetcher(), name="reddit_fetcher"),
-    ]
+    try:
+        await shutdown.requested.wait()
+    finally:
+        app_state.running = False
+        # Приём (polling, фетчеры, догрузка) останавливаем сразу, начатые загрузки доделываются за grace
+        await shutdown.drain(background, workers + list(app_state.parked))
+        # Недособранный дайджест отправляем сразу, а не ждём DIGEST_MAX_DELAY
+        if not shutdown.forced:
+            await text_digest.flush()
+        await checkpoint_tasks()
+        await close_resources()
+        logger.info("Bot stopped")
 
-    # Добавляем воркеры
-    for i in range(THREAD_COUNT):
-        tasks.append(asyncio.create_task(worker(), name=f"worker_{i}"))
 
-    # Обработчик сигналов для graceful shutdown
-    def handle_signal(sig):
-        logger.info(f"Received signal {sig}. Shutting down...")
-        app_state.running = False
+# ===== МНОГОПРОЦЕССНЫЙ РЕЖИМ =====
+# Стадия -> типы задач из jobs, которые она выполняет (None — фетчер Реддита)
+STAGES = {
+    "fetcher": None,
+    "download": ["download"],
+    "upload": ["upload", "text"],
+}
+
+
+async def run_stage(stage: str, stopping=None):
+    """Один процесс стадии: фетчер или пул воркеров над таблицей jobs"""
+    app_state.use_jobs = True
+    setup_logger()
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    telegram_client.bot
+
+    owner = f"{stage}:{os.getpid()}"
+    logger.info(f"Stage {owner} starting...")
+
+    intake, tasks = [asyncio.create_task(loop_monitor.run(), name="loop_monitor")], []
+    if STAGES[stage] is None:
+        # Запросы /sync приходят от супервизора через jobs
+        poller.shared = True
+        intake += start_fetchers()
+        intake.append(asyncio.create_task(poller.watch_requests(), name="sync_requests"))
+    else:
+        tasks = [asyncio.create_task(job_worker(STAGES[stage], owner), name=f"{stage}_{i}")
+                 for i in range(THREAD_COUNT)]
+    digest_task = None
+    if DIGEST_ENABLED and "text" in (STAGES[stage] or []):
+        digest_task = asyncio.create_task(text_digest.run(), name="text_digest")
+
+    install_signal_handlers(stopping)
 
-    loop = asyncio.get_event_loop()
-    loop.add_signal_handler(signal.SIGTERM, handle_signal, signal.SIGTERM)
-    loop.add_signal_handler(signal.SIGINT, handle_signal, signal.SIGINT)
+    try:
+        while app_state.running and not all(task.done() for task in intake + tasks):
+            await asyncio.sleep(0.5)
+    finally:
+        app_state.running = False
+        # Прерванные задачи job_worker возвращает в jobs, отложенные там и лежат
+        await shutdown.drain(intake, tasks + list(app_state.parked))
+        if digest_task:
+            digest_task.cancel()
+            if not shutdown.forced:
+                await text_digest.flush()
+        await close_resources()
+        logger.info(f"Stage {owner} stopped")
+
+
+def run_stage_process(stage: str, stopping=None):
+    """Точка входа дочернего процесса"""
+    asyncio.run(run_stage(stage, stopping))
+
+
+async def main_multiprocess():
+    """
+    Супервизор: готовит БД, запускает процессы стадий (фетчер, загрузчики, отправщики),
+    перезапускает упавшие и обслуживает команды бота
+    """
+    app_state.use_jobs = True
+    poller.shared = True
+    await startup()
+
+    context = multiprocessing.get_context("spawn")
+    wanted = [("fetcher", 0)]
+    wanted += [("download", i) for i in range(DOWNLOAD_PROCESSES)]
+    wanted += [("upload", i) for i in range(UPLOAD_PROCESSES)]
+    processes = {}
+    # Стадия уже останавливается по своему сигналу
+    stopping = {}
+
+    def spawn(stage: str, index: int):
+        stopping[(stage, index)] = context.Event()
+        process = context.Process(target=run_stage_process, args=(stage, stopping[(stage, index)]),
+                                  name=f"{stage}_{index}")
+        process.start()
+        processes[(stage, index)] = process
+        logger.info(f"Started {stage}_{index} (pid {process.pid})")
+
+    for stage, index in wanted:
+        spawn(stage, index)
+
+    polling = asyncio.create_task(telegram_polling(), name="telegram_polling")
+    # Обслуживание и копии БД — в супервизоре, ему же /status показывает отчёты
+    housekeeping = [asyncio.create_task(maintenance.run(), name="maintenance"),
+                    asyncio.create_task(loop_monitor.run(), name="loop_monitor")]
+    if BACKUP_INTERVAL:
+        housekeeping.append(asyncio.create_task(backup.run(), name="backup"))
+    install_signal_handlers()
 
     try:
-        await asyncio.gather(*tasks)
-    except KeyboardInterrupt:
-        logger.info("Bot interrupted by user")
+        while app_state.running:
+            await asyncio.sleep(5)
+            for key, process in list(processes.items()):
+                if not process.is_alive() and app_state.running:
+                    # Аренда задач умершего процесса истечёт, и их заберут другие
+                    logger.warning(f"{process.name} exited with code {process.exitcode}, restarting")
+                    await send_admin_alert(f"Процесс {process.name} упал (код {process.exitcode}), перезапускаю")
+                    spawn(*key)
     finally:
         app_state.running = False
+        # Стадиям, которые сигнал уже получили, второй не шлём: для них он означал бы
+        # остановку без ожидания загрузок
+        for key, process in processes.items():
+            if process.is_alive() and not stopping[key].is_set():
+                process.terminate()
+        # Стадии доделывают начатые загрузки за SHUTDOWN_GRACE_SECONDS;
+        # второй сигнал оператора супервизору передаётся им как второй сигнал
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SHUTDOWN_GRACE_SECONDS + 10
+        forwarded = False
+        while any(process.is_alive() for process in processes.values()) and loop.time() < deadline:
+            if shutdown.forced and not forwarded:
+                for process in processes.values():
+                    if process.is_alive():
+                        process.terminate()
+                forwarded = True
+            await asyncio.sleep(0.2)
+        for task in [polling] + housekeeping:
+            task.cancel()
+        await asyncio.gather(polling, *housekeeping, return_exceptions=True)
+        await close_resources()
         logger.info("Bot stopped")
 
 
+async def run_backfill(names: list):
+    """
+    Догрузка истории в многопроцессном режиме: отдельный процесс подаёт задачи в jobs
+    работающему пайплайну и завершается, когда листинги пройдены
+    """
+    app_state.use_jobs = True
+    setup_logger()
+    telegram_client.bot
+    await db.init()
+
+    tasks = start_backfill(names)
+    install_signal_handlers()
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await close_resources()
+        logger.info("Backfill stopped")
+
+
+async def export(args: list) -> int:
+    """Выгрузка архива для аналитики (для `main.py --export [каталог] [--format parquet] [--full]`)"""
+    from config import EXPORT_DIR
+    from modules.exporter import Exporter
+
+    position = args.index("--export") + 1
+    out_dir = args[position] if position < len(args) and not args[position].startswith("--") else EXPORT_DIR
+    fmt = args[args.index("--format") + 1] if "--format" in args else "jsonl"
+
+    counts = await Exporter(out_dir, fmt).export(full="--full" in args)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    return 0
+
+
+async def check() -> int:
+    """Проверка конфига и БД без запуска бота (для `main.py --check`)"""
+    from modules.checks import run_checks
+
+    problems = await run_checks()
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print("✅ Конфиг и БД в порядке")
+    return 1 if problems else 0
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = sys.argv[1:]
+    if "--check" in args:
+        sys.exit(asyncio.run(check()))
+    if "--export" in args:
+        sys.exit(asyncio.run(export(args)))
+    if "--backfill" in args:
+        # --backfill [аккаунт ...] — догрузка всей истории лайков и сохранённого
+        names = list(itertools.takewhile(lambda arg: not arg.startswith("--"),
+                                         args[args.index("--backfill") + 1:]))
+        if PIPELINE_MODE == "multiprocess":
+            asyncio.run(run_backfill(names))
+        else:
+            asyncio.run(main(backfill=names))
+    elif "--stage" in args:
+        # Отдельный процесс одной стадии (можно перезапускать независимо)
+        run_stage_process(args[args.index("--stage") + 1])
+    elif PIPELINE_MODE == "multiprocess":
+        asyncio.run(main_multiprocess())
+    else:
+        asyncio.run(main())
@@ -0,0 +1,65 @@
+from config import ACCOUNTS, REDDIT_USERNAME, REDDIT_PASSWORD, TELEGRAM_CHANNEL_ID, MAX_QUALITY
+
+DEFAULT_ACCOUNT = "default"
+
+
+class UnknownAccountError(Exception):
+    """Аккаунта нет в ACCOUNTS (опечатка или удалён из конфига) — канал для него не известен"""
+
+
+class Account:
+    """Аккаунт Реддита и канал, в который архивируются его лайки"""
+
+    def __init__(self, name: str, channel_id: int,
+                 reddit_username: str = None, reddit_password: str = None, max_quality: bool = MAX_QUALITY):
+        self.name = name
+        self.channel_id = channel_id
+        self.reddit_username = reddit_username
+        self.reddit_password = reddit_password
+        # Архивировать исходники, а не варианты под размеры ТГ (см. RenditionSelector)
+        self.max_quality = max_quality
+
+    def __repr__(self):
+        return f"Account({self.name!r}, channel={self.channel_id})"
+
+
+def load_accounts() -> dict:
+    """
+    Аккаунты из конфига: ACCOUNTS, а если он пуст — один аккаунт
+    из REDDIT_USERNAME/REDDIT_PASSWORD и TELEGRAM_CHANNEL_ID
+    """
+    if not ACCOUNTS:
+        return {DEFAULT_ACCOUNT: Account(DEFAULT_ACCOUNT, TELEGRAM_CHANNEL_ID,
+                                         REDDIT_USERNAME, REDDIT_PASSWORD)}
+
+    loaded = {}
+    for item in ACCOUNTS:
+        # Без явного канала лайки ушли бы в чужой канал — ошибку конфига показываем при запуске
+        if not item.get("name") or not item.get("channel_id"):
+            raise ValueError(f"ACCOUNTS entry needs both name and channel_id: {item.get('name')!r}")
+        if item["name"] in loaded:
+            raise ValueError(f"Duplicate account name in ACCOUNTS: {item['name']!r}")
+        loaded[item["name"]] = Account(
+            item["name"],
+            item["channel_id"],
+            item.get("reddit_username"),
+            item.get("reddit_password"),
+            item.get("max_quality", MAX_QUALITY),
+        )
+    return loaded
+
+
+accounts = load_accounts()
+
+
+def get_account(name: str = None) -> Account:
+    """
+    Аккаунт по имени; задачи и посты без аккаунта (старые версии, "default") относятся к первому
+    Неизвестное имя — UnknownAccountError, а не первый канал: опечатка в конфиге не должна
+    отправлять лайки в чужой канал
+    """
+    if name in accounts:
+        return accounts[name]
+    if name is None or name == DEFAULT_ACCOUNT:
+        return next(iter(accounts.values()))
+    raise UnknownAccountError(f"Account {name!r} is not in ACCOUNTS")
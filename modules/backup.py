@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from config import (
+    BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, BACKUP_COMPRESS,
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE, BACKUP_MAX_RESTARTS
+)
+from modules.database import db
+from modules.logger import logger
+from modules.utils import format_file_size
+
+PREFIX = "archive-"
+
+
+def _check_copy(path: Path):
+    """quick_check копии: битую копию не храним"""
+    # with у соединения sqlite3 — только транзакция, закрывает его closing
+    with closing(sqlite3.connect(path)) as copy:
+        result = copy.execute("PRAGMA quick_check").fetchone()[0]
+    if result != "ok":
+        raise RuntimeError(f"backup copy failed quick_check: {result}")
+
+
+def _compress(source: Path, target: Path):
+    with open(source, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+class Backup:
+    """
+    Резервные копии archive.db без остановки бота: backup API SQLite по BACKUP_PAGES_PER_STEP
+    страниц за шаг (копирование, проверка и сжатие идут в asyncio.to_thread — event loop
+    и воркеры не ждут),
+    проверка копии, сжатие gzip и ротация — хранятся BACKUP_KEEP последних
+    По расписанию раз в BACKUP_INTERVAL и по команде /backup
+    """
+
+    def __init__(self, backup_dir: Path = BACKUP_DIR, keep: int = BACKUP_KEEP):
+        self.backup_dir = Path(backup_dir)
+        self.keep = keep
+        self.last_result = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self):
+        """Фоновая задача (если задан BACKUP_INTERVAL)"""
+        while True:
+            await asyncio.sleep(BACKUP_INTERVAL)
+            try:
+                await self.create()
+            except Exception as e:
+                logger.error(f"Backup failed: {e}")
+
+    async def create(self) -> dict:
+        """Снимает копию; возвращает {"path", "size", "duration", "restarts"}"""
+        async with self._lock:
+            started = time.monotonic()
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{PREFIX}{datetime.now():%Y%m%d-%H%M%S}.db"
+            part = self.backup_dir / f"{name}.part"
+            path = self.backup_dir / (f"{name}.gz" if BACKUP_COMPRESS else name)
+
+            try:
+                restarts = await db.backup_to(part, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE, BACKUP_MAX_RESTARTS)
+                await asyncio.to_thread(_check_copy, part)
+                if BACKUP_COMPRESS:
+                    compressed = part.with_suffix(".gz.part")
+                    await asyncio.to_thread(_compress, part, compressed)
+                    part.unlink()
+                    part = compressed
+                # Готовая копия появляется под своим именем целиком
+                part.rename(path)
+            finally:
+                for leftover in self.backup_dir.glob(f"{name}*.part*"):
+                    leftover.unlink(missing_ok=True)
+
+            self.rotate()
+            result = {
+                "path": path,
+                "size": path.stat().st_size,
+                "duration": time.monotonic() - started,
+                "restarts": restarts,
+                "finished_at": time.time(),
+            }
+            self.last_result = result
+            logger.info(f"Backup {path.name} created: {format_file_size(result['size'])} "
+                        f"in {result['duration']:.1f}s")
+            return result
+
+    def rotate(self):
+        """Удаляет копии сверх keep (самые старые)"""
+        backups = sorted(path for pattern in (f"{PREFIX}*.db", f"{PREFIX}*.db.gz")
+                         for path in self.backup_dir.glob(pattern))
+        for old in backups[:-self.keep] if self.keep else []:
+            old.unlink(missing_ok=True)
+            logger.info(f"Old backup {old.name} removed")
+
+
+backup = Backup()
@@ -0,0 +1,66 @@
+import os
+import re
+import aiosqlite
+import config
+
+# Значения-заглушки из config.example.py
+PLACEHOLDERS = {"your_reddit_client_id", "your_reddit_client_secret", "your_telegram_bot_token"}
+
+REQUIRED_TABLES = {"posts", "attachments", "telegram_messages", "disk_usage", "stats"}
+
+
+def check_config() -> list:
+    """Проверяет конфиг без сети и тяжёлых импортов, возвращает список проблем"""
+    problems = []
+
+    for name in ("REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT", "TELEGRAM_BOT_TOKEN"):
+        value = getattr(config, name, None)
+        if not value or value in PLACEHOLDERS:
+            problems.append(f"{name} не задан")
+
+    token = getattr(config, "TELEGRAM_BOT_TOKEN", "")
+    if token and token not in PLACEHOLDERS and not re.fullmatch(r"\d+:[\w-]+", token):
+        problems.append("TELEGRAM_BOT_TOKEN не похож на токен бота (<id>:<secret>)")
+
+    for name in ("TELEGRAM_CHANNEL_ID", "TELEGRAM_ADMIN_ID", "THREAD_COUNT", "CHECK_INTERVAL",
+                 "MAX_DISK_USAGE_BYTES", "MAX_FILE_SIZE_BYTES"):
+        if not isinstance(getattr(config, name, None), int):
+            problems.append(f"{name} должен быть целым числом")
+
+    if isinstance(getattr(config, "THREAD_COUNT", None), int) and config.THREAD_COUNT < 1:
+        problems.append("THREAD_COUNT должен быть >= 1")
+
+    for key in ("max_retries", "alert_after_retry", "initial_delay", "backoff_multiplier"):
+        if key not in getattr(config, "RETRY_CONFIG", {}):
+            problems.append(f"RETRY_CONFIG['{key}'] не задан")
+
+    for name in ("TEMP_DIR", "LOG_DIR"):
+        path = getattr(config, name)
+        parent = path if path.exists() else path.parent
+        if not os.access(parent, os.W_OK):
+            problems.append(f"{name} ({path}) недоступен для записи")
+
+    return problems
+
+
+async def check_database() -> list:
+    """Открывает БД и проверяет схему (без полного обхода страниц), возвращает список проблем"""
+    path = config.DATABASE_PATH
+    if not path.exists():
+        # Будет создана при первом запуске
+        return [] if os.access(path.parent, os.W_OK) else [f"Нет доступа на запись к {path.parent}"]
+
+    try:
+        async with aiosqlite.connect(f"file:{path}?mode=ro", uri=True) as db:
+            cursor = await db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            tables = {row[0] for row in await cursor.fetchall()}
+    except Exception as e:
+        return [f"Не удалось открыть БД {path}: {e}"]
+
+    missing = REQUIRED_TABLES - tables
+    return [f"В БД нет таблиц: {', '.join(sorted(missing))}"] if missing else []
+
+
+async def run_checks() -> list:
+    """Все проверки для `main.py --check`"""
+    return check_config() + await check_database()
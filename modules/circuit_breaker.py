@@ -0,0 +1,108 @@
+import time
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+from modules.logger import logger
+from modules.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Цепь хоста разомкнута — запрос не выполнялся, задачу нужно отложить на retry_in секунд"""
+
+    def __init__(self, breaker: "CircuitBreaker"):
+        self.name = breaker.name
+        self.retry_in = breaker.retry_in()
+        super().__init__(f"Circuit for {self.name} is open, retry in {self.retry_in:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для одного хоста или эндпоинта:
+    после failure_threshold неудач подряд размыкается и сразу отказывает,
+    через reset_timeout пропускает один пробный запрос (half-open);
+    успех пробы замыкает цепь, неудача — размыкает снова
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        """Через сколько секунд цепь пропустит пробный запрос"""
+        return max(1.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def available(self) -> bool:
+        """Пропустит ли цепь запрос сейчас (без захвата пробы)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() >= self.opened_at + self.reset_timeout
+        return not self._probe_in_flight
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос; в half-open пропускает только один пробный"""
+        if self.state == CLOSED:
+            return True
+        if not self.available():
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+            logger.info(f"Circuit for {self.name} half-open, probing")
+        self._probe_in_flight = True
+        return True
+
+    def check(self):
+        """allow() или CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(self)
+
+    def end_probe(self):
+        """Снимает захват пробы, если запрос кончился без вердикта о хосте (отмена, ошибка на нашей стороне)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            if self.state == CLOSED:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                metrics.inc('circuit_opened')
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class CircuitBreakers:
+    """Предохранители процесса по имени (хост CDN или эндпоинт Telegram)"""
+
+    def __init__(self):
+        self._breakers = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(name)
+        return self._breakers[name]
+
+    def snapshot(self) -> dict:
+        """{имя: (состояние, неудач подряд, секунд до пробы)} для /status"""
+        return {
+            name: (breaker.state, breaker.failures, breaker.retry_in() if breaker.state != CLOSED else 0)
+            for name, breaker in self._breakers.items()
+        }
+
+
+breakers = CircuitBreakers()
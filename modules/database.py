@@ -1,9 +1,19 @@
 import aiosqlite
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import closing
 from datetime import datetime, timedelta
 from config import DATABASE_PATH
 from modules.logger import logger
 
 
+class BackupRestarted(Exception):
+    """Копирование слишком часто начиналось заново из-за записи в базу"""
+
+
 class Database:
     def __init__(self):
         self.db_path = DATABASE_PATH
@@ -11,13 +21,28 @@ class Database:
     async def init(self):
         """Инициализирует БД и создаёт таблицы"""
         async with aiosqlite.connect(self.db_path) as db:
+            # Освобождённые страницы возвращаются по частям (incremental_vacuum в обслуживании);
+            # действует только для новой базы — существующей нужен разовый VACUUM
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            if (await cursor.fetchone())[0] != 2:
+                logger.warning("auto_vacuum is off for this database: maintenance cannot return free pages "
+                               "until a one-time VACUUM (MAINTENANCE_VACUUM_CONVERT = True, "
+                               "or VACUUM with the bot stopped)")
+            # WAL: читатели не блокируют писателя (несколько процессов пайплайна)
+            await db.execute("PRAGMA journal_mode = WAL")
             await db.executescript("""
                                    CREATE TABLE IF NOT EXISTS posts
                                    (
-                                       reddit_post_id
-                                       TEXT
+                                       id
+                                       INTEGER
                                        PRIMARY
                                        KEY,
+                                       reddit_post_id
+                                       TEXT
+                                       NOT
+                                       NULL
+                                       UNIQUE,
                                        reddit_user
                                        TEXT,
                                        title
@@ -46,7 +71,8 @@ class Database:
                                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                                        error_message TEXT,
-                                       fetched_at TIMESTAMP
+                                       fetched_at TIMESTAMP,
+                                       account TEXT DEFAULT 'default'
                                        );
 
                                    CREATE TABLE IF NOT EXISTS attachments
@@ -91,6 +117,8 @@ class Database:
                                        last_retry_attempt TIMESTAMP,
                                        first_retry_at TIMESTAMP,
                                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                       updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                       fallback_url TEXT,
                                        FOREIGN KEY
                                    (
                                        reddit_post_id
@@ -104,8 +132,8 @@ class Database:
                                    (
                                        message_id
                                        INTEGER
-                                       PRIMARY
-                                       KEY,
+                                       NOT
+                                       NULL,
                                        reddit_post_id
                                        TEXT
                                        NOT
@@ -126,6 +154,7 @@ class Database:
                                        'failed'
                                    )),
                                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                       PRIMARY KEY (telegram_chat_id, message_id, reddit_post_id),
                                        FOREIGN KEY
                                    (
                                        reddit_post_id
@@ -187,23 +216,177 @@ class Database:
 
                                    INSERT
                                    OR IGNORE INTO disk_usage (total_bytes) VALUES (0);
+
+                                   CREATE TABLE IF NOT EXISTS jobs
+                                   (
+                                       job_id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       kind             TEXT NOT NULL,
+                                       reddit_post_id   TEXT NOT NULL,
+                                       payload          TEXT NOT NULL,
+                                       available_at     REAL NOT NULL,
+                                       lease_token      TEXT,
+                                       lease_owner      TEXT,
+                                       lease_expires_at REAL,
+                                       attempts         INTEGER DEFAULT 0,
+                                       created_at       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                                   );
+
+                                   CREATE TABLE IF NOT EXISTS backfill_state
+                                   (
+                                       account    TEXT NOT NULL,
+                                       listing    TEXT NOT NULL,
+                                       cursor     TEXT,
+                                       fetched    INTEGER DEFAULT 0,
+                                       done       INTEGER DEFAULT 0,
+                                       updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                       PRIMARY KEY (account, listing)
+                                   );
+
+                                   CREATE TABLE IF NOT EXISTS resolved_urls
+                                   (
+                                       url        TEXT PRIMARY KEY,
+                                       media      TEXT NOT NULL,
+                                       expires_at REAL NOT NULL
+                                   );
+
+                                   CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (kind, available_at);
+                                   CREATE INDEX IF NOT EXISTS idx_jobs_post ON jobs (reddit_post_id);
+                                   CREATE INDEX IF NOT EXISTS idx_posts_status ON posts (status);
+                                   CREATE INDEX IF NOT EXISTS idx_attachments_post ON attachments (reddit_post_id);
+                                   CREATE INDEX IF NOT EXISTS idx_attachments_status ON attachments (status);
+                                   CREATE INDEX IF NOT EXISTS idx_telegram_messages_post
+                                       ON telegram_messages (reddit_post_id);
+                                   CREATE INDEX IF NOT EXISTS idx_posts_updated ON posts (updated_at);
+                                   CREATE INDEX IF NOT EXISTS idx_telegram_messages_created
+                                       ON telegram_messages (created_at);
+                                   CREATE INDEX IF NOT EXISTS idx_stats_recorded ON stats (recorded_at);
                                    """)
+            await self._migrate(db)
             await db.commit()
 
         logger.info("Database initialized")
 
+    async def _migrate(self, db):
+        """Докатывает колонки, которых нет в базах, созданных старыми версиями"""
+        cursor = await db.execute("PRAGMA table_info(attachments)")
+        columns = {row[1] for row in await cursor.fetchall()}
+        if "updated_at" not in columns:
+            await db.execute("ALTER TABLE attachments ADD COLUMN updated_at TIMESTAMP")
+            await db.execute("UPDATE attachments SET updated_at = created_at WHERE updated_at IS NULL")
+        # После колонки: в базах старых версий её нет, и индекс в init() уронил бы запуск
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_attachments_updated ON attachments (updated_at)")
+        if "fallback_url" not in columns:
+            await db.execute("ALTER TABLE attachments ADD COLUMN fallback_url TEXT")
+
+        cursor = await db.execute("PRAGMA table_info(posts)")
+        columns = {row[1] for row in await cursor.fetchall()}
+        if "account" not in columns:
+            await db.execute("ALTER TABLE posts ADD COLUMN account TEXT DEFAULT 'default'")
+            columns.add("account")
+
+        # Постоянный id поста для индекса поиска: неявный rowid VACUUM может перенумеровать,
+        # и поиск молча вернул бы чужие посты. Индекс пересобирается ниже по новым id
+        if "id" not in columns:
+            names = ", ".join(sorted(columns))
+            await db.executescript(f"""
+                CREATE TABLE posts_new
+                (
+                    id             INTEGER PRIMARY KEY,
+                    reddit_post_id TEXT NOT NULL UNIQUE,
+                    reddit_user    TEXT,
+                    title          TEXT,
+                    content        TEXT,
+                    source_url     TEXT,
+                    status         TEXT CHECK (status IN ('fetched', 'downloaded', 'uploaded', 'deleted',
+                                                          'skipped_deleted', 'skipped_size_exceeded',
+                                                          'download_failed', 'telegram_failed', 'failed')),
+                    retry_count    INTEGER DEFAULT 0,
+                    created_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    error_message  TEXT,
+                    fetched_at     TIMESTAMP,
+                    account        TEXT DEFAULT 'default'
+                );
+                INSERT INTO posts_new (id, {names}) SELECT rowid, {names} FROM posts;
+                -- Не RENAME старой таблицы: ссылки attachments/telegram_messages переписались бы на неё
+                DROP TABLE posts;
+                ALTER TABLE posts_new RENAME TO posts;
+                CREATE INDEX IF NOT EXISTS idx_posts_status ON posts (status);
+                CREATE INDEX IF NOT EXISTS idx_posts_updated ON posts (updated_at);
+                DROP TABLE IF EXISTS posts_fts;
+            """)
+            logger.info("Posts table rebuilt with a stable id")
+
+        # Полнотекстовый индекс (rowid = posts.id); для существующей базы заполняется один раз
+        # из posts/attachments
+        cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'")
+        if not await cursor.fetchone():
+            await db.executescript("""
+                CREATE VIRTUAL TABLE posts_fts USING fts5(
+                    title, content, author, captions,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                );
+                -- rank = bm25 с весами колонок: заголовок важнее текста и подписей
+                INSERT INTO posts_fts (posts_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 2.0, 2.0)');
+                INSERT INTO posts_fts (rowid, title, content, author, captions)
+                SELECT p.id, p.title, p.content, p.reddit_user,
+                       (SELECT group_concat(a.caption, ' ')
+                        FROM attachments a
+                        WHERE a.reddit_post_id = p.reddit_post_id)
+                FROM posts p;
+            """)
+            logger.info("Full-text index built")
+
+        # message_id уникален только внутри чата (несколько каналов),
+        # а одно сообщение-дайджест относится к нескольким постам
+        cursor = await db.execute("PRAGMA table_info(telegram_messages)")
+        primary_key = [row[1] for row in sorted(await cursor.fetchall(), key=lambda r: r[5]) if row[5]]
+        if primary_key != ["telegram_chat_id", "message_id", "reddit_post_id"]:
+            await db.executescript("""
+                ALTER TABLE telegram_messages RENAME TO telegram_messages_old;
+                CREATE TABLE telegram_messages
+                (
+                    message_id       INTEGER NOT NULL,
+                    reddit_post_id   TEXT    NOT NULL,
+                    telegram_chat_id INTEGER NOT NULL,
+                    message_type     TEXT,
+                    status           TEXT CHECK (status IN ('sent', 'failed')),
+                    created_at       TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (telegram_chat_id, message_id, reddit_post_id),
+                    FOREIGN KEY (reddit_post_id) REFERENCES posts (reddit_post_id)
+                );
+                INSERT INTO telegram_messages SELECT * FROM telegram_messages_old;
+                DROP TABLE telegram_messages_old;
+                CREATE INDEX IF NOT EXISTS idx_telegram_messages_post ON telegram_messages (reddit_post_id);
+                CREATE INDEX IF NOT EXISTS idx_telegram_messages_created ON telegram_messages (created_at);
+            """)
+
+    async def close(self):
+        """
+        Перед выходом переносит журнал WAL в основной файл и обрезает его:
+        следующий старт не разбирает накопленный журнал
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
     # ===== POSTS =====
     async def add_post(self, reddit_post_id: str, reddit_user: str, title: str,
-                       content: str, source_url: str):
+                       content: str, source_url: str, account: str = 'default'):
         """Добавляет пост в БД"""
         async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
+            cursor = await db.execute(
                 """INSERT
                 OR IGNORE INTO posts 
-                (reddit_post_id, reddit_user, title, content, source_url, status, fetched_at)
-                VALUES (?, ?, ?, ?, ?, 'fetched', ?)""",
-                (reddit_post_id, reddit_user, title, content, source_url, datetime.now())
+                (reddit_post_id, reddit_user, title, content, source_url, status, fetched_at, account)
+                VALUES (?, ?, ?, ?, ?, 'fetched', ?, ?)""",
+                (reddit_post_id, reddit_user, title, content, source_url, datetime.now(), account)
             )
+            if cursor.rowcount:
+                # Индекс поиска в той же транзакции; rowid индекса — id поста
+                await db.execute(
+                    "INSERT INTO posts_fts (rowid, title, content, author) VALUES (?, ?, ?, ?)",
+                    (cursor.lastrowid, title, content, reddit_user)
+                )
             await db.commit()
 
     async def get_post(self, reddit_post_id: str):
@@ -215,16 +398,35 @@ class Database:
             )
             return await cursor.fetchone()
 
+    async def get_post_text(self, reddit_post_id: str):
+        """Заголовок, текст и ссылка поста (для отправки в ТГ)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                "SELECT reddit_post_id, title, content, source_url FROM posts WHERE reddit_post_id = ?",
+                (reddit_post_id,)
+            )
+            return await cursor.fetchone()
+
+    async def get_post_owner(self, reddit_post_id: str):
+        """Возвращает (account, status) поста или None"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT account, status FROM posts WHERE reddit_post_id = ?",
+                (reddit_post_id,)
+            )
+            return await cursor.fetchone()
+
     async def update_post_status(self, reddit_post_id: str, status: str, error_msg: str = None):
         """Обновляет статус поста"""
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute(
                 """UPDATE posts
                    SET status        = ?,
-                       updated_at    = ?,
+                       updated_at    = CURRENT_TIMESTAMP,
                        error_message = ?
                    WHERE reddit_post_id = ?""",
-                (status, datetime.now(), error_msg, reddit_post_id)
+                (status, error_msg, reddit_post_id)
             )
             await db.commit()
 
@@ -239,9 +441,97 @@ class Database:
                    VALUES (?, ?, ?, ?, ?, 'pending')""",
                 (reddit_post_id, file_url, file_type, file_size, caption)
             )
+            if caption:
+                await db.execute(
+                    """UPDATE posts_fts
+                       SET captions = trim(coalesce(captions, '') || ' ' || ?)
+                       WHERE rowid = (SELECT id FROM posts WHERE reddit_post_id = ?)""",
+                    (caption, reddit_post_id)
+                )
             await db.commit()
             return cursor.lastrowid
 
+    async def add_attachments(self, reddit_post_id: str, media_list: list) -> list:
+        """Добавляет вложения поста одной транзакцией (при получении поста), возвращает их id"""
+        attachment_ids = []
+        async with aiosqlite.connect(self.db_path) as db:
+            for media in media_list:
+                cursor = await db.execute(
+                    """INSERT INTO attachments
+                           (reddit_post_id, file_url, file_type, file_size_bytes, caption, status, fallback_url)
+                       VALUES (?, ?, ?, ?, ?, 'pending', ?)""",
+                    (reddit_post_id, media['url'], media['type'], media.get('file_size', 0) or 0,
+                     media.get('caption'), media.get('fallback_url'))
+                )
+                attachment_ids.append(cursor.lastrowid)
+
+            captions = " ".join(media['caption'] for media in media_list if media.get('caption'))
+            if captions:
+                await db.execute(
+                    """UPDATE posts_fts
+                       SET captions = trim(coalesce(captions, '') || ' ' || ?)
+                       WHERE rowid = (SELECT id FROM posts WHERE reddit_post_id = ?)""",
+                    (captions, reddit_post_id)
+                )
+            await db.commit()
+        return attachment_ids
+
+    async def use_fallback_url(self, attachment_id: int):
+        """Вложение дальше качается по запасной ссылке (выбранного варианта у хостинга нет)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                """UPDATE attachments
+                   SET file_url     = fallback_url,
+                       fallback_url = NULL,
+                       updated_at   = CURRENT_TIMESTAMP
+                   WHERE attachment_id = ?
+                     AND fallback_url IS NOT NULL""",
+                (attachment_id,)
+            )
+            await db.commit()
+
+    async def expand_attachment(self, attachment_id: int, media_list: list) -> list:
+        """
+        Вложение-ссылка после разбора: первый файл — в это же вложение, остальные — новыми
+        вложениями того же поста (одной транзакцией). Возвращает id добавленных
+        """
+        first, rest = media_list[0], media_list[1:]
+        attachment_ids = []
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT reddit_post_id FROM attachments WHERE attachment_id = ?",
+                                      (attachment_id,))
+            reddit_post_id = (await cursor.fetchone())[0]
+            await db.execute(
+                """UPDATE attachments
+                   SET file_url        = ?,
+                       file_type       = ?,
+                       file_size_bytes = ?,
+                       caption         = coalesce(?, caption),
+                       updated_at      = CURRENT_TIMESTAMP
+                   WHERE attachment_id = ?""",
+                (first['url'], first['type'], first.get('file_size', 0) or 0, first.get('caption'), attachment_id)
+            )
+            for media in rest:
+                cursor = await db.execute(
+                    """INSERT INTO attachments
+                           (reddit_post_id, file_url, file_type, file_size_bytes, caption, status)
+                       VALUES (?, ?, ?, ?, ?, 'pending')""",
+                    (reddit_post_id, media['url'], media['type'], media.get('file_size', 0) or 0,
+                     media.get('caption'))
+                )
+                attachment_ids.append(cursor.lastrowid)
+
+            captions = " ".join(media['caption'] for media in media_list if media.get('caption'))
+            if captions:
+                await db.execute(
+                    """UPDATE posts_fts
+                       SET captions = trim(coalesce(captions, '') || ' ' || ?)
+                       WHERE rowid = (SELECT id FROM posts WHERE reddit_post_id = ?)""",
+                    (captions, reddit_post_id)
+                )
+            await db.commit()
+        return attachment_ids
+
     async def get_attachments_by_post(self, reddit_post_id: str, status: str = None):
         """Получает все вложения поста"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -297,24 +587,367 @@ class Database:
             await db.commit()
 
     # ===== DISK USAGE =====
+    # Последнее известное этому процессу использование диска (для /status без запроса к БД)
+    disk_usage_cache = None
+
     async def get_disk_usage(self) -> int:
         """Получает текущее использование диска в байтах"""
         async with aiosqlite.connect(self.db_path) as db:
             cursor = await db.execute("SELECT total_bytes FROM disk_usage LIMIT 1")
             row = await cursor.fetchone()
-            return row[0] if row else 0
+            self.disk_usage_cache = row[0] if row else 0
+            return self.disk_usage_cache
 
     async def update_disk_usage(self, bytes_delta: int):
         """Обновляет использование диска (положительное или отрицательное значение)"""
         async with aiosqlite.connect(self.db_path) as db:
-            current = await self.get_disk_usage()
-            new_total = max(0, current + bytes_delta)
+            # Одним UPDATE, чтобы параллельные процессы не затирали изменения друг друга
+            await db.execute(
+                """UPDATE disk_usage
+                   SET total_bytes = MAX(0, total_bytes + ?),
+                       updated_at  = CURRENT_TIMESTAMP
+                   WHERE id = 1""",
+                (bytes_delta,)
+            )
+            await db.commit()
+        if self.disk_usage_cache is not None:
+            self.disk_usage_cache = max(0, self.disk_usage_cache + bytes_delta)
+
+    async def set_disk_usage(self, total_bytes: int):
+        """Перезаписывает использование диска (пересчёт при старте)"""
+        async with aiosqlite.connect(self.db_path) as db:
             await db.execute(
                 "UPDATE disk_usage SET total_bytes = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1",
-                (new_total,)
+                (max(0, total_bytes),)
+            )
+            await db.commit()
+        self.disk_usage_cache = max(0, total_bytes)
+
+    # ===== RECONCILIATION =====
+    async def get_unfinished_attachments(self) -> list:
+        """Вложения в 'pending'/'downloaded' (ждут в очереди или застряли после падения) с аккаунтом поста"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                """SELECT a.attachment_id, a.reddit_post_id, a.file_type, a.file_size_bytes, a.local_path,
+                          a.status, p.account,
+                          EXISTS (SELECT 1
+                                  FROM jobs j
+                                  WHERE j.reddit_post_id = a.reddit_post_id
+                                    AND json_extract(j.payload, '$.attachment_id') = a.attachment_id) AS has_job
+                   FROM attachments a
+                            JOIN posts p ON p.reddit_post_id = a.reddit_post_id
+                   WHERE a.status IN ('pending', 'downloaded')"""
+            )
+            return await cursor.fetchall()
+
+    async def reset_downloaded_attachments(self, kept_ids: list) -> int:
+        """
+        Возвращает в 'pending' все вложения в 'downloaded', кроме kept_ids (их файлы на месте),
+        одним UPDATE; возвращает число сброшенных
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """UPDATE attachments
+                   SET status     = 'pending',
+                       local_path = NULL,
+                       updated_at = CURRENT_TIMESTAMP
+                   WHERE status = 'downloaded'
+                     AND attachment_id NOT IN (SELECT value FROM json_each(?))""",
+                (json.dumps(kept_ids),)
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def get_unfinished_posts(self) -> list:
+        """
+        Посты в 'fetched' без вложений и задач: не отправленные или отправленные частично
+        (parts_sent — сколько частей текста уже в ТГ, с них отправка и продолжится)
+        Посты с сообщением другого типа (дайджест) не возвращаются — повтор их задвоил бы
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                """SELECT reddit_post_id, content, source_url, account,
+                          (SELECT COUNT(*)
+                           FROM telegram_messages t
+                           WHERE t.reddit_post_id = p.reddit_post_id) AS parts_sent
+                   FROM posts p
+                   WHERE status = 'fetched'
+                     AND NOT EXISTS (SELECT 1 FROM attachments a
+                                     WHERE a.reddit_post_id = p.reddit_post_id)
+                     AND NOT EXISTS (SELECT 1 FROM telegram_messages t
+                                     WHERE t.reddit_post_id = p.reddit_post_id
+                                       AND t.message_type != 'text')
+                     AND NOT EXISTS (SELECT 1 FROM jobs j
+                                     WHERE j.reddit_post_id = p.reddit_post_id)"""
+            )
+            return await cursor.fetchall()
+
+    async def finish_uploaded_posts(self, reddit_post_id: str = None, attachment_id: int = None) -> int:
+        """
+        Переводит в 'uploaded' посты в 'fetched', у которых не осталось неотправленных вложений
+        ('pending'/'downloaded') и задач в jobs; возвращает их число
+        reddit_post_id — только этот пост (после загрузки его вложения attachment_id: задача этого
+        вложения ещё лежит в jobs до завершения), без него — все (сверка после падения
+        между загрузкой последнего вложения и сменой статуса поста)
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """UPDATE posts
+                   SET status = 'uploaded', updated_at = CURRENT_TIMESTAMP
+                   WHERE status = 'fetched'
+                     AND (? IS NULL OR reddit_post_id = ?)
+                     AND EXISTS (SELECT 1 FROM attachments a
+                                 WHERE a.reddit_post_id = posts.reddit_post_id)
+                     AND NOT EXISTS (SELECT 1 FROM attachments a
+                                     WHERE a.reddit_post_id = posts.reddit_post_id
+                                       AND a.status IN ('pending', 'downloaded'))
+                     AND NOT EXISTS (SELECT 1 FROM jobs j
+                                     WHERE j.reddit_post_id = posts.reddit_post_id
+                                       AND (? IS NULL
+                                           OR json_extract(j.payload, '$.attachment_id') IS NOT ?))""",
+                (reddit_post_id, reddit_post_id, attachment_id, attachment_id)
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def delete_attachments(self, attachment_ids: list):
+        """Удаляет записи вложений пачкой"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(
+                "DELETE FROM attachments WHERE attachment_id = ?",
+                [(attachment_id,) for attachment_id in attachment_ids]
+            )
+            await db.commit()
+
+    async def delete_posts(self, reddit_post_ids: list):
+        """Удаляет записи постов пачкой (следующий проход фетчера увидит их как новые)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(
+                "DELETE FROM posts_fts WHERE rowid = (SELECT id FROM posts WHERE reddit_post_id = ?)",
+                [(reddit_post_id,) for reddit_post_id in reddit_post_ids]
+            )
+            await db.executemany(
+                "DELETE FROM posts WHERE reddit_post_id = ?",
+                [(reddit_post_id,) for reddit_post_id in reddit_post_ids]
+            )
+            await db.commit()
+
+    # ===== JOBS =====
+    async def enqueue_job(self, kind: str, reddit_post_id: str, payload: dict, delay: float = 0):
+        """Ставит задачу в таблицу jobs (многопроцессный режим)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                """INSERT INTO jobs (kind, reddit_post_id, payload, available_at)
+                   VALUES (?, ?, ?, ?)""",
+                (kind, reddit_post_id, json.dumps(payload, ensure_ascii=False), time.time() + delay)
+            )
+            await db.commit()
+
+    async def enqueue_jobs(self, tasks: list):
+        """Ставит пачку задач пайплайна в таблицу jobs одной транзакцией"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(
+                """INSERT INTO jobs (kind, reddit_post_id, payload, available_at)
+                   VALUES (?, ?, ?, ?)""",
+                [(task['type'], task['post_id'], json.dumps(task, ensure_ascii=False), time.time())
+                 for task in tasks]
+            )
+            await db.commit()
+
+    async def take_jobs(self, kinds: list = None) -> list:
+        """
+        Забирает и удаляет задачи из jobs (kinds — только этих типов): в однопроцессном режиме —
+        сохранённые при остановке, в многопроцессном — запросы /sync для фетчера
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            if kinds:
+                placeholders = ",".join("?" * len(kinds))
+                cursor = await db.execute(
+                    f"SELECT job_id, payload FROM jobs WHERE kind IN ({placeholders}) ORDER BY job_id", kinds
+                )
+            else:
+                cursor = await db.execute("SELECT job_id, payload FROM jobs ORDER BY job_id")
+            rows = await cursor.fetchall()
+            if rows:
+                await db.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id, _ in rows])
+                await db.commit()
+            return [json.loads(payload) for _, payload in rows]
+
+    async def claim_job(self, kinds: list, owner: str, lease_seconds: float):
+        """
+        Атомарно берёт одну доступную задачу в аренду на lease_seconds
+        Задачи с истёкшей арендой (процесс умер) забираются повторно
+        Возвращает строку jobs или None
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        placeholders = ", ".join("?" * len(kinds))
+
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                f"""UPDATE jobs
+                    SET lease_token      = ?,
+                        lease_owner      = ?,
+                        lease_expires_at = ?,
+                        attempts         = attempts + 1
+                    WHERE job_id = (SELECT job_id
+                                    FROM jobs
+                                    WHERE kind IN ({placeholders})
+                                      AND available_at <= ?
+                                      AND (lease_token IS NULL OR lease_expires_at < ?)
+                                    ORDER BY job_id
+                                    LIMIT 1)""",
+                (token, owner, now + lease_seconds, *kinds, now, now)
+            )
+            await db.commit()
+            if not cursor.rowcount:
+                return None
+
+            cursor = await db.execute("SELECT * FROM jobs WHERE lease_token = ?", (token,))
+            return await cursor.fetchone()
+
+    async def heartbeat_job(self, job_id: int, lease_token: str, lease_seconds: float) -> bool:
+        """Продлевает аренду; False — аренду уже забрал другой процесс"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE job_id = ? AND lease_token = ?",
+                (time.time() + lease_seconds, job_id, lease_token)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def finish_job(self, job_id: int, lease_token: str):
+        """Удаляет выполненную задачу"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "DELETE FROM jobs WHERE job_id = ? AND lease_token = ?",
+                (job_id, lease_token)
+            )
+            await db.commit()
+
+    async def release_job(self, job_id: int, lease_token: str, delay: float = 0):
+        """Возвращает задачу в очередь без выполнения (например, при остановке процесса)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                """UPDATE jobs
+                   SET lease_token      = NULL,
+                       lease_owner      = NULL,
+                       lease_expires_at = NULL,
+                       available_at     = ?
+                   WHERE job_id = ? AND lease_token = ?""",
+                (time.time() + delay, job_id, lease_token)
+            )
+            await db.commit()
+
+    async def get_job_counts(self) -> dict:
+        """Количество задач по типам: {kind: {"queued": n, "leased": n}}"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """SELECT kind,
+                          SUM(lease_token IS NULL OR lease_expires_at < ?),
+                          SUM(lease_token IS NOT NULL AND lease_expires_at >= ?)
+                   FROM jobs
+                   GROUP BY kind""",
+                (time.time(), time.time())
+            )
+            return {kind: {"queued": queued, "leased": leased}
+                    for kind, queued, leased in await cursor.fetchall()}
+
+    # ===== BACKFILL =====
+    async def get_backfill_state(self, account: str, listing: str):
+        """Курсор догрузки истории для аккаунта и листинга (None — ещё не начиналась)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                "SELECT * FROM backfill_state WHERE account = ? AND listing = ?",
+                (account, listing)
+            )
+            return await cursor.fetchone()
+
+    async def save_backfill_state(self, account: str, listing: str, cursor_value: str,
+                                  fetched: int, done: bool):
+        """Сохраняет курсор после обработанной страницы"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                """INSERT INTO backfill_state (account, listing, cursor, fetched, done, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (account, listing) DO UPDATE
+                       SET cursor     = excluded.cursor,
+                           fetched    = excluded.fetched,
+                           done       = excluded.done,
+                           updated_at = excluded.updated_at""",
+                (account, listing, cursor_value, fetched, int(done), datetime.now())
+            )
+            await db.commit()
+
+    # ===== RESOLVED URLS =====
+    async def get_resolved_url(self, url: str):
+        """Кэш резолвера: (список медиа, срок годности в unix time) или None"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT media, expires_at FROM resolved_urls WHERE url = ?", (url,))
+            row = await cursor.fetchone()
+            return (json.loads(row[0]), row[1]) if row else None
+
+    async def save_resolved_url(self, url: str, media: list, expires_at: float):
+        """Сохраняет результат резолвера (пустой список — у ссылки нет медиа)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO resolved_urls (url, media, expires_at) VALUES (?, ?, ?)",
+                (url, json.dumps(media, ensure_ascii=False), expires_at)
             )
             await db.commit()
 
+    # ===== SEARCH =====
+    async def search_posts(self, query: str, limit: int = 10, candidates: int = 1000) -> list:
+        """
+        Полнотекстовый поиск по заголовку, тексту, автору и подписям, лучшие совпадения первыми
+        Ранжируются candidates самых новых совпадений — частое слово не заставляет считать
+        bm25 по сотням тысяч постов
+        Возвращает строки постов с полем messages: [(chat_id, message_id)] первого сообщения в каждом канале
+        """
+        # Слова в кавычках, чтобы синтаксис FTS5 во вводе не ломал запрос; последнее — префиксом
+        words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+        if not words:
+            return []
+        terms = " ".join(words) + "*"
+
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                """SELECT p.reddit_post_id, p.title, p.reddit_user, p.source_url, p.status
+                   FROM (SELECT rowid, rank
+                         FROM posts_fts
+                         WHERE posts_fts MATCH ?
+                         ORDER BY rowid DESC
+                         LIMIT ?) found
+                            JOIN posts p ON p.id = found.rowid
+                   ORDER BY found.rank
+                   LIMIT ?""",
+                (terms, candidates, limit)
+            )
+            posts = [dict(row) for row in await cursor.fetchall()]
+            if not posts:
+                return []
+
+            placeholders = ", ".join("?" * len(posts))
+            cursor = await db.execute(
+                f"""SELECT reddit_post_id, telegram_chat_id, MIN(message_id)
+                    FROM telegram_messages
+                    WHERE reddit_post_id IN ({placeholders})
+                    GROUP BY reddit_post_id, telegram_chat_id""",
+                [post['reddit_post_id'] for post in posts]
+            )
+            messages = {}
+            for post_id, chat_id, message_id in await cursor.fetchall():
+                messages.setdefault(post_id, []).append((chat_id, message_id))
+
+        for post in posts:
+            post['messages'] = messages.get(post['reddit_post_id'], [])
+        return posts
+
     # ===== TELEGRAM MESSAGES =====
     async def add_telegram_message(self, message_id: int, reddit_post_id: str,
                                    chat_id: int, message_type: str):
@@ -328,6 +961,180 @@ class Database:
             )
             await db.commit()
 
+    async def get_telegram_messages(self, reddit_post_id: str, chat_id: int = None) -> list:
+        """Сообщения поста в ТГ: [(chat_id, message_id)], опционально только в одном чате"""
+        async with aiosqlite.connect(self.db_path) as db:
+            if chat_id is None:
+                cursor = await db.execute(
+                    """SELECT telegram_chat_id, message_id FROM telegram_messages
+                       WHERE reddit_post_id = ? AND status = 'sent'
+                       ORDER BY telegram_chat_id, message_id""",
+                    (reddit_post_id,)
+                )
+            else:
+                cursor = await db.execute(
+                    """SELECT telegram_chat_id, message_id FROM telegram_messages
+                       WHERE reddit_post_id = ? AND telegram_chat_id = ? AND status = 'sent'
+                       ORDER BY message_id""",
+                    (reddit_post_id, chat_id)
+                )
+            return await cursor.fetchall()
+
+    # ===== MAINTENANCE =====
+    async def get_storage_info(self) -> dict:
+        """Размер файла базы в страницах, свободные страницы и режим auto_vacuum (2 — INCREMENTAL)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            info = {}
+            for pragma in ("page_size", "page_count", "freelist_count", "auto_vacuum"):
+                cursor = await db.execute(f"PRAGMA {pragma}")
+                info[pragma] = (await cursor.fetchone())[0]
+            return info
+
+    async def get_stats_days_to_rollup(self, before: str) -> list:
+        """Дни до before (YYYY-MM-DD), за которые в stats больше одной строки"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """SELECT date(recorded_at) AS day
+                   FROM stats
+                   WHERE recorded_at < ?
+                   GROUP BY day
+                   HAVING COUNT(*) > 1""",
+                (before,)
+            )
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def rollup_stats(self, day: str, limit: int) -> int:
+        """
+        Добавляет до limit строк stats за день в итоговую строку дня (recorded_at — начало дня)
+        и удаляет их; возвращает, сколько строк свёрнуто (0 — день свёрнут целиком)
+        """
+        start = f"{day} 00:00:00"
+        end = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00")
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT id FROM stats WHERE recorded_at = ? ORDER BY id LIMIT 1", (start,)
+            )
+            row = await cursor.fetchone()
+            if row:
+                total_id = row[0]
+            else:
+                cursor = await db.execute("INSERT INTO stats (recorded_at) VALUES (?)", (start,))
+                total_id = cursor.lastrowid
+
+            cursor = await db.execute(
+                """SELECT id FROM stats
+                   WHERE recorded_at >= ? AND recorded_at < ? AND id != ?
+                   LIMIT ?""",
+                (start, end, total_id, limit)
+            )
+            ids = [row[0] for row in await cursor.fetchall()]
+            if ids:
+                marks = ",".join("?" * len(ids))
+                await db.execute(
+                    f"""UPDATE stats
+                        SET (posts_uploaded, files_uploaded, bytes_uploaded, posts_failed, posts_skipped) =
+                            (SELECT stats.posts_uploaded + SUM(s.posts_uploaded),
+                                    stats.files_uploaded + SUM(s.files_uploaded),
+                                    stats.bytes_uploaded + SUM(s.bytes_uploaded),
+                                    stats.posts_failed + SUM(s.posts_failed),
+                                    stats.posts_skipped + SUM(s.posts_skipped)
+                             FROM stats s WHERE s.id IN ({marks}))
+                        WHERE id = ?""",
+                    (*ids, total_id)
+                )
+                await db.execute(f"DELETE FROM stats WHERE id IN ({marks})", ids)
+            await db.commit()
+            return len(ids)
+
+    async def prune_post_texts(self, before: str, min_chars: int, max_chars: int) -> tuple[int, int]:
+        """
+        Убирает из posts текст доставленных постов старше before и длиннее min_chars —
+        за раз не больше max_chars символов (но хотя бы один пост); в полнотекстовом индексе
+        текст остаётся, /search его находит. updated_at обновляется — инкрементальная выгрузка
+        увидит изменение
+        Возвращает (постов, символов)
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """SELECT id, length(content)
+                   FROM posts
+                   WHERE status = 'uploaded'
+                     AND updated_at < ?
+                     AND length(content) > ?
+                   LIMIT 1000""",
+                (before, min_chars)
+            )
+            rows, chars = [], 0
+            for post_id, length in await cursor.fetchall():
+                if rows and chars + length > max_chars:
+                    break
+                rows.append((post_id,))
+                chars += length
+            if not rows:
+                return 0, 0
+            await db.executemany(
+                "UPDATE posts SET content = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?", rows
+            )
+            await db.commit()
+            return len(rows), chars
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """Возвращает до pages свободных страниц файловой системе; сколько вернул"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("PRAGMA freelist_count")
+            before = (await cursor.fetchone())[0]
+            # Через execute прагма делает один шаг (одну страницу); executescript доводит её до конца
+            await db.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            cursor = await db.execute("PRAGMA freelist_count")
+            return before - (await cursor.fetchone())[0]
+
+    async def convert_to_incremental_vacuum(self):
+        """Разовый VACUUM, после которого работает incremental_vacuum; блокирует базу на всё время"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+
+    async def optimize(self):
+        """PRAGMA optimize с ограничением анализа, чтобы не читать большие таблицы целиком"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("PRAGMA analysis_limit = 400")
+            await db.execute("PRAGMA optimize")
+
+    # ===== BACKUP =====
+    async def backup_to(self, target_path, pages: int, sleep: float, max_restarts: int) -> int:
+        """
+        Онлайн-копия базы в target_path через backup API: по pages страниц за шаг с паузой sleep,
+        между шагами база открыта для записи. Запись другого соединения начинает копирование заново;
+        после max_restarts перезапусков копия снимается за один шаг — в WAL это одна
+        читающая транзакция, писателей она не останавливает
+        Копирование целиком идёт в своём потоке: отмена при остановке не закрывает соединения
+        посреди шага, поток доводит копию и закрывает их сам
+        Возвращает число перезапусков
+        """
+        return await asyncio.to_thread(self._backup, str(target_path), pages, sleep, max_restarts)
+
+    def _backup(self, target_path: str, pages: int, sleep: float, max_restarts: int) -> int:
+        restarts = 0
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > max_restarts:
+                    raise BackupRestarted()
+            last_remaining = remaining
+
+        with closing(sqlite3.connect(self.db_path)) as source, closing(sqlite3.connect(target_path)) as target:
+            try:
+                source.backup(target, pages=pages, progress=progress, sleep=sleep)
+            except BackupRestarted:
+                logger.info(f"Backup restarted {restarts} times by concurrent writes, copying in one step")
+                source.backup(target)
+            # Копия — один самостоятельный файл, без журнала WAL рядом
+            target.execute("PRAGMA journal_mode = DELETE")
+        return restarts
+
     # ===== STATS =====
     async def record_stats(self, posts_uploaded: int = 0, files_uploaded: int = 0,
                            bytes_uploaded: int = 0, posts_failed: int = 0,
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from config import DIGEST_MAX_DELAY
+from modules.logger import logger
+from modules.utils import TELEGRAM_TEXT_LIMIT
+
+# Разделитель постов внутри дайджеста
+DIGEST_SEPARATOR = "\n\n➖➖➖\n\n"
+
+
+class DigestBuffer:
+    """
+    Копит короткие текстовые посты по каналам и отдаёт их пачкой в on_flush(channel_id, entries),
+    где entries — [(post_id, html)]. Пачка уходит, когда следующий пост не влезает
+    в одно сообщение, или через max_delay секунд после первого поста в ней
+    """
+
+    def __init__(self, on_flush, max_length: int = TELEGRAM_TEXT_LIMIT, max_delay: float = DIGEST_MAX_DELAY):
+        self.on_flush = on_flush
+        self.max_length = max_length
+        self.max_delay = max_delay
+        self._entries = {}
+        self._lengths = {}
+        self._started = {}
+
+    async def add(self, channel_id: int, post_id: str, text: str):
+        """Добавляет пост; если он не влезает в текущую пачку — сначала отправляет её"""
+        full = None
+        length = self._lengths.get(channel_id, 0)
+        if channel_id in self._entries and length + len(DIGEST_SEPARATOR) + len(text) > self.max_length:
+            full = self._take(channel_id)
+
+        if channel_id not in self._entries:
+            self._entries[channel_id] = []
+            self._lengths[channel_id] = -len(DIGEST_SEPARATOR)
+            self._started[channel_id] = time.monotonic()
+        self._entries[channel_id].append((post_id, text))
+        self._lengths[channel_id] += len(DIGEST_SEPARATOR) + len(text)
+
+        if full:
+            await self.on_flush(channel_id, full)
+
+    def _take(self, channel_id: int) -> list:
+        # Забираем пачку синхронно, чтобы параллельные add() не отправили её дважды
+        self._lengths.pop(channel_id, None)
+        self._started.pop(channel_id, None)
+        return self._entries.pop(channel_id, [])
+
+    def pending(self) -> int:
+        """Сколько постов ждёт отправки"""
+        return sum(len(entries) for entries in self._entries.values())
+
+    async def flush(self, only_due: bool = False):
+        """Отправляет накопленные пачки (only_due — только те, что ждут дольше max_delay)"""
+        now = time.monotonic()
+        for channel_id in list(self._entries):
+            if only_due and now - self._started[channel_id] < self.max_delay:
+                continue
+            await self.on_flush(channel_id, self._take(channel_id))
+
+    async def run(self):
+        """Фоновая задача: отправка пачек по времени"""
+        while True:
+            await asyncio.sleep(1)
+            try:
+                await self.flush(only_due=True)
+            except Exception as e:
+                logger.error(f"Error flushing digest: {e}")
+
+
+def join_digest(entries: list) -> str:
+    """Текст одного сообщения-дайджеста"""
+    return DIGEST_SEPARATOR.join(text for _, text in entries)
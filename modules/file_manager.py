@@ -1,64 +1,242 @@
-import aiohttp
+import aiofiles
 import asyncio
+import os
+import time
 from pathlib import Path
-from config import TEMP_DIR, MAX_FILE_SIZE_BYTES
+from urllib.parse import urlparse
+from config import (
+    TEMP_DIR, MAX_FILE_SIZE_BYTES, HOST_WINDOW_INITIAL, HOST_WINDOW_MIN, HOST_WINDOW_MAX,
+    HOST_LATENCY_FACTOR, DOWNLOAD_TIMEOUT, DOWNLOAD_READ_TIMEOUT
+)
+from modules.circuit_breaker import CircuitBreaker, breakers
 from modules.logger import logger
 from modules.database import db
+from modules.metrics import metrics
+
+
+class MediaNotFoundError(Exception):
+    """Хост ответил 403/404/410: файла по этой ссылке нет"""
+
+
+class HostWindow:
+    """
+    Окно параллельных скачиваний с одного хоста (AIMD, как окно TCP):
+    успех при занятом окне — +1/окно (около +1 за «круг» скачиваний), 429/5xx/таймаут — окно пополам
+    (не чаще раза за круг), рост задержки ответа сверх HOST_LATENCY_FACTOR × минимальной — без роста
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.window = float(HOST_WINDOW_INITIAL)
+        self.active = 0
+        self.base_latency = None
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._changed = asyncio.Condition()
+
+    def _has_slot(self) -> bool:
+        return self.active < int(self.window) and time.monotonic() >= self.paused_until
+
+    async def acquire(self):
+        async with self._changed:
+            while not self._has_slot():
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    # Хост попросил подождать (Retry-After) — просыпаемся по таймеру
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=pause)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._changed.wait()
+            self.active += 1
+
+    async def release(self):
+        async with self._changed:
+            self.active -= 1
+            self._changed.notify_all()
+
+    def on_success(self, latency: float):
+        """Успешный ответ; latency — время до заголовков (не зависит от размера файла)"""
+        if self.base_latency is None or latency < self.base_latency:
+            self.base_latency = latency
+        if latency > self.base_latency * HOST_LATENCY_FACTOR:
+            # Очередь на стороне CDN растёт — окно не увеличиваем
+            return
+        if self.active < int(self.window):
+            # Окно выбрано не целиком — успех ничего не говорит о том, выдержит ли хост больше
+            return
+        self.window = min(HOST_WINDOW_MAX, self.window + 1 / self.window)
+
+    def on_congestion(self, retry_after: float = 0):
+        """429, 5xx или таймаут: окно пополам, не чаще раза за время ответа хоста"""
+        now = time.monotonic()
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        if now - self._last_decrease < (self.base_latency or 1.0):
+            return
+        self._last_decrease = now
+        self.window = max(HOST_WINDOW_MIN, self.window / 2)
+        metrics.inc('host_congestion')
+        logger.info(f"Download window for {self.host} reduced to {int(self.window)}")
 
 
 class FileManager:
     def __init__(self):
         self.temp_dir = TEMP_DIR
         self.max_file_size = MAX_FILE_SIZE_BYTES
+        self._session = None
+        self._windows = {}
+
+    def host_window(self, url: str) -> HostWindow:
+        """Окно параллельных скачиваний хоста из URL"""
+        host = urlparse(url).hostname or ""
+        if host not in self._windows:
+            self._windows[host] = HostWindow(host)
+        return self._windows[host]
+
+    def host_breaker(self, url: str) -> CircuitBreaker:
+        """Предохранитель хоста из URL"""
+        return breakers.get(urlparse(url).hostname or "")
+
+    def host_windows(self) -> dict:
+        """Текущие окна по хостам: {host: (окно, активных скачиваний)}"""
+        return {host: (int(window.window), window.active) for host, window in self._windows.items()}
+
+    def _get_session(self):
+        """Общая HTTP-сессия для всех скачиваний, создаётся при первом скачивании"""
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(
+                total=DOWNLOAD_TIMEOUT, sock_read=DOWNLOAD_READ_TIMEOUT
+            ))
+        return self._session
 
-    async def download_file(self, url: str, file_type: str) -> tuple[str, int]:
+    async def close(self):
+        """Закрывает HTTP-сессию"""
+        if self._session is not None:
+            await self._session.close()
+
+    async def download_file(self, url: str, file_type: str, max_size: int = None,
+                            progress=None, attachment_id: int = None) -> tuple[str, int]:
         """
-        Скачивает файл с URL
-        Возвращает (local_path, file_size_bytes) или (None, 0) если ошибка
+        Скачивает файл с URL (не больше окна параллельных скачиваний его хоста)
+        Возвращает (local_path, file_size_bytes) или (None, 0) если ошибка,
+        (None, размер) — если файл больше max_size (по умолчанию max_file_size)
+        Если хост лежит (цепь разомкнута) — сразу CircuitOpenError, без запроса
+        Файла по ссылке нет (403/404/410) — MediaNotFoundError
+        progress (TaskProgress) — размер и скачанные байты для /status
+        attachment_id — в имя временного файла (без него — имя воркера)
         """
+        breaker = self.host_breaker(url)
+        breaker.check()
+        window = self.host_window(url)
+        try:
+            await window.acquire()
+            try:
+                return await self._download(url, file_type, window, breaker, max_size or self.max_file_size,
+                                            progress, attachment_id)
+            finally:
+                await window.release()
+        finally:
+            breaker.end_probe()
+
+    async def _download(self, url: str, file_type: str, window: HostWindow,
+                        breaker: CircuitBreaker, max_size: int, progress=None,
+                        attachment_id: int = None) -> tuple[str, int]:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=300)) as resp:
-                    if resp.status != 200:
-                        logger.error(f"Failed to download {url}: HTTP {resp.status}")
-                        return None, 0
+            session = self._get_session()
+            started = time.monotonic()
+            async with session.get(url) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    retry_after = resp.headers.get('Retry-After', '')
+                    window.on_congestion(float(retry_after) if retry_after.isdigit() else 0)
+                    if resp.status >= 500:
+                        breaker.record_failure()
+                    logger.error(f"Failed to download {url}: HTTP {resp.status}")
+                    return None, 0
+
+                # Хост ответил — жив, даже если файла нет
+                breaker.record_success()
 
-                    # Получаем размер файла
-                    file_size = int(resp.headers.get('Content-Length', 0))
+                if resp.status in (403, 404, 410):
+                    raise MediaNotFoundError(f"HTTP {resp.status} for {url}")
+                if resp.status != 200:
+                    logger.error(f"Failed to download {url}: HTTP {resp.status}")
+                    return None, 0
 
-                    if file_size > self.max_file_size:
-                        logger.warning(f"File too large ({file_size} bytes): {url}")
-                        return None, file_size
+                window.on_success(time.monotonic() - started)
 
-                    # Генерируем имя файла
-                    file_ext = self._get_extension(file_type, url)
-                    filename = f"{asyncio.current_task().get_name()}_{Path(url).stem}{file_ext}"
-                    local_path = self.temp_dir / filename
+                # Получаем размер файла
+                file_size = int(resp.headers.get('Content-Length', 0))
 
-                    # Скачиваем файл
-                    async with open(local_path, 'wb') as f:
-                        async for chunk in resp.content.iter_chunked(8192):
-                            await f.write(chunk)
+                if file_size > max_size:
+                    logger.warning(f"File too large ({file_size} bytes): {url}")
+                    return None, file_size
+                if progress:
+                    progress.bytes_total = file_size
 
-                    actual_size = local_path.stat().st_size
-                    logger.info(f"Downloaded {actual_size} bytes to {local_path}")
+                # Генерируем имя файла: имена воркеров повторяются в каждом процессе стадии,
+                # а у видео Реддита у всех постов одно имя (DASH_720) — отсюда pid и id вложения
+                file_ext = self._get_extension(file_type, url)
+                owner = attachment_id or asyncio.current_task().get_name()
+                filename = f"{os.getpid()}_{owner}_{Path(url).stem}{file_ext}"
+                local_path = self.temp_dir / filename
 
-                    return str(local_path), actual_size
+                # Скачиваем файл (без Content-Length размер проверяем по ходу)
+                actual_size = 0
+                async with aiofiles.open(local_path, 'wb') as f:
+                    async for chunk in resp.content.iter_chunked(8192):
+                        actual_size += len(chunk)
+                        if actual_size > max_size:
+                            break
+                        await f.write(chunk)
+                        if progress:
+                            progress.advance(len(chunk))
 
+                if actual_size > max_size:
+                    await asyncio.to_thread(local_path.unlink, True)
+                    logger.warning(f"File too large (over {max_size} bytes): {url}")
+                    return None, actual_size
+
+                actual_size = (await asyncio.to_thread(local_path.stat)).st_size
+                metrics.inc('bytes_downloaded', actual_size)
+                logger.info(f"Downloaded {actual_size} bytes to {local_path}")
+
+                return str(local_path), actual_size
+
+        except MediaNotFoundError:
+            raise
         except asyncio.TimeoutError:
+            window.on_congestion()
+            breaker.record_failure()
             logger.error(f"Timeout downloading {url}")
             return None, 0
         except Exception as e:
+            import aiohttp
+
+            if isinstance(e, aiohttp.ClientConnectionError):
+                # Обрыв соединения хостом — тоже признак перегрузки (или хост недоступен вовсе)
+                window.on_congestion()
+                breaker.record_failure()
             logger.error(f"Error downloading {url}: {e}")
             return None, 0
 
     async def delete_file(self, local_path: str) -> bool:
         """Удаляет файл с диска"""
-        try:
+        def remove() -> int:
+            # stat и unlink — синхронные вызовы ФС, на медленном диске они останавливали бы loop
             path = Path(local_path)
-            if path.exists():
-                file_size = path.stat().st_size
-                path.unlink()
+            if not path.exists():
+                return None
+            file_size = path.stat().st_size
+            path.unlink()
+            return file_size
+
+        try:
+            file_size = await asyncio.to_thread(remove)
+            if file_size is not None:
                 await db.update_disk_usage(-file_size)
                 logger.info(f"Deleted file: {local_path}")
                 return True
@@ -67,6 +245,36 @@ class FileManager:
             logger.error(f"Error deleting file {local_path}: {e}")
             return False
 
+    async def scan_temp_dir(self) -> dict:
+        """Один проход os.scandir по TEMP_DIR, возвращает {путь: размер}"""
+        def scan():
+            files = {}
+            if not self.temp_dir.exists():
+                return files
+            with os.scandir(self.temp_dir) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        files[entry.path] = entry.stat(follow_symlinks=False).st_size
+            return files
+
+        return await asyncio.to_thread(scan)
+
+    async def delete_orphans(self, paths: list) -> int:
+        """Удаляет файлы, не учтённые в БД (учёт диска не трогает), возвращает число удалённых"""
+        def unlink_all():
+            deleted = 0
+            for path in paths:
+                try:
+                    os.unlink(path)
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Error deleting orphan file {path}: {e}")
+            return deleted
+
+        return await asyncio.to_thread(unlink_all)
+
     def _get_extension(self, file_type: str, url: str) -> str:
         """Определяет расширение файла"""
         if file_type == "image":
@@ -1,9 +1,24 @@
+import asyncio
+import html
+import time
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
-from config import TELEGRAM_ADMIN_ID
+from aiogram.types import (
+    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, LinkPreviewOptions
+)
+from aiogram.filters import Command, CommandObject
+from config import TELEGRAM_ADMIN_ID, MAX_DISK_USAGE_BYTES
+from modules.circuit_breaker import breakers, CLOSED, OPEN
+from modules.accounts import accounts
+from modules.backup import backup
 from modules.database import db
 from modules.logger import logger
+from modules.maintenance import maintenance
+from modules.metrics import metrics
+from modules.poller import poller
+from modules.status import pipeline
+from modules.watchdog import loop_monitor
+from modules.telegram_client import telegram_client
+from modules.utils import format_file_size, message_link
 
 admin_router = Router()
 
@@ -12,6 +27,13 @@ STATS_PERIOD_ALL = "stats_all"
 STATS_PERIOD_MONTH = "stats_month"
 STATS_PERIOD_WEEK = "stats_week"
 STATS_PERIOD_TODAY = "stats_today"
+STATUS_REFRESH = "status_refresh"
+
+# Сколько результатов показывает /search
+SEARCH_RESULTS = 10
+# Сколько задач в работе перечисляет /status и сколько он ждёт БД
+STATUS_MAX_IN_FLIGHT = 10
+STATUS_DB_TIMEOUT = 1
 
 
 @admin_router.message(Command("stats"))
@@ -74,6 +96,9 @@ async def cmd_start(message: Message):
 Доступные команды:
 /stats - Просмотр статистики
 /status - Статус работы
+/sync [аккаунт] - Проверить лайки сейчас
+/backup - Резервная копия базы
+/search <слова> - Поиск по архиву
     """
     await message.answer(text)
 
@@ -87,21 +112,291 @@ async def cmd_status(message: Message):
         return
 
     try:
-        disk_usage = await db.get_disk_usage()
-        disk_usage_gb = disk_usage / (1024 ** 3)
+        await message.answer(await _render_status(), reply_markup=_status_keyboard())
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {e}")
+
+
+@admin_router.callback_query(F.data == STATUS_REFRESH)
+async def callback_status(query: CallbackQuery):
+    """Кнопка «Обновить» под /status"""
+
+    if query.from_user.id != TELEGRAM_ADMIN_ID:
+        await query.answer("❌ Доступ запрещён")
+        return
+
+    try:
+        await query.message.edit_text(await _render_status(), reply_markup=_status_keyboard())
+    except Exception as e:
+        # «message is not modified» — за это время ничего не изменилось
+        logger.debug(f"Status refresh: {e}")
+    await query.answer()
+
+
+def _status_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data=STATUS_REFRESH)],
+    ])
 
-        text = f"""
-✅ Бот работает
 
-📊 Статус:
-• Использование диска: {disk_usage_gb:.2f} GB / 3 GB
+async def _render_status() -> str:
+    """
+    Текст /status из состояния в памяти процесса; в БД ходим только за тем, чего в памяти нет
+    (счётчики jobs в многопроцессном режиме), и не дольше STATUS_DB_TIMEOUT
+    """
+    sections = [
+        "✅ Бот работает",
+        await _format_queue(),
+        _format_in_flight(pipeline.in_flight()),
+        await _format_disk(),
+        _format_telegram(),
+        _format_loop(),
+        _format_polling(poller.snapshot()),
+        _format_circuits(breakers.snapshot()),
+        _format_maintenance(maintenance.last_report),
+        _format_backup(backup.last_result),
+    ]
+    return "\n\n".join(section for section in sections if section)
+
+
+async def _format_queue() -> str:
+    """Очередь по типам задач и полосам, отложенные задачи и повторы"""
+    if pipeline.queue is None:
+        # Многопроцессный режим: очередь — таблица jobs
+        try:
+            counts = await asyncio.wait_for(db.get_job_counts(), STATUS_DB_TIMEOUT)
+        except asyncio.TimeoutError:
+            return "📥 Очередь: БД занята, попробуйте обновить"
+        if not counts:
+            return "📥 Очередь: пусто"
+        lines = ["📥 Очередь (jobs):"]
+        for kind, count in sorted(counts.items()):
+            lines.append(f"• {kind}: ждут {count['queued']}, в работе {count['leased']}")
+        return "\n".join(lines)
+
+    queued = pipeline.queued_by_type()
+    lines = [f"📥 Очередь: {sum(queued.values())}"
+             + (" (" + ", ".join(f"{kind} {n}" for kind, n in sorted(queued.items())) + ")" if queued else "")]
+    lanes = pipeline.queue.snapshot()
+    if lanes:
+        lines.append("• Полосы: " + ", ".join(
+            f"{lane} {waiting}/{active}" for lane, (waiting, active) in lanes.items()
+        ) + " (ждут/в работе)")
+    parked = pipeline.parked_by_type()
+    if parked:
+        lines.append("• Отложены до пробы хоста: "
+                     + ", ".join(f"{kind} {n}" for kind, n in sorted(parked.items())))
+    lines.append(f"• Повторов с запуска: {metrics.counters.get('task_retries', 0)}")
+    return "\n".join(lines)
+
+
+def _format_in_flight(in_flight: list) -> str:
+    """Задачи в работе: тип, пост, попытка, прогресс скачивания и скорость"""
+    if not in_flight:
+        return "⚙️ В работе: ничего"
+    now = time.monotonic()
+    lines = [f"⚙️ В работе: {len(in_flight)}"]
+    for item in in_flight[:STATUS_MAX_IN_FLIGHT]:
+        line = f"• {item.task.type} {item.task.post_id}, {now - item.started:.0f} с"
+        if item.attempt > 1:
+            line += f", попытка {item.attempt}"
+        if item.bytes_done:
+            done = format_file_size(item.bytes_done)
+            if item.bytes_total:
+                done += f" / {format_file_size(item.bytes_total)} ({item.bytes_done * 100 // item.bytes_total}%)"
+            line += f", {done}, {format_file_size(item.rate())}/с"
+        lines.append(line)
+    if len(in_flight) > STATUS_MAX_IN_FLIGHT:
+        lines.append(f"• … и ещё {len(in_flight) - STATUS_MAX_IN_FLIGHT}")
+    return "\n".join(lines)
+
+
+async def _format_disk() -> str:
+    """
+    Занято на диске и зарезервировано идущими скачиваниями
+    В одном процессе кэш db ведёт сам пайплайн; в многопроцессном пишут процессы стадий —
+    значение перечитывается из БД (не дольше STATUS_DB_TIMEOUT, иначе последнее известное)
     """
-        await message.answer(text)
+    used = db.disk_usage_cache
+    stale = False
+    if used is None or pipeline.queue is None:
+        try:
+            used = await asyncio.wait_for(db.get_disk_usage(), STATUS_DB_TIMEOUT)
+        except asyncio.TimeoutError:
+            if used is None:
+                return "💾 Диск: БД занята"
+            stale = True
+    reserved = pipeline.reserved_bytes()
+    text = f"💾 Диск: {format_file_size(used)} / {format_file_size(MAX_DISK_USAGE_BYTES)}"
+    if stale:
+        text += " (БД занята, значение могло устареть)"
+    if reserved:
+        text += f" (+{format_file_size(reserved)} скачивается)"
+    return text
+
+
+def _format_telegram() -> str:
+    """Запас лимита отправок в ТГ и последний ответ 429"""
+    global_wait, chat_wait = telegram_client.limiter.headroom()
+    if global_wait or chat_wait:
+        text = f"📤 Telegram: ближайший слот через {global_wait:.1f} с, в канал — через {chat_wait:.1f} с"
+    else:
+        text = "📤 Telegram: лимит свободен"
+    floods = metrics.counters.get('telegram_429', 0)
+    if telegram_client.last_retry_after:
+        at, retry_after = telegram_client.last_retry_after
+        text += f"\n• 429 с запуска: {floods}, последний {(time.time() - at) / 60:.0f} мин назад (ждали {retry_after} с)"
+    return text
+
+
+@admin_router.message(Command("sync"))
+async def cmd_sync(message: Message, command: CommandObject):
+    """Внеочередной проход Реддита: /sync [аккаунт]"""
 
+    if message.from_user.id != TELEGRAM_ADMIN_ID:
+        await message.answer("❌ Доступ запрещён")
+        return
+
+    name = (command.args or "").strip() or None
+    if name and name not in accounts:
+        await message.answer(f"❌ Нет аккаунта {name}")
+        return
+
+    try:
+        await poller.request_sync(name)
+        await message.answer(f"🔄 Проверяю лайки {'аккаунта ' + name if name else 'всех аккаунтов'}")
     except Exception as e:
+        logger.error(f"Error requesting sync: {e}")
         await message.answer(f"❌ Ошибка: {e}")
 
 
+def _format_polling(snapshot: dict) -> str:
+    """Интервалы проходов фетчера (в многопроцессном режиме фетчер в другом процессе — пусто)"""
+    if not snapshot:
+        return ""
+    lines = ["🔁 Проходы Реддита:"]
+    for account, (interval, next_in, last_ago, new_posts) in sorted(snapshot.items()):
+        result = "ошибка" if new_posts is None else f"новых {new_posts}"
+        lines.append(f"• {account}: прошлый {last_ago / 60:.0f} мин назад ({result}), "
+                     f"раз в {interval / 60:.0f} мин, следующий через {next_in / 60:.0f} мин")
+    return "\n".join(lines)
+
+
+def _format_circuits(snapshot: dict) -> str:
+    """Состояние предохранителей хостов и API ТГ (в этом процессе)"""
+    broken = {name: state for name, state in snapshot.items() if state[0] != CLOSED}
+    if not broken:
+        return f"🔌 Хосты: все доступны ({len(snapshot)})"
+
+    lines = [f"🔌 Хосты: недоступно {len(broken)} из {len(snapshot)}"]
+    for name, (state, failures, retry_in) in sorted(broken.items()):
+        if state == OPEN:
+            lines.append(f"• {name}: разомкнута, проба через {retry_in:.0f} с (неудач подряд: {failures})")
+        else:
+            lines.append(f"• {name}: пробный запрос")
+    return "\n".join(lines)
+
+
+def _format_loop() -> str:
+    """Задержка event loop этого процесса"""
+    text = (f"⏱ Задержка event loop: {loop_monitor.lag * 1000:.0f} мс "
+            f"(макс. {loop_monitor.max_lag * 1000:.0f} мс)")
+    if loop_monitor.stalls:
+        text += f", зависаний дольше {loop_monitor.threshold:.1f} с: {loop_monitor.stalls}"
+    return text
+
+
+def _format_maintenance(report: dict) -> str:
+    """Последний проход обслуживания БД"""
+    if not report:
+        return ""
+    return (f"🧹 Обслуживание БД {(time.time() - report['finished_at']) / 3600:.0f} ч назад: "
+            f"освобождено {format_file_size(report['reclaimed_bytes'])}, "
+            f"база {format_file_size(report['size_bytes'])}")
+
+
+def _format_backup(result: dict) -> str:
+    """Последняя резервная копия (снятая этим процессом)"""
+    if not result:
+        return ""
+    return (f"🗄 Копия базы {(time.time() - result['finished_at']) / 3600:.0f} ч назад: "
+            f"{result['path'].name}, {format_file_size(result['size'])}")
+
+
+@admin_router.message(Command("backup"))
+async def cmd_backup(message: Message):
+    """Резервная копия базы сейчас"""
+
+    if message.from_user.id != TELEGRAM_ADMIN_ID:
+        await message.answer("❌ Доступ запрещён")
+        return
+
+    if backup.running:
+        await message.answer("⏳ Копия уже снимается")
+        return
+
+    await message.answer("⏳ Снимаю копию базы...")
+    try:
+        result = await backup.create()
+        await message.answer(
+            f"✅ Копия {result['path'].name}: {format_file_size(result['size'])} "
+            f"за {result['duration']:.1f} с"
+        )
+    except Exception as e:
+        logger.error(f"Backup failed: {e}")
+        await message.answer(f"❌ Ошибка резервного копирования: {e}")
+
+
+@admin_router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject):
+    """Полнотекстовый поиск по архиву: /search <слова>"""
+
+    if message.from_user.id != TELEGRAM_ADMIN_ID:
+        await message.answer("❌ Доступ запрещён")
+        return
+
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("🔎 Использование: /search <слова из заголовка, текста, автора или подписи>")
+        return
+
+    try:
+        started = time.perf_counter()
+        results = await db.search_posts(query, limit=SEARCH_RESULTS)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        await message.answer(
+            _format_search(query, results, elapsed_ms),
+            parse_mode="HTML",
+            link_preview_options=LinkPreviewOptions(is_disabled=True)
+        )
+
+    except Exception as e:
+        logger.error(f"Error searching archive: {e}")
+        await message.answer(f"❌ Ошибка поиска: {e}")
+
+
+def _format_search(query: str, results: list, elapsed_ms: float) -> str:
+    """Форматирует результаты поиска: ссылки на сообщения в канале и на исходный пост"""
+
+    if not results:
+        return f"🔎 По запросу <b>{html.escape(query)}</b> ничего не найдено"
+
+    lines = [f"🔎 <b>{html.escape(query)}</b> — {len(results)} шт. ({elapsed_ms:.0f} мс)\n"]
+    for number, post in enumerate(results, 1):
+        title = html.escape(post['title'] or post['reddit_post_id'])
+        if post['messages']:
+            chat_id, message_id = post['messages'][0]
+            title = f'<a href="{message_link(chat_id, message_id)}">{title}</a>'
+
+        line = f"{number}. {title}\n    u/{html.escape(post['reddit_user'] or '?')}"
+        if post['source_url']:
+            line += f' · <a href="{html.escape(post["source_url"])}">reddit</a>'
+        lines.append(line)
+
+    return "\n".join(lines)
+
+
 def _format_stats(stats: dict, period: str = None) -> str:
     """Форматирует вывод статистики"""
 
@@ -2,10 +2,18 @@ import logging
 from logging.handlers import RotatingFileHandler
 from config import LOG_FILE, LOG_LEVEL
 
+LOGGER_NAME = "reddit_archiver"
 
-def setup_logger(name: str) -> logging.Logger:
-    """Инициализирует логгер с ротацией"""
+
+def setup_logger(name: str = LOGGER_NAME) -> logging.Logger:
+    """
+    Инициализирует логгер с ротацией
+    Вызывается один раз при старте бота; повторный вызов ничего не делает
+    """
     logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+
     logger.setLevel(LOG_LEVEL)
 
     # Формат лога
@@ -15,6 +23,7 @@ def setup_logger(name: str) -> logging.Logger:
     )
 
     # Файловый обработчик (ротация по 10MB)
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
     file_handler = RotatingFileHandler(
         LOG_FILE,
         maxBytes=10 * 1024 * 1024,  # 10 MB
@@ -31,4 +40,6 @@ def setup_logger(name: str) -> logging.Logger:
     return logger
 
 
-logger = setup_logger("reddit_archiver")
+# Обработчики (и файл лога) подключаются в setup_logger(), а не при импорте
+logger = logging.getLogger(LOGGER_NAME)
+logger.setLevel(LOG_LEVEL)
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from config import (
+    MAINTENANCE_INTERVAL, MAINTENANCE_IDLE_WAIT, MAINTENANCE_BATCH, MAINTENANCE_BATCH_CHARS,
+    MAINTENANCE_VACUUM_PAGES, MAINTENANCE_VACUUM_CONVERT,
+    STATS_ROLLUP_DAYS, POST_TEXT_RETENTION_DAYS, POST_TEXT_PRUNE_CHARS
+)
+from modules.backup import backup
+from modules.database import db
+from modules.logger import logger
+from modules.status import pipeline
+from modules.utils import format_file_size
+
+# Пауза между пачками: в промежутках пишут воркеры. Пока пайплайн занят — пауза длиннее
+BATCH_PAUSE = 0.05
+BUSY_PAUSE = 1.0
+IDLE_CHECK_INTERVAL = 30
+
+
+def _utc_cutoff(days: float) -> str:
+    """Граница в формате CURRENT_TIMESTAMP (UTC), которым заполнены recorded_at и updated_at"""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Maintenance:
+    """
+    Обслуживание archive.db раз в MAINTENANCE_INTERVAL, когда пайплайн простаивает
+    (но не позже MAINTENANCE_IDLE_WAIT): старые события stats сворачиваются по дням,
+    текст давно доставленных постов убирается из posts (если задан POST_TEXT_RETENTION_DAYS),
+    свободные страницы возвращаются incremental_vacuum, статистика планировщика — PRAGMA optimize
+    Всё — короткими транзакциями (по MAINTENANCE_BATCH строк stats, MAINTENANCE_BATCH_CHARS текста,
+    MAINTENANCE_VACUUM_PAGES страниц), чтобы запись воркеров ждала не больше нескольких миллисекунд
+    Исключение — разовый перевод старой базы на auto_vacuum (MAINTENANCE_VACUUM_CONVERT): только
+    в простое и не во время копии
+    """
+
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self.last_report = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self):
+        """Фоновая задача"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._wait_idle()
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Database maintenance failed: {e}")
+
+    async def _idle(self) -> bool:
+        """Пайплайн простаивает: очередь пуста и ничего не выполняется"""
+        if pipeline.queue is not None:
+            return not pipeline.in_flight() and not pipeline.queue.qsize()
+        # Многопроцессный режим: очередь — таблица jobs
+        return not await db.get_job_counts()
+
+    async def _wait_idle(self):
+        deadline = time.monotonic() + MAINTENANCE_IDLE_WAIT
+        while time.monotonic() < deadline and not await self._idle():
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+
+    async def _pause(self):
+        await asyncio.sleep(BATCH_PAUSE if await self._idle() else BUSY_PAUSE)
+
+    async def run_once(self) -> dict:
+        """Один проход; возвращает отчёт (он же — в last_report для /status)"""
+        async with self._lock:
+            return await self._run_once()
+
+    async def _convert(self, info: dict) -> bool:
+        """Разовый VACUUM старой базы, если разрешён и никому не помешает; True — сделан"""
+        if not MAINTENANCE_VACUUM_CONVERT:
+            logger.warning("auto_vacuum is off: free pages are not returned to the file system; "
+                           "set MAINTENANCE_VACUUM_CONVERT = True or run VACUUM once with the bot stopped")
+            return False
+        if backup.running or not await self._idle():
+            logger.info("Postponing the one-time VACUUM for auto_vacuum: pipeline busy or backup running")
+            return False
+        size = info["page_count"] * info["page_size"]
+        logger.warning(f"Running the one-time VACUUM to enable auto_vacuum ({format_file_size(size)}), "
+                       f"database writes wait until it finishes")
+        started = time.monotonic()
+        await db.convert_to_incremental_vacuum()
+        logger.info(f"VACUUM finished in {time.monotonic() - started:.1f}s, auto_vacuum is now incremental")
+        return True
+
+    async def _run_once(self) -> dict:
+        started = time.monotonic()
+        before = await db.get_storage_info()
+        report = {"stats_rows": 0, "texts_pruned": 0, "text_chars": 0, "pages_freed": 0}
+
+        for day in await db.get_stats_days_to_rollup(_utc_cutoff(STATS_ROLLUP_DAYS)[:10]):
+            while True:
+                rows = await db.rollup_stats(day, MAINTENANCE_BATCH)
+                if not rows:
+                    break
+                report["stats_rows"] += rows
+                await self._pause()
+
+        if POST_TEXT_RETENTION_DAYS is not None:
+            cutoff = _utc_cutoff(POST_TEXT_RETENTION_DAYS)
+            while True:
+                posts, chars = await db.prune_post_texts(cutoff, POST_TEXT_PRUNE_CHARS, MAINTENANCE_BATCH_CHARS)
+                if not posts:
+                    break
+                report["texts_pruned"] += posts
+                report["text_chars"] += chars
+                await self._pause()
+
+        if before["auto_vacuum"] == 2:
+            while True:
+                freed = await db.incremental_vacuum(MAINTENANCE_VACUUM_PAGES)
+                if not freed:
+                    break
+                report["pages_freed"] += freed
+                await self._pause()
+        elif await self._convert(before):
+            # VACUUM вернул все свободные страницы разом
+            report["pages_freed"] = max(0, before["page_count"] - (await db.get_storage_info())["page_count"])
+
+        await db.optimize()
+
+        report["reclaimed_bytes"] = report["pages_freed"] * before["page_size"]
+        report["size_bytes"] = (await db.get_storage_info())["page_count"] * before["page_size"]
+        report["duration"] = time.monotonic() - started
+        report["finished_at"] = time.time()
+        self.last_report = report
+        logger.info(
+            f"Database maintenance: {report['stats_rows']} stats rows rolled up, "
+            f"{report['texts_pruned']} post texts pruned, "
+            f"{format_file_size(report['reclaimed_bytes'])} reclaimed, "
+            f"size {format_file_size(report['size_bytes'])} ({report['duration']:.1f}s)"
+        )
+        return report
+
+
+maintenance = Maintenance()
@@ -0,0 +1,73 @@
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+
+class Metrics:
+    """
+    Метрики пайплайна в памяти процесса (латентности стадий, счётчики и текущие значения)
+    Латентностей хранится не больше max_samples последних на стадию — бот работает месяцами,
+    перцентили считаются по свежему окну, а count — по всем замерам
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.latencies = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self.observed = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.gauges = {}
+
+    def observe(self, stage: str, seconds: float):
+        """Записывает длительность одной операции стадии"""
+        self.latencies[stage].append(seconds)
+        self.observed[stage] += 1
+
+    def inc(self, name: str, value: int = 1):
+        """Увеличивает счётчик"""
+        self.counters[name] += value
+
+    def set(self, name: str, value: float):
+        """Запоминает текущее значение (последнее перезаписывает прежнее)"""
+        self.gauges[name] = value
+
+    @asynccontextmanager
+    async def timer(self, stage: str):
+        """Замеряет длительность блока и записывает её в стадию"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def percentile(self, stage: str, pct: float) -> float:
+        """Возвращает перцентиль латентности стадии (в секундах)"""
+        values = sorted(self.latencies.get(stage, []))
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+        return values[index]
+
+    def snapshot(self) -> dict:
+        """Сводка: количество, p50 и p99 по стадиям, значения счётчиков и текущие значения"""
+        return {
+            "stages": {
+                stage: {
+                    "count": self.observed[stage],
+                    "p50": self.percentile(stage, 50),
+                    "p99": self.percentile(stage, 99),
+                }
+                for stage, values in self.latencies.items()
+            },
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+        }
+
+    def reset(self):
+        """Сбрасывает все накопленные значения"""
+        self.latencies.clear()
+        self.observed.clear()
+        self.counters.clear()
+        self.gauges.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from config import CHECK_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_RATELIMIT_RESERVE, SYNC_CHECK_INTERVAL
+from modules.database import db
+from modules.logger import logger
+
+
+class AdaptivePoller:
+    """
+    Расписание проходов фетчера по аккаунтам: проход с новыми лайками вдвое сокращает интервал
+    (не меньше POLL_MIN_INTERVAL), пустой или неудачный — увеличивает в полтора раза
+    (не больше POLL_MAX_INTERVAL); если в окне лимита Реддита осталось меньше
+    POLL_RATELIMIT_RESERVE запросов, следующий проход — не раньше сброса окна
+    /sync (request_sync) будит фетчеры сразу; в многопроцессном режиме (shared) запрос
+    передаётся процессу фетчера через таблицу jobs
+    """
+
+    def __init__(self, start: float = CHECK_INTERVAL, min_interval: float = POLL_MIN_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL):
+        self.start = start
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.shared = False
+        self._intervals = {}
+        self._next_at = {}
+        # id самого свежего лайка прошлого прохода: следующий проход разбирает ленту только до него
+        self._newest = {}
+        self._wakeups = {}
+        # Последний проход: (время, новых постов или None — ошибка)
+        self._last = {}
+
+    def stop_at(self, account: str):
+        return self._newest.get(account)
+
+    def record(self, account: str, posts: list, new_posts: int = None, limits: dict = None) -> float:
+        """
+        Учитывает проход (posts — разобранные посты, new_posts — новых среди них, None — ошибка)
+        и возвращает паузу до следующего
+        """
+        interval = self._intervals.get(account, self.start)
+        if new_posts:
+            interval = max(self.min_interval, interval / 2)
+        else:
+            interval = min(self.max_interval, interval * 1.5)
+        self._intervals[account] = interval
+        self._last[account] = (time.time(), new_posts)
+        if new_posts is not None and posts:
+            self._newest[account] = posts[0]['id']
+
+        delay = interval
+        if limits and limits.get('remaining') is not None and limits['remaining'] < POLL_RATELIMIT_RESERVE:
+            reset_in = (limits.get('reset_timestamp') or 0) - time.time()
+            if reset_in > delay:
+                logger.warning(f"Reddit rate limit almost exhausted ({limits['remaining']:.0f} left), "
+                               f"next pass for {account} in {reset_in:.0f}s")
+                delay = reset_in
+        self._next_at[account] = time.time() + delay
+        return delay
+
+    def _wakeup(self, account: str) -> asyncio.Event:
+        if account not in self._wakeups:
+            self._wakeups[account] = asyncio.Event()
+        return self._wakeups[account]
+
+    async def wait(self, account: str, delay: float) -> bool:
+        """Пауза до следующего прохода; True — разбужены /sync"""
+        wakeup = self._wakeup(account)
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            wakeup.clear()
+
+    def _wake(self, account: str = None):
+        for name, wakeup in self._wakeups.items():
+            if account is None or name == account:
+                wakeup.set()
+
+    async def request_sync(self, account: str = None):
+        """Внеочередной проход для аккаунта (None — для всех)"""
+        if self.shared:
+            await db.enqueue_job("sync", "", {"type": "sync", "account": account})
+        else:
+            self._wake(account)
+
+    async def watch_requests(self):
+        """Фоновая задача процесса фетчера (многопроцессный режим): забирает запросы /sync из jobs"""
+        while True:
+            await asyncio.sleep(SYNC_CHECK_INTERVAL)
+            try:
+                for request in await db.take_jobs(["sync"]):
+                    self._wake(request.get("account"))
+            except Exception as e:
+                logger.error(f"Error checking sync requests: {e}")
+
+    def snapshot(self) -> dict:
+        """
+        {аккаунт: (текущий интервал, секунд до следующего прохода, секунд с прошлого прохода,
+        новых постов в нём или None — ошибка)} для /status
+        """
+        now = time.time()
+        return {
+            account: (interval, max(0.0, self._next_at.get(account, now) - now),
+                      now - self._last[account][0], self._last[account][1])
+            for account, interval in self._intervals.items()
+        }
+
+
+poller = AdaptivePoller()
@@ -1,112 +1,213 @@
-import praw
-from config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
+from config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, REDDIT_API_URL
+from modules.accounts import Account, get_account
 from modules.logger import logger
+from modules.renditions import RenditionSelector
+from modules.resolvers import media_resolver
+
+# Одна HTTP-сессия requests на все аккаунты (пул соединений к API Реддита)
+_http_session = None
+
+
+def _get_http_session():
+    global _http_session
+    if _http_session is None:
+        import requests
+        _http_session = requests.Session()
+    return _http_session
 
 
 class RedditClient:
-    def __init__(self):
-        self.reddit = praw.Reddit(
+    def __init__(self, account: Account):
+        self.account = account
+        self.renditions = RenditionSelector(max_quality=account.max_quality)
+        self._reddit = None
+
+    @property
+    def reddit(self):
+        """Клиент praw, создаётся при первом обращении"""
+        if self._reddit is None:
+            self._reddit = self._create_reddit()
+        return self._reddit
+
+    def _create_reddit(self):
+        import praw
+
+        settings = {"requestor_kwargs": {"session": _get_http_session()}}
+        if self.account.reddit_username:
+            settings.update(username=self.account.reddit_username,
+                            password=self.account.reddit_password)
+        if REDDIT_API_URL:
+            # Свой адрес API (локальная заглушка в бенчмарках)
+            settings.update(oauth_url=REDDIT_API_URL, reddit_url=REDDIT_API_URL)
+
+        return praw.Reddit(
             client_id=REDDIT_CLIENT_ID,
             client_secret=REDDIT_CLIENT_SECRET,
-            user_agent=REDDIT_USER_AGENT
+            user_agent=REDDIT_USER_AGENT,
+            **settings
         )
 
-    async def get_liked_posts(self, limit: int = 100):
-        """Получает лайкнутые посты текущего пользователя"""
+    def get_liked_posts(self, limit: int = 100, stop_at: str = None):
+        """
+        Получает лайкнутые посты текущего пользователя (блокирующий, вызывать через to_thread)
+        stop_at — id поста, до которого лента уже разобрана прошлым проходом: дальше не идём
+        """
         try:
             me = self.reddit.user.me()
             liked_posts = []
 
-            for post in me.liked(limit=limit):
+            for post in me.upvoted(limit=limit):
+                if post.id == stop_at:
+                    break
                 try:
-                    post_data = {
-                        "id": post.id,
-                        "title": post.title,
-                        "author": str(post.author) if post.author else "[deleted]",
-                        "selftext": post.selftext,
-                        "url": post.url,
-                        "permalink": post.permalink,
-                        "full_url": f"https://reddit.com{post.permalink}",
-                        "media": self._extract_media(post),
-                        "is_deleted": post.removed_by_moderator or post.author is None,
-                    }
-                    liked_posts.append(post_data)
+                    liked_posts.append(self._post_to_dict(post))
                 except Exception as e:
                     logger.warning(f"Error processing post {post.id}: {e}")
                     continue
 
-            logger.info(f"Fetched {len(liked_posts)} liked posts from Reddit")
+            logger.info(f"Fetched {len(liked_posts)} liked posts from Reddit for {self.account.name}")
             return liked_posts
 
         except Exception as e:
             logger.error(f"Error fetching liked posts: {e}")
             raise
 
-    def _extract_media(self, post) -> list:
-        """Извлекает медиа из поста"""
+    def rate_limits(self) -> dict:
+        """Остаток лимита запросов Реддита по заголовкам последнего ответа (None — запросов ещё не было)"""
+        if self._reddit is None:
+            return None
+        return self._reddit.auth.limits
+
+    def get_listing_page(self, listing: str, after: str = None, limit: int = 100) -> tuple[list, str]:
+        """
+        Одна страница листинга пользователя (upvoted, saved) начиная с курсора after
+        Возвращает (посты, курсор следующей страницы или None, если листинг кончился)
+        Блокирующий, вызывать через to_thread; паузы по лимитам Реддита выдерживает praw
+        """
+        me = self.reddit.user.me()
+        generator = getattr(me, listing)(limit=limit, params={"after": after} if after else None)
+
+        posts = []
+        for item in generator:
+            # В saved бывают комментарии — архивируем только посты
+            if not hasattr(item, 'title'):
+                continue
+            try:
+                posts.append(self._post_to_dict(item))
+            except Exception as e:
+                logger.warning(f"Error processing post {item.id}: {e}")
+
+        # praw сдвигает params["after"], только если у листинга есть следующая страница
+        next_after = generator.params.get("after")
+        return posts, next_after if next_after != after else None
+
+    def _post_to_dict(self, post) -> dict:
+        """Данные поста, нужные пайплайну"""
+        return {
+            "id": post.id,
+            "title": post.title,
+            "author": str(post.author) if post.author else "[deleted]",
+            "selftext": post.selftext,
+            "url": post.url,
+            "permalink": post.permalink,
+            "full_url": f"https://reddit.com{post.permalink}",
+            "media": self._extract_media(vars(post)),
+            # Кросспост: id родительского поста (fullname t3_xxx без префикса) или None
+            "crosspost_parent": (vars(post).get('crosspost_parent') or '').removeprefix('t3_') or None,
+            "is_deleted": post.removed_by_category is not None or post.author is None,
+        }
+
+    def _extract_media(self, data: dict) -> list:
+        """
+        Извлекает медиа из данных поста (словарь листинга: обращение к отсутствующему
+        атрибуту Submission praw догружает пост отдельным запросом)
+        Ссылки на страницы хостингов — вложения типа "link", их разбирает media_resolver
+        """
         media_list = []
 
         try:
-            # Если есть embedded media (видео, гифка)
-            if hasattr(post, 'media') and post.media:
-                if 'reddit_video' in post.media:
-                    video_url = post.media['reddit_video']['fallback_url']
-                    media_list.append({
-                        "url": video_url,
-                        "type": "video",
-                        "caption": None
-                    })
-                elif 'oembed' in post.media:
-                    # Для других типов медиа
-                    pass
+            # Кросспост: медиа лежат в родительском посте, он целиком есть в листинге
+            parents = data.get('crosspost_parent_list')
+            if parents:
+                return self._extract_media(parents[0])
+
+            # Если есть embedded media (видео)
+            media = data.get('media') or {}
+            if 'reddit_video' in media:
+                video_url = self.renditions.video(media['reddit_video'])
+                fallback_url = media['reddit_video']['fallback_url']
+                media_list.append({
+                    "url": video_url,
+                    "type": "video",
+                    "caption": None,
+                    # Угаданного варианта DASH может не быть — тогда качается исходный
+                    "fallback_url": fallback_url if fallback_url != video_url else None,
+                })
+
+            url = data.get('url') or ""
 
             # Если это gallery пост
-            if hasattr(post, 'gallery_data') and post.gallery_data:
-                for item in post.gallery_data.get('items', []):
+            if data.get('gallery_data'):
+                media_metadata = data.get('media_metadata') or {}
+                for item in data['gallery_data'].get('items', []):
                     media_id = item['media_id']
-                    if media_id in post.media_metadata:
-                        media_meta = post.media_metadata[media_id]
-
-                        if media_meta['type'] == 'image':
-                            url = media_meta['s']['x']
-                            caption = item.get('caption', None)
-                        elif media_meta['type'] == 'giphy':
-                            url = media_meta['s']['x']
-                            caption = item.get('caption', None)
-                        else:
+                    if media_id in media_metadata:
+                        media_meta = media_metadata[media_id]
+
+                        # Тип элемента в поле e (Image, AnimatedImage)
+                        if media_meta.get('status') != 'valid' or \
+                                media_meta.get('e') not in ('Image', 'AnimatedImage'):
                             continue
 
+                        url, media_type = self.renditions.gallery_item(media_meta)
                         media_list.append({
                             "url": url,
-                            "type": "image" if media_meta['type'] == 'image' else "gif",
-                            "caption": caption
+                            "type": media_type,
+                            "caption": item.get('caption', None)
                         })
 
-            # Если это одиночная картинка/видео с URL
-            elif post.is_video:
-                video_url = post.media['reddit_video']['fallback_url']
+            # Видео Реддита уже добавлено выше из media
+            elif data.get('is_video'):
+                pass
+
+            # Альбом, redgifs и прочие страницы — разберёт резолвер; превью — на случай, если файлов нет
+            elif media_resolver.needs_resolving(url):
                 media_list.append({
-                    "url": video_url,
-                    "type": "video",
-                    "caption": None
+                    "url": url,
+                    "type": "link",
+                    "caption": None,
+                    "fallback_url": self._preview_url(data),
                 })
 
-            elif post.is_gallery:
-                # Обработка галереи (см. выше)
-                pass
-
-            elif 'imgur' in post.url or 'gfycat' in post.url or \
-                    post.url.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
+            elif url.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
+                media_type = "image"
+                if data.get('preview'):
+                    # gif — его mp4-вариант, картинка — уменьшенная копия, если исходник больше нужного
+                    url, media_type = self.renditions.preview_file(data['preview'], url)
                 media_list.append({
-                    "url": post.url,
-                    "type": "image",
+                    "url": url,
+                    "type": media_type,
                     "caption": None
                 })
 
         except Exception as e:
-            logger.warning(f"Error extracting media from post {post.id}: {e}")
+            logger.warning(f"Error extracting media from post {data.get('id')}: {e}")
 
         return media_list
 
+    def _preview_url(self, data: dict):
+        """Превью-картинка Реддита (preview.redd.it) нужного размера или None"""
+        if not (data.get('preview') or {}).get('images'):
+            return None
+        return self.renditions.preview(data['preview'])
+
+
+_clients = {}
+
 
-reddit_client = RedditClient()
+def get_reddit_client(account: Account = None) -> RedditClient:
+    """Клиент Реддита для аккаунта (по одному на аккаунт, создаются по требованию)"""
+    account = account or get_account()
+    if account.name not in _clients:
+        _clients[account.name] = RedditClient(account)
+    return _clients[account.name]
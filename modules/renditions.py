@@ -0,0 +1,95 @@
+import html
+import re
+from config import IMAGE_TARGET_SIDE, VIDEO_TARGET_HEIGHT, VIDEO_BYTE_BUDGET
+
+# Высоты, в которых v.redd.it кодирует варианты DASH (не выше исходной)
+DASH_HEIGHTS = (1080, 720, 480, 360, 240)
+DASH_PATTERN = re.compile(r"(DASH|CMAF)_(\d+)")
+
+
+class RenditionSelector:
+    """
+    Выбор варианта медиа из тех, что отдаёт Реддит: ТГ всё равно пережимает фото
+    до IMAGE_TARGET_SIDE по большей стороне, так что больше качать незачем;
+    видео — самый высокий вариант DASH не выше VIDEO_TARGET_HEIGHT, влезающий в VIDEO_BYTE_BUDGET
+    max_quality — всегда исходник
+    """
+
+    def __init__(self, max_quality: bool = False, image_side: int = IMAGE_TARGET_SIDE,
+                 video_height: int = VIDEO_TARGET_HEIGHT, video_budget: int = VIDEO_BYTE_BUDGET):
+        self.max_quality = max_quality
+        self.image_side = image_side
+        self.video_height = video_height
+        self.video_budget = video_budget
+
+    def image(self, candidates: list) -> str:
+        """
+        candidates — [(ширина, высота, url)]
+        Самый маленький вариант не меньше целевого, иначе самый большой
+        """
+        candidates = sorted(candidates, key=lambda item: max(item[0], item[1]))
+        if not self.max_quality:
+            for width, height, url in candidates:
+                if max(width, height) >= self.image_side:
+                    return url
+        return candidates[-1][2]
+
+    def gallery_item(self, meta: dict) -> tuple[str, str]:
+        """(url, тип) элемента галереи из media_metadata: 's' — исходник, 'p' — превью"""
+        source = meta['s']
+        if 'u' not in source:
+            # Анимация: mp4 в разы меньше gif
+            return source.get('mp4') or source['gif'], "gif"
+
+        candidates = [(item['x'], item['y'], html.unescape(item['u'])) for item in meta.get('p', [])]
+        candidates.append((source['x'], source['y'], html.unescape(source['u'])))
+        return self.image(candidates), "image"
+
+    def preview(self, preview: dict, source_url: str = None) -> str:
+        """
+        Вариант из preview.images поста; source_url — исходник вместо превью исходного размера
+        (для картинок i.redd.it, где превью — пережатая копия)
+        """
+        image = preview['images'][0]
+        source = image['source']
+        candidates = [(item['width'], item['height'], html.unescape(item['url']))
+                      for item in image.get('resolutions', [])]
+        candidates.append((source['width'], source['height'], source_url or html.unescape(source['url'])))
+        return self.image(candidates)
+
+    def preview_file(self, preview: dict, url: str) -> tuple[str, str]:
+        """(url, тип) для поста-картинки со ссылкой на файл url"""
+        if url.endswith('.gif'):
+            mp4 = preview['images'][0].get('variants', {}).get('mp4')
+            if mp4 and not self.max_quality:
+                return html.unescape(mp4['source']['url']), "gif"
+            return url, "image"
+        return self.preview(preview, source_url=url), "image"
+
+    def video(self, reddit_video: dict) -> str:
+        """
+        Вариант DASH из media.reddit_video; если имена вариантов не узнать — fallback_url
+        Варианты угадываются по DASH_HEIGHTS: не у каждого видео есть все высоты, поэтому
+        вызывающий сохраняет fallback_url как запасной
+        """
+        fallback_url = reddit_video['fallback_url']
+        height = reddit_video.get('height')
+        match = DASH_PATTERN.search(fallback_url)
+        if self.max_quality or not height or not match or int(match.group(2)) != height:
+            return fallback_url
+
+        # Размер варианта оцениваем по битрейту исходного, пропорционально числу пикселей
+        bitrate = reddit_video.get('bitrate_kbps')
+        duration = reddit_video.get('duration')
+        heights = [item for item in DASH_HEIGHTS if item < height] + [height]
+        chosen = min(heights)
+        for candidate in sorted(heights):
+            if candidate > self.video_height:
+                break
+            if bitrate and duration and bitrate * 125 * duration * (candidate / height) ** 2 > self.video_budget:
+                break
+            chosen = candidate
+
+        if chosen == height:
+            return fallback_url
+        return DASH_PATTERN.sub(f"{match.group(1)}_{chosen}", fallback_url, count=1)
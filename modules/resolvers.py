@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from config import (
+    RESOLVER_CONCURRENCY, RESOLVER_CACHE_SIZE, RESOLVER_CACHE_TTL, RESOLVER_NEGATIVE_TTL, IMGUR_CLIENT_ID
+)
+from modules.database import db
+from modules.logger import logger
+
+# Тип медиа по расширению прямой ссылки на файл
+EXTENSION_TYPES = {
+    ".jpg": "image", ".jpeg": "image", ".png": "image", ".webp": "image",
+    ".gif": "gif", ".mp4": "video",
+}
+
+IMGUR_API_URL = "https://api.imgur.com/3"
+REDGIFS_API_URL = "https://api.redgifs.com/v2"
+
+
+def media_item(url: str, media_type: str, caption: str = None) -> dict:
+    """Вложение в формате пайплайна"""
+    return {"url": url, "type": media_type, "caption": caption}
+
+
+def _host_matches(url: str, domain: str) -> bool:
+    host = urlparse(url).hostname or ""
+    return host == domain or host.endswith("." + domain)
+
+
+class Resolver:
+    """
+    Резолвер ссылок одного хостинга
+    resolve возвращает список вложений, [] — медиа по ссылке нет (кэшируется),
+    None — сейчас не узнать (не кэшируется); ошибки сети — исключением
+    """
+
+    def matches(self, url: str) -> bool:
+        raise NotImplementedError
+
+    async def resolve(self, url: str, session) -> list:
+        raise NotImplementedError
+
+
+class ImgurResolver(Resolver):
+    """imgur: альбомы и галереи через API (нужен IMGUR_CLIENT_ID), одиночные картинки и .gifv — без запросов"""
+
+    def matches(self, url: str) -> bool:
+        if not _host_matches(url, "imgur.com"):
+            return False
+        # Прямые файлы i.imgur.com качаются как есть, кроме .gifv (это HTML-страница с mp4)
+        return os.path.splitext(urlparse(url).path)[1].lower() not in EXTENSION_TYPES
+
+    async def resolve(self, url: str, session) -> list:
+        parts = [part for part in urlparse(url).path.split("/") if part]
+        if not parts:
+            return []
+
+        if parts[0] in ("a", "gallery") and len(parts) > 1:
+            # Новые ссылки на альбомы: /a/nazvanie-albuma-AbCdE — id после последнего дефиса
+            return await self._album(parts[1].rsplit("-", 1)[-1], session)
+
+        stem, extension = os.path.splitext(parts[-1])
+        if extension.lower() == ".gifv":
+            return [media_item(f"https://i.imgur.com/{stem}.mp4", "video")]
+        # imgur отдаёт файл по id с любым расширением
+        return [media_item(f"https://i.imgur.com/{stem}.jpg", "image")]
+
+    async def _album(self, album_id: str, session) -> list:
+        if not IMGUR_CLIENT_ID:
+            return None
+
+        async with session.get(
+            f"{IMGUR_API_URL}/album/{album_id}/images",
+            headers={"Authorization": f"Client-ID {IMGUR_CLIENT_ID}"}
+        ) as resp:
+            if resp.status == 404:
+                return []
+            resp.raise_for_status()
+            images = (await resp.json())["data"]
+
+        media_list = []
+        for image in images:
+            if image.get("animated") and image.get("mp4"):
+                media_list.append(media_item(image["mp4"], "video", image.get("description")))
+            else:
+                media_list.append(media_item(image["link"], "image", image.get("description")))
+        return media_list
+
+
+class RedgifsResolver(Resolver):
+    """redgifs: ссылка на mp4 через API с временным токеном"""
+
+    def __init__(self):
+        self._token = None
+
+    def matches(self, url: str) -> bool:
+        return _host_matches(url, "redgifs.com")
+
+    async def resolve(self, url: str, session) -> list:
+        gif_id = os.path.splitext(urlparse(url).path.rstrip("/").rsplit("/", 1)[-1])[0].lower()
+        if not gif_id:
+            return []
+
+        for attempt in range(2):
+            if self._token is None:
+                async with session.get(f"{REDGIFS_API_URL}/auth/temporary") as resp:
+                    resp.raise_for_status()
+                    self._token = (await resp.json())["token"]
+
+            async with session.get(
+                f"{REDGIFS_API_URL}/gifs/{gif_id}",
+                headers={"Authorization": f"Bearer {self._token}"}
+            ) as resp:
+                if resp.status == 401 and attempt == 0:
+                    # Токен истёк — берём новый
+                    self._token = None
+                    continue
+                if resp.status in (404, 410):
+                    return []
+                resp.raise_for_status()
+                urls = (await resp.json())["gif"]["urls"]
+
+            video_url = urls.get("hd") or urls.get("sd")
+            return [media_item(video_url, "video")] if video_url else []
+
+        return None
+
+
+class GfycatResolver(Resolver):
+    """gfycat закрыт в 2023 — медиа по ссылкам нет, остаётся превью Реддита"""
+
+    def matches(self, url: str) -> bool:
+        return _host_matches(url, "gfycat.com")
+
+    async def resolve(self, url: str, session) -> list:
+        return []
+
+
+class MediaResolver:
+    """
+    Стадия между Реддитом и очередью скачивания: ссылки на страницы (вложения типа "link")
+    параллельно превращаются в прямые ссылки на файлы. Результаты кэшируются в памяти (LRU)
+    и в БД с TTL — повторные посты и перезапуски обходятся без запросов к хостингам
+    """
+
+    def __init__(self, resolvers: list = None, concurrency: int = RESOLVER_CONCURRENCY,
+                 cache_size: int = RESOLVER_CACHE_SIZE):
+        self.resolvers = resolvers if resolvers is not None else [
+            ImgurResolver(), RedgifsResolver(), GfycatResolver()
+        ]
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    def resolver_for(self, url: str):
+        """Первый резолвер, который берётся за ссылку, или None"""
+        return next((resolver for resolver in self.resolvers if resolver.matches(url)), None)
+
+    def needs_resolving(self, url: str) -> bool:
+        return self.resolver_for(url) is not None
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self._session
+
+    async def close(self):
+        """Закрывает HTTP-сессию"""
+        if self._session is not None:
+            await self._session.close()
+
+    async def resolve_posts(self, posts: list):
+        """
+        Заменяет в постах вложения-ссылки найденными файлами (или превью Реддита, если файлов нет)
+        Ссылка, которую хостинг сейчас не разобрал (None) и у которой нет превью, остаётся вложением
+        типа "link" — её снова разберёт задача скачивания, а не потеряет пост
+        """
+        links = {media["url"] for post in posts for media in post.get("media", []) if media["type"] == "link"}
+        if not links:
+            return
+
+        links = list(links)
+        results = dict(zip(links, await asyncio.gather(*(self.resolve(url) for url in links))))
+
+        for post in posts:
+            media_list = []
+            for media in post.get("media", []):
+                if media["type"] != "link":
+                    media_list.append(media)
+                    continue
+
+                resolved = results[media["url"]]
+                if resolved:
+                    media_list.extend(resolved)
+                elif media.get("fallback_url"):
+                    media_list.append(media_item(media["fallback_url"], "image", media.get("caption")))
+                elif resolved is None:
+                    logger.warning(f"Could not resolve {media['url']} in post {post['id']}, will retry on download")
+                    media_list.append(media_item(media["url"], "link", media.get("caption")))
+                else:
+                    logger.info(f"No media behind {media['url']} in post {post['id']}")
+            post["media"] = media_list
+
+    async def resolve(self, url: str) -> list:
+        """Вложения по ссылке (см. Resolver.resolve); None — при ошибке"""
+        cached = await self._get_cached(url)
+        if cached is not None:
+            return cached
+
+        async with self._semaphore:
+            try:
+                media = await self.resolver_for(url).resolve(url, self._get_session())
+            except Exception as e:
+                logger.warning(f"Error resolving {url}: {e}")
+                return None
+
+        if media is not None:
+            expires_at = time.time() + (RESOLVER_CACHE_TTL if media else RESOLVER_NEGATIVE_TTL)
+            self._remember(url, media, expires_at)
+            await db.save_resolved_url(url, media, expires_at)
+        return media
+
+    async def _get_cached(self, url: str):
+        entry = self._cache.get(url)
+        if entry is None:
+            entry = await db.get_resolved_url(url)
+            if entry is not None:
+                self._remember(url, *entry)
+        else:
+            self._cache.move_to_end(url)
+
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def _remember(self, url: str, media: list, expires_at: float):
+        self._cache[url] = (media, expires_at)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+media_resolver = MediaResolver()
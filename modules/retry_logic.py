@@ -1,21 +1,29 @@
-import asyncio
 from config import RETRY_CONFIG
+from modules.circuit_breaker import CircuitOpenError
 from modules.logger import logger
+from modules.metrics import metrics
+from modules.shutdown import shutdown
+from modules.status import pipeline
 
 
-async def retry_with_backoff(coro, attachment_id: int, send_admin_alert_func):
+async def retry_with_backoff(coro_factory, attachment_id: int, send_admin_alert_func):
     """
-    Повторяет корутину с экспоненциальной задержкой
+    Повторяет корутину с экспоненциальной задержкой; coro_factory() создаёт новую корутину
+    на каждую попытку (одну и ту же корутину нельзя ждать дважды)
     Возвращает результат если успех, иначе None
+    CircuitOpenError пробрасывается сразу: хост недоступен, попытки тратить незачем
     """
     max_retries = RETRY_CONFIG["max_retries"]
     alert_after_retry = RETRY_CONFIG["alert_after_retry"]
     initial_delay = RETRY_CONFIG["initial_delay"]
     backoff_multiplier = RETRY_CONFIG["backoff_multiplier"]
 
+    progress = pipeline.progress()
     for attempt in range(1, max_retries + 1):
+        if progress and attempt > 1:
+            progress.new_attempt(attempt)
         try:
-            result = await coro
+            result = await coro_factory()
 
             # Если успех после 5+ попыток, уведомляем админа
             if attempt > alert_after_retry:
@@ -26,6 +34,9 @@ async def retry_with_backoff(coro, attachment_id: int, send_admin_alert_func):
             logger.info(f"Success on attempt {attempt} for attachment {attachment_id}")
             return result
 
+        except CircuitOpenError:
+            raise
+
         except Exception as e:
             if attempt == alert_after_retry:
                 # После 5 попыток отправляем первый алерт
@@ -41,11 +52,13 @@ async def retry_with_backoff(coro, attachment_id: int, send_admin_alert_func):
                 logger.error(f"Failed after {max_retries} attempts for attachment {attachment_id}: {e}")
                 return None
 
+            metrics.inc('task_retries')
             # Рассчитываем задержку с backoff
             delay = initial_delay * (backoff_multiplier ** (attempt - 1))
             logger.warning(f"Attempt {attempt}/{max_retries} failed for attachment {attachment_id}. "
                            f"Retrying in {delay:.0f}s: {e}")
 
-            await asyncio.sleep(delay)
+            # При остановке воркер в паузе отменяется сразу, не дожидаясь grace
+            await shutdown.pause(delay)
 
     return None
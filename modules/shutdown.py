@@ -0,0 +1,83 @@
+import asyncio
+import contextlib
+from config import SHUTDOWN_GRACE_SECONDS
+from modules.logger import logger
+
+
+class ShutdownCoordinator:
+    """
+    Остановка процесса по сигналу: приём новых задач прекращается сразу,
+    начатые загрузки доделываются, пока не истекут grace секунд, остальное отменяется
+    Воркер помечает выполнение задачи через busy(); ожидание очереди и паузы между попытками
+    (pause) не считаются работой — такие воркеры отменяются без ожидания
+    Второй сигнал — остановка без ожидания
+    """
+
+    def __init__(self, grace: float = SHUTDOWN_GRACE_SECONDS):
+        self.grace = grace
+        self.requested = asyncio.Event()
+        self.forced = False
+        self._busy = set()
+
+    def request(self, reason: str):
+        """Запрос остановки (из обработчика сигнала)"""
+        if self.requested.is_set():
+            logger.warning(f"{reason} again, stopping without waiting for uploads")
+            self.forced = True
+            return
+        logger.info(f"{reason}, shutting down (grace {self.grace:.0f}s)...")
+        self.requested.set()
+
+    @contextlib.contextmanager
+    def busy(self):
+        """Текущая задача asyncio выполняет работу, которую стоит доделать при остановке"""
+        task = asyncio.current_task()
+        self._busy.add(task)
+        try:
+            yield
+        finally:
+            self._busy.discard(task)
+
+    async def pause(self, delay: float):
+        """Пауза между попытками: на время ожидания задача не считается занятой"""
+        task = asyncio.current_task()
+        was_busy = task in self._busy
+        self._busy.discard(task)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            if was_busy:
+                self._busy.add(task)
+
+    async def drain(self, intake: list, workers: list) -> int:
+        """
+        Отменяет задачи приёма (фетчеры, polling, догрузку истории) и ждёт воркеры:
+        свободные отменяются сразу, занятые — по истечении grace
+        Возвращает, сколько задач было прервано посреди работы
+        """
+        for task in intake:
+            task.cancel()
+        await asyncio.gather(*intake, return_exceptions=True)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.grace
+        cancelled = set()
+        interrupted = 0
+        pending = {task for task in workers if not task.done()}
+
+        while pending:
+            expired = self.forced or loop.time() >= deadline
+            for task in pending - cancelled:
+                if task not in self._busy or expired:
+                    if task in self._busy:
+                        interrupted += 1
+                    task.cancel()
+                    cancelled.add(task)
+            done, pending = await asyncio.wait(pending, timeout=0.2)
+
+        if interrupted:
+            logger.warning(f"Grace period expired, {interrupted} tasks interrupted (reconcile will resume them)")
+        return interrupted
+
+
+shutdown = ShutdownCoordinator()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class TaskProgress:
+    """Задача в работе: с какого момента, какая попытка, сколько байт скачано из скольких"""
+    __slots__ = ("task", "started", "attempt", "bytes_done", "bytes_total", "attempt_started")
+
+    def __init__(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.attempt = 1
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.attempt_started = self.started
+
+    def new_attempt(self, attempt: int):
+        """Повтор начинает скачивание заново"""
+        self.attempt = attempt
+        self.bytes_done = 0
+        self.attempt_started = time.monotonic()
+
+    def advance(self, size: int):
+        self.bytes_done += size
+
+    def rate(self) -> float:
+        """Скорость текущей попытки, байт/с"""
+        elapsed = time.monotonic() - self.attempt_started
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+
+class PipelineStatus:
+    """
+    Состояние пайплайна в памяти процесса для /status: задачи в работе с прогрессом,
+    очередь и отложенные задачи (их регистрирует main) — /status не ходит в БД
+    и отвечает, даже когда та занята
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.queue = None
+        self.parked = {}
+
+    def attach(self, queue, parked: dict):
+        """Очередь процесса и отложенные до пробы хоста задачи (однопроцессный режим)"""
+        self.queue = queue
+        self.parked = parked
+
+    @contextmanager
+    def track(self, task):
+        """Задача выполняется текущей задачей asyncio (воркером)"""
+        key = asyncio.current_task()
+        progress = TaskProgress(task)
+        self._in_flight[key] = progress
+        try:
+            yield progress
+        finally:
+            self._in_flight.pop(key, None)
+
+    def progress(self) -> TaskProgress:
+        """Прогресс задачи текущего воркера (None — вне воркера)"""
+        return self._in_flight.get(asyncio.current_task())
+
+    def in_flight(self) -> list:
+        return sorted(self._in_flight.values(), key=lambda item: item.started)
+
+    def reserved_bytes(self) -> int:
+        """Сколько ещё займут на диске идущие скачивания (по Content-Length или скачанному)"""
+        return sum(max(item.bytes_total, item.bytes_done)
+                   for item in self._in_flight.values() if item.task.type == "download")
+
+    def queued_by_type(self) -> dict:
+        if self.queue is None:
+            return {}
+        return dict(Counter(task.type for task in self.queue))
+
+    def parked_by_type(self) -> dict:
+        return dict(Counter(task.type for _, task in self.parked.values()))
+
+
+pipeline = PipelineStatus()
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from config import POST_CACHE_SIZE, LANE_LARGE_BYTES
+from modules.database import db
+
+
+class Task:
+    """
+    Задача пайплайна: только идентификаторы и счётчики, без текста поста и списка медиа —
+    ссылка и подпись вложения лежат в attachments, текст поста в posts; воркер читает их при выполнении
+    type: download/upload (с attachment_id) или text; lane — полоса очереди по стоимости (см. media_lane)
+    parked_at — когда задачу впервые отложили до пробы хоста (unix time, 0 — не откладывали)
+    """
+    __slots__ = ("type", "post_id", "account", "attachment_id", "lane", "parts_sent", "retry_count", "parked_at")
+
+    def __init__(self, type: str, post_id: str, account: str = None, attachment_id: int = None,
+                 lane: str = None, parts_sent: int = 0, retry_count: int = 0, parked_at: float = 0):
+        self.type = type
+        self.post_id = post_id
+        self.account = account
+        self.attachment_id = attachment_id
+        self.lane = lane or ("text" if type == "text" else "small")
+        self.parts_sent = parts_sent
+        self.retry_count = retry_count
+        self.parked_at = parked_at
+
+    def to_dict(self) -> dict:
+        """Payload для таблицы jobs"""
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Task":
+        """Из payload таблицы jobs; лишние поля (post_data и media старых версий) отбрасываются"""
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def __repr__(self):
+        return f"Task({self.type}, post={self.post_id}, attachment={self.attachment_id})"
+
+
+def media_lane(media_type: str, size: int = 0) -> str:
+    """
+    Полоса очереди вложения: "large" — файлы больше LANE_LARGE_BYTES и видео неизвестного размера,
+    остальное — "small"
+    """
+    if size:
+        return "large" if size > LANE_LARGE_BYTES else "small"
+    return "large" if media_type == "video" else "small"
+
+
+def post_data_from_row(row) -> dict:
+    """post_data для отправки (заголовок, текст, ссылка) из строки posts"""
+    source_url = row['source_url'] or ""
+    return {
+        "id": row['reddit_post_id'],
+        "title": row['title'],
+        "selftext": row['content'] or "",
+        "permalink": source_url.removeprefix("https://reddit.com"),
+        "full_url": source_url,
+    }
+
+
+class PostCache:
+    """
+    post_data по id поста из БД; небольшой LRU, потому что вложения одного поста
+    обычно идут в очереди подряд и без него каждое читало бы пост заново
+    """
+
+    def __init__(self, size: int = POST_CACHE_SIZE):
+        self.size = size
+        self._cache = OrderedDict()
+
+    async def get(self, post_id: str):
+        """post_data или None, если поста нет в БД"""
+        post_data = self._cache.get(post_id)
+        if post_data is not None:
+            self._cache.move_to_end(post_id)
+            return post_data
+
+        row = await db.get_post_text(post_id)
+        if row is None:
+            return None
+        post_data = post_data_from_row(row)
+        self._cache[post_id] = post_data
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return post_data
+
+
+post_cache = PostCache()
@@ -1,24 +1,171 @@
 import asyncio
+import os
+import time
 from pathlib import Path
-from aiogram import Bot
-from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, LinkPreviewOptions
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID, MAX_TELEGRAM_MEDIA_GROUP
+from urllib.parse import urlparse
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID, TELEGRAM_API_URL, MAX_TELEGRAM_MEDIA_GROUP,
+    TELEGRAM_CHAT_INTERVAL, TELEGRAM_GLOBAL_RATE, TEMP_DIR,
+    TELEGRAM_LOCAL_API_URL, TELEGRAM_LOCAL_ROUTE_SIZE, TELEGRAM_LOCAL_FILE_URIS, TELEGRAM_LOCAL_TEMP_DIR,
+    TELEGRAM_LOCAL_API_TIMEOUT, TELEGRAM_CLOUD_UPLOAD_LIMIT, TELEGRAM_LOCAL_UPLOAD_LIMIT
+)
+from modules.circuit_breaker import breakers
 from modules.logger import logger
-from modules.database import db
+from modules.metrics import metrics
+
+
+def create_bot(api_url: str = TELEGRAM_API_URL, is_local: bool = False):
+    """
+    Создаёт бота; если задан api_url — ходит на этот сервер Bot API
+    is_local — свой сервер в режиме --local (большие файлы, долгие запросы)
+    """
+    # aiogram тяжёлый — импортируем только когда бот реально нужен
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    session = None
+    if is_local:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url, is_local=True),
+                                 timeout=TELEGRAM_LOCAL_API_TIMEOUT)
+    elif api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    return Bot(token=TELEGRAM_BOT_TOKEN, session=session)
+
+
+def _endpoint_name(api_url: str) -> str:
+    """Имя сервера Bot API для предохранителя"""
+    return f"telegram:{urlparse(api_url).netloc if api_url else 'api.telegram.org'}"
+
+
+class RateLimiter:
+    """
+    Общий на процесс лимит отправок: не чаще chat_interval в один чат
+    и не больше global_rate запросов в секунду на бота (все аккаунты и каналы)
+    """
+
+    def __init__(self, chat_interval: float, global_rate: float):
+        self.chat_interval = chat_interval
+        self.global_interval = 1 / global_rate
+        self._next_global = 0.0
+        self._next_chat = {}
+
+    async def wait(self, chat_id: int):
+        """Резервирует ближайший свободный слот и ждёт его"""
+        now = time.monotonic()
+        slot = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+        self._next_global = slot + self.global_interval
+        self._next_chat[chat_id] = slot + self.chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def headroom(self) -> tuple[float, float]:
+        """
+        Запас лимита для /status: (через сколько секунд освободится общий слот,
+        самое долгое ожидание слота чата) — 0 значит, что отправка уйдёт сразу
+        """
+        now = time.monotonic()
+        chat_wait = max((slot - now for slot in self._next_chat.values()), default=0.0)
+        return max(0.0, self._next_global - now), max(0.0, chat_wait)
 
 
 class TelegramClient:
     def __init__(self):
-        self.bot = Bot(token=TELEGRAM_BOT_TOKEN)
+        self._bot = None
+        self._local_bot = None
         self.channel_id = TELEGRAM_CHANNEL_ID
+        self.limiter = RateLimiter(TELEGRAM_CHAT_INTERVAL, TELEGRAM_GLOBAL_RATE)
+        # Последний ответ 429: (time.time(), retry_after) — для /status
+        self.last_retry_after = None
+        # Предохранители серверов Bot API: пока сервер лежит, задачи откладываются, а не перебирают попытки
+        self.breaker = breakers.get(_endpoint_name(TELEGRAM_API_URL))
+        self.local_breaker = breakers.get(_endpoint_name(TELEGRAM_LOCAL_API_URL)) if TELEGRAM_LOCAL_API_URL else None
+        # Самый большой файл, который бот может загрузить
+        self.max_upload_size = TELEGRAM_LOCAL_UPLOAD_LIMIT if TELEGRAM_LOCAL_API_URL else TELEGRAM_CLOUD_UPLOAD_LIMIT
+
+    @property
+    def bot(self):
+        """Единственный экземпляр Bot (и его HTTP-сессия) на процесс, создаётся при первом обращении"""
+        if self._bot is None:
+            self._bot = create_bot()
+        return self._bot
+
+    @property
+    def local_bot(self):
+        """Тот же бот через свой сервер Bot API (TELEGRAM_LOCAL_API_URL)"""
+        if self._local_bot is None:
+            self._local_bot = create_bot(TELEGRAM_LOCAL_API_URL, is_local=True)
+        return self._local_bot
+
+    async def close(self):
+        """Закрывает HTTP-сессии ботов, если они создавались"""
+        for bot in (self._bot, self._local_bot):
+            if bot is not None:
+                await bot.session.close()
+
+    async def _use_local_server(self, attachments: list) -> bool:
+        """
+        Большие файлы — через свой сервер: облако их не примет или будет долго тянуть через Python
+        Размеры — stat в потоке: на медленном диске он остановил бы loop
+        """
+        if not TELEGRAM_LOCAL_API_URL:
+            return False
+
+        def largest() -> int:
+            return max(os.path.getsize(att['local_path']) for att in attachments)
+
+        return await asyncio.to_thread(largest) >= TELEGRAM_LOCAL_ROUTE_SIZE
 
-    async def send_media_groups(self, attachments: list, post_data: dict) -> list:
+    def _local_file(self, local_path: str):
+        """Файл для своего сервера: путь file:// (сервер читает его сам) или обычная загрузка"""
+        from aiogram.types import FSInputFile
+
+        if not TELEGRAM_LOCAL_FILE_URIS:
+            return FSInputFile(local_path)
+        path = Path(local_path).resolve()
+        if TELEGRAM_LOCAL_TEMP_DIR:
+            path = Path(TELEGRAM_LOCAL_TEMP_DIR) / path.relative_to(Path(TEMP_DIR).resolve())
+        return path.as_uri()
+
+    async def _request(self, channel_id: int, make_request, breaker=None):
+        """
+        Запрос к Bot API в слот лимитера, через предохранитель сервера (по умолчанию — облачного)
+        Сетевые ошибки и 5xx — неудача сервера; ответ с ошибкой (400, 429) — сервер жив
+        """
+        from aiogram.exceptions import (
+            TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+        )
+
+        breaker = breaker or self.breaker
+        breaker.check()
+        try:
+            await self.limiter.wait(channel_id)
+            result = await make_request()
+        except (TelegramNetworkError, TelegramServerError):
+            breaker.record_failure()
+            raise
+        except TelegramRetryAfter as e:
+            breaker.record_success()
+            metrics.inc('telegram_429')
+            self.last_retry_after = (time.time(), e.retry_after)
+            raise
+        except TelegramAPIError:
+            breaker.record_success()
+            raise
+        finally:
+            breaker.end_probe()
+
+        breaker.record_success()
+        return result
+
+    async def send_media_groups(self, attachments: list, post_data: dict, channel_id: int = None) -> list:
         """
         Отправляет медиа в ТГ группами
         Если все одного типа — группирует до 10 в одном сообщении
         Если разные типы — разделяет по типам
         Возвращает список message_ids
         """
+        channel_id = channel_id or self.channel_id
         message_ids = []
 
         try:
@@ -34,7 +181,7 @@ class TelegramClient:
             if len(by_type) == 1:
                 file_type = list(by_type.keys())[0]
                 files = by_type[file_type]
-                msg_ids = await self._send_grouped_media(files, post_data)
+                msg_ids = await self._send_grouped_media(files, channel_id, post_data)
                 message_ids.extend(msg_ids)
             else:
                 # Разные типы — отправляем по порядку: видео, гифки, фото, документы
@@ -42,7 +189,9 @@ class TelegramClient:
                 for ftype in type_order:
                     if ftype in by_type:
                         files = by_type[ftype]
-                        msg_ids = await self._send_grouped_media(files, post_data if ftype == type_order[-1] else None)
+                        msg_ids = await self._send_grouped_media(
+                            files, channel_id, post_data if ftype == type_order[-1] else None
+                        )
                         message_ids.extend(msg_ids)
 
             logger.info(f"Sent {len(message_ids)} messages for post {post_data['id']}")
@@ -52,11 +201,13 @@ class TelegramClient:
             logger.error(f"Error sending media to Telegram: {e}")
             raise
 
-    async def _send_grouped_media(self, attachments: list, post_data: dict = None) -> list:
+    async def _send_grouped_media(self, attachments: list, channel_id: int, post_data: dict = None) -> list:
         """
         Отправляет одну группу медиа (до 10 файлов)
         Если post_data переданы — добавляет описание в последнее медиа
         """
+        from aiogram.types import FSInputFile, InputMediaPhoto, InputMediaVideo, InputMediaDocument
+
         message_ids = []
 
         # Разбиваем на группы по 10
@@ -65,6 +216,7 @@ class TelegramClient:
 
         for chunk_idx, chunk in enumerate(chunks):
             media_group = []
+            local = await self._use_local_server(chunk)
 
             for file_idx, att in enumerate(chunk):
                 # Последний файл в последней группе — с описанием поста
@@ -93,7 +245,7 @@ class TelegramClient:
 
                 # Создаём InputMedia в зависимости от типа
                 file_type = att['file_type']
-                local_path = att['local_path']
+                local_path = self._local_file(att['local_path']) if local else FSInputFile(att['local_path'])
 
                 if file_type == 'image':
                     media = InputMediaPhoto(media=local_path, caption=caption)
@@ -105,12 +257,15 @@ class TelegramClient:
                 media_group.append(media)
 
             try:
-                # Отправляем группу
-                messages = await self.bot.send_media_group(self.channel_id, media_group)
+                # Отправляем группу (лимитер вместо фиксированной паузы против flood-контроля)
+                bot = self.local_bot if local else self.bot
+                messages = await self._request(
+                    channel_id, lambda: bot.send_media_group(channel_id, media_group),
+                    self.local_breaker if local else self.breaker
+                )
                 message_ids.extend([msg.message_id for msg in messages])
 
-                logger.info(f"Sent media group with {len(media_group)} files")
-                await asyncio.sleep(0.5)  # Избегаем flood-контроля
+                logger.info(f"Sent media group with {len(media_group)} files{' via local server' if local else ''}")
 
             except Exception as e:
                 logger.error(f"Error sending media group: {e}")
@@ -118,36 +273,39 @@ class TelegramClient:
 
         return message_ids
 
-    async def send_text_message(self, text: str, disable_preview: bool = True) -> int:
+    async def send_text_message(self, text: str, disable_preview: bool = True, channel_id: int = None) -> int:
         """
         Отправляет текстовое сообщение в канал
         Возвращает message_id
         """
+        from aiogram.types import LinkPreviewOptions
+
+        channel_id = channel_id or self.channel_id
+
         try:
             # Разбиваем текст на части (макс 4096 символов в ТГ)
             max_length = 4096
             message_ids = []
 
             if len(text) <= max_length:
-                msg = await self.bot.send_message(
-                    self.channel_id,
+                msg = await self._request(channel_id, lambda: self.bot.send_message(
+                    channel_id,
                     text,
                     parse_mode="HTML",
                     link_preview_options=LinkPreviewOptions(is_disabled=disable_preview)
-                )
+                ))
                 return msg.message_id
             else:
                 # Разбиваем на несколько сообщений
                 parts = [text[i:i + max_length] for i in range(0, len(text), max_length)]
                 for part in parts:
-                    msg = await self.bot.send_message(
-                        self.channel_id,
+                    msg = await self._request(channel_id, lambda: self.bot.send_message(
+                        channel_id,
                         part,
                         parse_mode="HTML",
                         link_preview_options=LinkPreviewOptions(is_disabled=disable_preview)
-                    )
+                    ))
                     message_ids.append(msg.message_id)
-                    await asyncio.sleep(0.5)
 
                 return message_ids[0]
 
@@ -155,8 +313,24 @@ class TelegramClient:
             logger.error(f"Error sending text message: {e}")
             raise
 
+    async def copy_messages(self, from_chat_id: int, message_ids: list, channel_id: int) -> list:
+        """
+        Копирует уже отправленные сообщения в другой канал (без повторной загрузки файлов)
+        Возвращает список новых message_ids
+        """
+        new_ids = []
+        # copyMessages принимает до 100 сообщений за раз
+        for i in range(0, len(message_ids), 100):
+            copied = await self._request(
+                channel_id, lambda: self.bot.copy_messages(channel_id, from_chat_id, message_ids[i:i + 100])
+            )
+            new_ids.extend(msg.message_id for msg in copied)
+        return new_ids
+
     async def send_admin_message(self, text: str) -> bool:
         """Отправляет сообщение администратору"""
+        from aiogram.types import LinkPreviewOptions
+
         try:
             from config import TELEGRAM_ADMIN_ID
             await self.bot.send_message(
@@ -1,3 +1,7 @@
+import asyncio
+import html
+import itertools
+from collections import deque
 from modules.logger import logger
 
 
@@ -10,15 +14,271 @@ def format_file_size(bytes_val: int) -> str:
     return f"{bytes_val:.2f} TB"
 
 
-async def defer_attachment_in_queue(queue, attachment_data: dict, defer_count: int) -> bool:
-    """Отодвигает задачу в очереди на N позиций"""
+def message_link(chat_id: int, message_id: int) -> str:
+    """Ссылка на сообщение в канале (вида t.me/c/<id>/<message>, открывается у участников канала)"""
+    return f"https://t.me/c/{str(chat_id).removeprefix('-100')}/{message_id}"
+
+
+# Максимальная длина текстового сообщения в ТГ
+TELEGRAM_TEXT_LIMIT = 4096
+
+
+def split_text(text: str, limit: int = TELEGRAM_TEXT_LIMIT, separators=("\n\n", "\n", " ")) -> list:
+    """
+    Режет исходный (неэкранированный) текст на куски, которые после html.escape не длиннее limit:
+    по абзацам, если абзац не влезает — по строкам, затем по словам, в крайнем случае посимвольно
+    Режется исходный текст, поэтому сущности вроде &amp; не разрываются
+    """
+    if len(html.escape(text)) <= limit:
+        return [text]
+
+    if not separators:
+        chunks, current, length = [], "", 0
+        for char in text:
+            char_length = len(html.escape(char))
+            if length + char_length > limit:
+                chunks.append(current)
+                current, length = "", 0
+            current += char
+            length += char_length
+        return chunks + [current] if current else chunks
+
+    separator, rest = separators[0], separators[1:]
+    chunks, current, length = [], None, 0
+    for part in text.split(separator):
+        for piece in split_text(part, limit, rest):
+            piece_length = len(html.escape(piece))
+            if current is not None and length + len(separator) + piece_length <= limit:
+                current += separator + piece
+                length += len(separator) + piece_length
+            else:
+                if current is not None:
+                    chunks.append(current)
+                current, length = piece, piece_length
+    if current is not None:
+        chunks.append(current)
+    return chunks
+
+
+def pack_blocks(blocks: list, limit: int = TELEGRAM_TEXT_LIMIT, separator: str = "\n\n") -> list:
+    """Собирает готовые HTML-блоки (каждый не длиннее limit) в сообщения не длиннее limit"""
+    messages = []
+    for block in blocks:
+        if messages and len(messages[-1]) + len(separator) + len(block) <= limit:
+            messages[-1] += separator + block
+        else:
+            messages.append(block)
+    return messages
+
+
+def format_text_post(post_data: dict, with_title: bool = False) -> list:
+    """
+    Текстовый пост для parse_mode=HTML: экранированный текст и ссылка на исходный пост,
+    разбитый на сообщения по границам абзацев
+    """
+    blocks = []
+    if with_title and post_data.get('title'):
+        blocks.append(f"<b>{html.escape(post_data['title'])}</b>")
+    blocks += [html.escape(chunk) for chunk in split_text(post_data.get('selftext', '').strip())]
+    blocks.append(f'🔗 <a href="{html.escape(post_data["full_url"])}">Исходный пост</a>')
+    return pack_blocks(blocks)
+
+
+async def defer_attachment_in_queue(queue, task, defer_count: int) -> bool:
+    """Отодвигает задачу в очереди её аккаунта на N позиций"""
     try:
-        # Добавляем в конец очереди N раз
-        for _ in range(defer_count):
-            await queue.put(attachment_data)
+        queue.defer(task, defer_count)
 
-        logger.debug(f"Deferred attachment to queue ({defer_count} times)")
+        logger.debug(f"Deferred attachment by {defer_count} positions")
         return True
     except Exception as e:
         logger.error(f"Error deferring attachment: {e}")
         return False
+
+
+class _Lane:
+    """Полоса FairQueue: очереди задач по ключам (аккаунтам) и счётчики для взвешенного выбора"""
+
+    def __init__(self, weight: int, limit: int = None):
+        self.weight = weight
+        self.limit = limit
+        self.queues = {}
+        self.order = deque()
+        self.active = 0
+        self.current = 0
+
+    def has_capacity(self) -> bool:
+        return self.limit is None or self.active < self.limit
+
+    def append(self, key, task, position: int = None):
+        if key not in self.queues:
+            self.queues[key] = deque()
+            self.order.append(key)
+        queue = self.queues[key]
+        if position is None:
+            queue.append(task)
+        else:
+            queue.insert(min(position, len(queue)), task)
+
+    def pop(self, allowed, scan: int):
+        """Первая задача, для которой allowed(task), по кругу между ключами (в каждом — не дальше scan задач)"""
+        for _ in range(len(self.order)):
+            key = self.order[0]
+            queue = self.queues[key]
+            self.order.rotate(-1)
+            for index, task in enumerate(itertools.islice(queue, scan)):
+                if allowed(task):
+                    del queue[index]
+                    if not queue:
+                        del self.queues[key]
+                        self.order.remove(key)
+                    return task
+        return None
+
+    def size(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+
+class FairQueue:
+    """
+    Очередь с интерфейсом asyncio.Queue (put/get/task_done/join) для воркеров пайплайна
+    - Полосы по стоимости задачи (lane): выдаются взвешенно по кругу (weights), и пока в других
+      полосах есть задачи, одновременно выполняется не больше limits[lane] задач полосы —
+      большие видео не занимают все воркеры, и текст с картинками не ждёт за ними
+    - Внутри полосы задачи выдаются по кругу между ключами (аккаунтами), чтобы большой проход
+      одного аккаунта не задерживал остальные
+    - Одной группы (поста) одновременно выполняется не больше group_limit задач — галерея
+      на 50 вложений не занимает все воркеры
+    Место полосы и группы освобождает task_done(task)
+    """
+
+    # Сколько задач ключа просматривается в поисках поста, не упёршегося в group_limit
+    SCAN_LIMIT = 64
+
+    def __init__(self, key=lambda task: task.account, lane=lambda task: None, weights: dict = None,
+                 limits: dict = None, group=lambda task: None, group_limit: int = None):
+        self._key = key
+        self._lane = lane
+        self._weights = weights or {}
+        self._limits = limits or {}
+        self._group = group
+        self._group_limit = group_limit
+        self._lanes = {}
+        self._groups = {}
+        self._changed = asyncio.Event()
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def _get_lane(self, name) -> _Lane:
+        if name not in self._lanes:
+            self._lanes[name] = _Lane(self._weights.get(name, 1), self._limits.get(name))
+        return self._lanes[name]
+
+    async def put(self, task):
+        self.put_nowait(task)
+
+    def put_nowait(self, task, position: int = None):
+        self._get_lane(self._lane(task)).append(self._key(task), task, position)
+        self._unfinished += 1
+        self._finished.clear()
+        self._changed.set()
+
+    def defer(self, task, positions: int):
+        """Возвращает задачу в очередь её ключа на positions позиций от начала (или в конец)"""
+        self.put_nowait(task, position=positions)
+
+    async def get(self):
+        while True:
+            task = self._pop()
+            if task is not None:
+                return task
+            # Пусто или все полосы с задачами заняты — ждём put или task_done
+            self._changed.clear()
+            await self._changed.wait()
+
+    def get_nowait(self):
+        task = self._pop()
+        if task is None:
+            raise asyncio.QueueEmpty
+        return task
+
+    def _allowed(self, task) -> bool:
+        group = self._group(task)
+        return group is None or self._group_limit is None or self._groups.get(group, 0) < self._group_limit
+
+    def _pop(self):
+        # Плавный взвешенный round-robin (как в nginx) по полосам, где есть задачи и свободное место;
+        # если другим полосам выдавать нечего, полоса занимает свободных воркеров и сверх лимита
+        waiting = [lane for lane in self._lanes.values() if lane.order]
+        eligible = [lane for lane in waiting if lane.has_capacity() or len(waiting) == 1]
+        if not eligible:
+            return None
+        total = sum(lane.weight for lane in eligible)
+        for lane in eligible:
+            lane.current += lane.weight
+
+        for lane in sorted(eligible, key=lambda item: item.current, reverse=True):
+            task = lane.pop(self._allowed, self.SCAN_LIMIT)
+            if task is None:
+                continue
+            lane.current -= total
+            lane.active += 1
+            group = self._group(task)
+            if group is not None:
+                self._groups[group] = self._groups.get(group, 0) + 1
+            return task
+
+        # Все полосы упёрлись в лимит постов — выбор не засчитывается
+        for lane in eligible:
+            lane.current -= lane.weight
+        return None
+
+    def task_done(self, task=None):
+        """task — выполненная задача (освобождает место полосы и группы); без неё — только счётчик join()"""
+        if task is not None:
+            lane = self._lanes.get(self._lane(task))
+            if lane is not None:
+                lane.active = max(0, lane.active - 1)
+            group = self._group(task)
+            if group is not None and group in self._groups:
+                self._groups[group] -= 1
+                if self._groups[group] <= 0:
+                    del self._groups[group]
+            self._changed.set()
+
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    def take_all(self) -> list:
+        """Забирает все ждущие задачи без учёта лимитов (сохранение очереди при остановке)"""
+        tasks = []
+        for lane in self._lanes.values():
+            for key in lane.order:
+                tasks.extend(lane.queues[key])
+            lane.queues.clear()
+            lane.order.clear()
+        for _ in tasks:
+            self.task_done()
+        return tasks
+
+    async def join(self):
+        await self._finished.wait()
+
+    def qsize(self) -> int:
+        return sum(lane.size() for lane in self._lanes.values())
+
+    def __iter__(self):
+        """Ждущие задачи (для подсчёта в /status)"""
+        for lane in self._lanes.values():
+            for queue in lane.queues.values():
+                yield from queue
+
+    def empty(self) -> bool:
+        return not any(lane.order for lane in self._lanes.values())
+
+    def snapshot(self) -> dict:
+        """{полоса: (ждёт, выполняется)}"""
+        return {name: (lane.size(), lane.active) for name, lane in self._lanes.items()}
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD, LOOP_DEBUG, LOOP_SLOW_CALLBACK
+from modules.logger import logger, LOGGER_NAME
+from modules.metrics import metrics
+
+
+class LoopMonitor:
+    """
+    Задержка event loop: корутина засыпает на interval и замеряет, насколько позже проснулась
+    (метрики loop_lag_ms, loop_lag_max_ms и счётчик loop_stalls)
+    Отдельный поток следит за её пульсом: если loop не отвечает дольше threshold,
+    поток пишет в лог стек главного потока — место, где loop заблокирован синхронным вызовом
+    LOOP_DEBUG включает отладочный режим asyncio: он пишет в лог каждый колбэк
+    дольше LOOP_SLOW_CALLBACK
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._beat = None
+        self._loop_thread = None
+        self._stopped = threading.Event()
+
+    async def run(self):
+        """Фоновая задача; поток-сторож живёт, пока она не отменена"""
+        loop = asyncio.get_running_loop()
+        if LOOP_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = LOOP_SLOW_CALLBACK
+            # Предупреждения отладочного режима — в тот же лог, что и остальное
+            for handler in logging.getLogger(LOGGER_NAME).handlers:
+                logging.getLogger("asyncio").addHandler(handler)
+
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        threading.Thread(target=self._watch, name="loop_watchdog", daemon=True).start()
+        try:
+            while True:
+                self._beat = time.monotonic()
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                self.record(max(0.0, loop.time() - expected))
+        finally:
+            self._stopped.set()
+
+    def record(self, lag: float):
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        metrics.set('loop_lag_ms', lag * 1000)
+        metrics.set('loop_lag_max_ms', self.max_lag * 1000)
+        if lag > self.threshold:
+            self.stalls += 1
+            metrics.inc('loop_stalls')
+            logger.warning(f"Event loop was blocked for {lag:.2f}s")
+
+    def _watch(self):
+        """Поток-сторож: стек главного потока, пока loop не отвечает"""
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            if beat is None or beat == reported:
+                continue
+            if time.monotonic() - beat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                stack = "".join(traceback.format_stack(frame))
+                logger.warning(f"Event loop blocked for over {self.threshold:.1f}s at:\n{stack}")
+                reported = beat
+
+
+loop_monitor = LoopMonitor()